@@ -1,7 +1,7 @@
 # RetainAI — app.py (Prod, consolidated)
 # ======================================
 # Key properties:
-# - Per-user leads persisted in data/leads.json (atomic writes).
+# - Per-user leads persisted via app_storage (data/leads.json by default, or SQLite).
 # - Stable lead IDs, CRUD + notes.
 # - Stripe-gated auth (login allowed only after webhook activates account).
 # - WhatsApp API + webhook (24h window + opt-out) — in Part 3.
@@ -12,13 +12,13 @@
 
 from __future__ import annotations
 
-import os, re, json, hmac, hashlib, datetime
+import os, hmac, hashlib, datetime
 from datetime import datetime as dt, timedelta
 from typing import Any, Dict, List, Optional
 from urllib.parse import urlencode, quote, quote_plus
 
 import requests as pyrequests
-from flask import Flask, request, jsonify, send_from_directory, redirect, Blueprint
+from flask import Flask, request, jsonify, send_from_directory, redirect, Blueprint, make_response
 from flask_cors import CORS
 from dotenv import load_dotenv
 
@@ -55,24 +55,35 @@ CORS(
         "origins": [FRONTEND_URL, "http://localhost:3000", "http://127.0.0.1:3000",
                     "https://app.retainai.ca", "https://retainai.ca"]
     }},
-    supports_credentials=True
+    supports_credentials=True,
+    expose_headers=["ETag"],
 )
 app.logger.info("[BOOT] RetainAI backend starting")
 
 # ----------------------------
-# Storage (single DATA_DIR)
+# Storage (single DATA_DIR; backend picked by STORAGE_BACKEND, see app_storage.py)
 # ----------------------------
-BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-DATA_DIR = os.getenv("DATA_DIR", os.path.join(BASE_DIR, "data"))
-os.makedirs(DATA_DIR, exist_ok=True)
-
-LEADS_FILE         = os.path.join(DATA_DIR, "leads.json")
-USERS_FILE         = os.path.join(DATA_DIR, "users.json")
-NOTIFICATIONS_FILE = os.path.join(DATA_DIR, "notifications.json")
-APPOINTMENTS_FILE  = os.path.join(DATA_DIR, "appointments.json")
-CHAT_FILE          = os.path.join(DATA_DIR, "whatsapp_chats.json")
-STATUS_FILE        = os.path.join(DATA_DIR, "whatsapp_status.json")
-NOTES_FILE         = os.path.join(DATA_DIR, "notes.json")
+from app_storage import (DATA_DIR, load_entity, save_entity,
+                         get_bucket, view_bucket, put_bucket, update_bucket, bucket_lock, bucket_etag, conditional_response, item_index, index_stats, thaw,
+                         upsert_item, remove_item,
+                         entity_path, get_backend, cache_stats, write_stats,
+                         begin_write_batch, commit_write_batch)
+from app_notifications import (notify, page_notifications, unread_count, mark_read, mark_all_read,
+                               compact_all as compact_notifications)
+from app_chats import append_message, read_thread, thread_etag, last_inbound, delete_thread
+from app_events import publish_later
+from app_wa_numbers import norm_wa, lookup as wa_lookup, route as wa_route
+from app_search import search as search_lead_index
+from app_lead_list import page_leads
+from app_notes import page_notes, lead_note_ids
+
+LEADS_FILE         = entity_path("leads")
+USERS_FILE         = entity_path("users")
+NOTIFICATIONS_FILE = entity_path("notifications")
+APPOINTMENTS_FILE  = entity_path("appointments")
+CHAT_FILE          = entity_path("chats")
+STATUS_FILE        = entity_path("statuses")
+NOTES_FILE         = entity_path("notes")
 ICS_DIR            = os.path.join(DATA_DIR, "ics_files")
 os.makedirs(ICS_DIR, exist_ok=True)
 
@@ -84,7 +95,6 @@ WHATSAPP_WABA_ID          = os.getenv("WHATSAPP_WABA_ID") or os.getenv("WHATSAPP
 WHATSAPP_TEMPLATE_DEFAULT = os.getenv("WHATSAPP_TEMPLATE_DEFAULT", "")
 WHATSAPP_TEMPLATE_LANG    = os.getenv("WHATSAPP_TEMPLATE_LANG", "en_US")
 WHATSAPP_API_VERSION      = os.getenv("WHATSAPP_API_VERSION", "v20.0")
-DEFAULT_COUNTRY_CODE      = (os.getenv("DEFAULT_COUNTRY_CODE") or "1").strip()
 META_APP_SECRET           = os.getenv("APP_SECRET") or os.getenv("META_APP_SECRET")
 
 # Emails (SendGrid used in Part 2)
@@ -107,38 +117,57 @@ GOOGLE_REDIRECT_URI  = os.getenv("GOOGLE_REDIRECT_URI")
 ADMIN_KEY = os.getenv("ADMIN_KEY", "")
 
 # ----------------------------
-# JSON helpers (atomic I/O)
+# Storage wrappers (entity -> bucket dict)
 # ----------------------------
-def load_json(path: str, default: Any = None):
-    if not os.path.exists(path):
-        return default if default is not None else {}
+def load_leads():          return load_entity("leads")
+def save_leads(d):         save_entity("leads", d)
+def load_users():          return load_entity("users")
+def save_users(d):         save_entity("users", d)
+def load_notifications():  return load_entity("notifications")
+def save_notifications(d): save_entity("notifications", d)
+def load_appointments():   return load_entity("appointments")
+def save_appointments(d):  save_entity("appointments", d)
+def load_chats():          return load_entity("chats")
+def save_chats(d):         save_entity("chats", d)
+def load_statuses():       return load_entity("statuses")
+def save_statuses(d):      save_entity("statuses", d)
+def load_notes():          return load_entity("notes")
+def save_notes(d):         save_entity("notes", d)
+
+# Per-user buckets: a request touches only its tenant's shard/row
+def load_user_leads(u):            return get_bucket("leads", _email_key(u), []) or []
+def lead_index(u):                 return item_index("leads", _email_key(u))  # id -> lead (read-only)
+def save_user_leads(u, arr):       put_bucket("leads", _email_key(u), arr)
+def load_user_notes(u):            return get_bucket("notes", _email_key(u), []) or []
+def save_user_notes(u, arr):       put_bucket("notes", _email_key(u), arr)
+def load_user_notifications(u):    return get_bucket("notifications", _email_key(u), []) or []
+def save_user_notifications(u, a): put_bucket("notifications", _email_key(u), a)
+def load_user_appointments(u):     return get_bucket("appointments", _email_key(u), []) or []
+def save_user_appointments(u, a):  put_bucket("appointments", _email_key(u), a)
+def save_user(u, rec):             put_bucket("users", _email_key(u), rec)
+def update_user(u, fn):            return update_bucket("users", _email_key(u), fn, {})
+
+# Group commit: every file a request touches is written once, after the
+# handler returns, and the response only goes out once that write is durable.
+@app.before_request
+def _open_write_batch():
+    begin_write_batch()
+
+@app.after_request
+def _commit_write_batch(resp):
     try:
-        with open(path, "r", encoding="utf-8") as f:
-            return json.load(f)
-    except Exception:
-        return default if default is not None else {}
-
-def save_json(path: str, data: Any):
-    tmp = path + ".tmp"
-    with open(tmp, "w", encoding="utf-8") as f:
-        json.dump(data, f, indent=2, ensure_ascii=False)
-    os.replace(tmp, path)
-
-# Thin wrappers
-def load_leads():          return load_json(LEADS_FILE, {})
-def save_leads(d):         save_json(LEADS_FILE, d)
-def load_users():          return load_json(USERS_FILE, {})
-def save_users(d):         save_json(USERS_FILE, d)
-def load_notifications():  return load_json(NOTIFICATIONS_FILE, {})
-def save_notifications(d): save_json(NOTIFICATIONS_FILE, d)
-def load_appointments():   return load_json(APPOINTMENTS_FILE, {})
-def save_appointments(d):  save_json(APPOINTMENTS_FILE, d)
-def load_chats():          return load_json(CHAT_FILE, {})
-def save_chats(d):         save_json(CHAT_FILE, d)
-def load_statuses():       return load_json(STATUS_FILE, {})
-def save_statuses(d):      save_json(STATUS_FILE, d)
-def load_notes():          return load_json(NOTES_FILE, {})
-def save_notes(d):         save_json(NOTES_FILE, d)
+        commit_write_batch(force=True)
+    except Exception as e:
+        app.logger.error("[STORAGE] write flush failed: %s", e)
+        return make_response(jsonify({"error": "Storage write failed"}), 500)
+    return resp
+
+@app.teardown_request
+def _close_write_batch(exc=None):
+    try:
+        commit_write_batch(force=True)  # no-op unless after_request was skipped
+    except Exception as e:
+        app.logger.error("[STORAGE] write flush failed: %s", e)
 
 # ----------------------------
 # Utils
@@ -169,6 +198,23 @@ def healthz():
 def root():
     return jsonify({"ok": True, "service": "RetainAI API", "time": _now_iso()})
 
+def _is_admin() -> bool:
+    return bool(ADMIN_KEY) and hmac.compare_digest(request.headers.get("X-Admin-Key", ""), ADMIN_KEY)
+
+@app.get("/api/admin/storage/stats")
+def storage_stats():
+    if not _is_admin():
+        return jsonify({"error": "forbidden"}), 403
+    return jsonify({"backend": get_backend().name, "json_cache": cache_stats(), "json_writes": write_stats(),
+                    "item_index": index_stats()}), 200
+
+@app.post("/api/admin/notifications/compact")
+def notifications_compact():
+    if not _is_admin():
+        return jsonify({"error": "forbidden"}), 403
+    moved = compact_notifications()
+    return jsonify({"archived": moved, "total": sum(moved.values())}), 200
+
 # =============================================================================
 # Leads CRUD (bulletproof, per-user)
 # =============================================================================
@@ -187,16 +233,26 @@ def root():
 #   "wa_opt_out": false
 # }
 
+LEAD_PAGE_PARAMS = ("sort", "cursor", "limit", "tag", "source", "fields")
+
 @app.get("/api/leads/<path:user_email>")
 def list_leads(user_email):
+    """
+    Without query params: the whole bucket, as before. With any of
+    sort/cursor/limit/tag/source/fields: one page (see app_lead_list).
+    """
     user_email = _email_key(user_email)
-    leads = load_leads()
-    return jsonify({"leads": leads.get(user_email, [])}), 200
+    args = {k: request.args.get(k) for k in LEAD_PAGE_PARAMS if k in request.args}
+    tag = bucket_etag("leads", user_email, *sorted(args.items()))
+    if not args:
+        return conditional_response(tag, lambda: {"leads": view_bucket("leads", user_email, [])})
+    try:
+        return conditional_response(tag, lambda: page_leads(user_email, **args))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
 
-@app.post("/api/leads/<path:user_email>")
-def create_lead(user_email):
-    user_email = _email_key(user_email)
-    payload = request.get_json(force=True, silent=True) or {}
+def _new_lead(payload: Dict[str, Any]):
+    """(lead, None) for a create payload, or (None, error message)."""
     name  = (payload.get("name") or "").strip()
     email = _email_key(payload.get("email") or "")
     phone = (payload.get("phone") or "").strip()
@@ -204,18 +260,8 @@ def create_lead(user_email):
     tags  = payload.get("tags") or []
 
     if not (name or email or phone or wapp):
-        return jsonify({"error": "Provide at least one of: name, email, phone/whatsapp"}), 400
-
-    leads = load_leads()
-    _ensure_user_bucket(leads, user_email)
-
-    # prevent exact duplicate by email for same user
-    if email:
-        for ld in leads[user_email]:
-            if _email_key(ld.get("email")) == email:
-                return jsonify({"error": "Lead with this email already exists", "lead": ld}), 409
-
-    lead = {
+        return None, "Provide at least one of: name, email, phone/whatsapp"
+    return {
         "id": _gen_id(8),
         "name": name,
         "email": email,
@@ -226,79 +272,180 @@ def create_lead(user_email):
         "updatedAt": _now_iso(),
         "last_contacted": None,
         "wa_opt_out": False,
-    }
-    leads[user_email].append(lead)
-    save_leads(leads)
+    }, None
+
+def _edited_lead(found: Dict[str, Any], payload: Dict[str, Any]) -> Dict[str, Any]:
+    updated = thaw(found)
+    # safe fields to update
+    for key in ("name","email","phone","whatsapp","tags","last_contacted"):
+        if key in payload:
+            if key == "email":
+                updated[key] = _email_key(payload[key] or "")
+            else:
+                updated[key] = payload[key]
+    updated["updatedAt"] = _now_iso()
+    return updated
+
+def _purge_lead_data(user_email: str, lead_ids: set):
+    """Remove the notes and chat threads of deleted leads."""
+    if not lead_ids:
+        return
+    with bucket_lock("notes", user_email):
+        for lead_id in lead_ids:
+            for note_id in lead_note_ids(user_email, lead_id):
+                remove_item("notes", user_email, note_id)
+    for lead_id in lead_ids:
+        delete_thread(user_email, lead_id)
+
+@app.post("/api/leads/<path:user_email>")
+def create_lead(user_email):
+    user_email = _email_key(user_email)
+    payload = request.get_json(force=True, silent=True) or {}
+    lead, error = _new_lead(payload)
+    if error:
+        return jsonify({"error": error}), 400
+
+    with bucket_lock("leads", user_email):
+        arr = load_user_leads(user_email)
+
+        # prevent exact duplicate by email for same user
+        if lead["email"]:
+            for ld in arr:
+                if _email_key(ld.get("email")) == lead["email"]:
+                    return jsonify({"error": "Lead with this email already exists", "lead": ld}), 409
+
+        upsert_item("leads", user_email, lead)
     return jsonify({"lead": lead}), 201
 
 @app.put("/api/leads/<path:user_email>/<lead_id>")
 def update_lead(user_email, lead_id):
     user_email = _email_key(user_email)
     payload = request.get_json(force=True, silent=True) or {}
-    leads = load_leads()
-    arr = leads.get(user_email, [])
-    updated = None
-    for i, ld in enumerate(arr):
-        if str(ld.get("id")) == str(lead_id):
-            # safe fields to update
-            for key in ("name","email","phone","whatsapp","tags","last_contacted"):
-                if key in payload:
-                    if key == "email":
-                        ld[key] = _email_key(payload[key] or "")
-                    else:
-                        ld[key] = payload[key]
-            ld["updatedAt"] = _now_iso()
-            arr[i] = updated = ld
-            break
-    leads[user_email] = arr
-    save_leads(leads)
-    if not updated:
-        return jsonify({"error": "Lead not found"}), 404
+    with bucket_lock("leads", user_email):
+        found = lead_index(user_email).get(lead_id)
+        if found is None:
+            return jsonify({"error": "Lead not found"}), 404
+        updated = _edited_lead(found, payload)
+        upsert_item("leads", user_email, updated)
     return jsonify({"lead": updated}), 200
 
 @app.delete("/api/leads/<path:user_email>/<lead_id>")
 def delete_lead(user_email, lead_id):
     user_email = _email_key(user_email)
-    leads = load_leads()
-    arr = leads.get(user_email, [])
-    before = len(arr)
-    arr = [ld for ld in arr if str(ld.get("id")) != str(lead_id)]
-    leads[user_email] = arr
-    save_leads(leads)
+    with bucket_lock("leads", user_email):
+        deleted = 1 if lead_id in lead_index(user_email) else 0
+        if deleted:
+            remove_item("leads", user_email, lead_id)
 
     # also remove notes & chats for this lead
-    notes = load_notes()
-    if user_email in notes:
-        notes[user_email] = [n for n in notes[user_email] if str(n.get("lead_id")) != str(lead_id)]
-        save_notes(notes)
-    chats = load_chats()
-    if user_email in chats:
-        chats[user_email].pop(str(lead_id), None)
-        save_chats(chats)
-
-    return jsonify({"deleted": before - len(arr)}), 200
+    _purge_lead_data(user_email, {str(lead_id)})
+
+    return jsonify({"deleted": deleted}), 200
+
+# Batch:
+# POST /api/leads/<user_email>/batch
+#   {"ops": [{"op": "create", "lead": {...}},
+#            {"op": "update", "id": "...", "lead": {...}},
+#            {"op": "delete", "id": "..."}], "atomic": false}
+# Ops run in order against one in-memory copy of the bucket, under one lock,
+# and the result is written with a single put_bucket. Every op gets a
+# result ({"index", "op", "ok", "status", "lead" | "error"}); with
+# "atomic": true one failure writes nothing (400, "applied": false).
+LEAD_BATCH_MAX = int(os.getenv("LEAD_BATCH_MAX", "1000"))
+
+def _batch_op(items: Dict[str, Any], emails: Dict[str, str], op: Dict[str, Any]):
+    """Apply one op to `items` (id -> lead, bucket order); returns (status, lead or error)."""
+    kind, lead_id = op.get("op"), str(op.get("id") or "")
+    payload = op.get("lead") if isinstance(op.get("lead"), dict) else {}
+    if kind == "create":
+        lead, error = _new_lead(payload)
+        if error:
+            return 400, error
+        if lead["email"] and lead["email"] in emails:
+            return 409, "Lead with this email already exists"
+        while lead["id"] in items:
+            lead["id"] = _gen_id(8)
+        items[lead["id"]] = lead
+    elif kind in ("update", "delete"):
+        if lead_id not in items:
+            return 404, "Lead not found"
+        lead = items[lead_id]
+        if kind == "delete":
+            del items[lead_id]
+            if emails.get(_email_key(lead.get("email"))) == lead_id:
+                del emails[_email_key(lead.get("email"))]
+            return 200, lead
+        old_email = _email_key(lead.get("email"))
+        lead = items[lead_id] = _edited_lead(lead, payload)
+        if lead["email"] != old_email and emails.get(old_email) == lead_id:
+            del emails[old_email]
+    else:
+        return 400, "op must be create, update or delete"
+    if lead.get("email"):
+        emails.setdefault(lead["email"], lead["id"])
+    return (201 if kind == "create" else 200), lead
+
+@app.post("/api/leads/<path:user_email>/batch")
+def batch_leads(user_email):
+    user_email = _email_key(user_email)
+    body = request.get_json(force=True, silent=True) or {}
+    ops, atomic = body.get("ops"), bool(body.get("atomic"))
+    if not isinstance(ops, list) or not ops:
+        return jsonify({"error": "ops must be a non-empty list"}), 400
+    if len(ops) > LEAD_BATCH_MAX:
+        return jsonify({"error": f"at most {LEAD_BATCH_MAX} ops per batch"}), 400
+
+    results, deleted = [], set()
+    with bucket_lock("leads", user_email):
+        index = lead_index(user_email)
+        items = dict(index.items)
+        emails: Dict[str, str] = {}
+        for ld in items.values():
+            if ld.get("email"):
+                emails.setdefault(_email_key(ld.get("email")), str(ld.get("id")))
+        for i, op in enumerate(ops):
+            status, out = _batch_op(items, emails, op if isinstance(op, dict) else {})
+            res = {"index": i, "op": op.get("op") if isinstance(op, dict) else None,
+                   "ok": status < 400, "status": status}
+            if status >= 400:
+                res["error"] = out
+            elif res["op"] == "delete":
+                res["id"] = str(out.get("id"))
+                deleted.add(res["id"])
+            else:
+                res["lead"] = out
+            results.append(res)
+        failed = sum(1 for r in results if not r["ok"])
+        applied = not (atomic and failed)
+        if applied and failed < len(results):
+            put_bucket("leads", user_email, [thaw(ld) for ld in items.values()])
+    if applied:
+        _purge_lead_data(user_email, {lid for lid in deleted if lid not in items})
+    return jsonify({"applied": applied, "ok": len(results) - failed, "failed": failed,
+                    "results": results}), (200 if applied else 400)
 
 @app.get("/api/leads/search")
 def search_leads():
     user_email = _email_key(request.args.get("user_email") or "")
-    q = (request.args.get("q") or "").strip().lower()
+    q = (request.args.get("q") or "").strip()
     if not user_email:
         return jsonify({"error": "user_email required"}), 400
-    leads = load_leads().get(user_email, [])
+    if "limit" not in request.args and "offset" not in request.args:
+        # unpaged, as before: every match (or the whole bucket without q)
+        if not q:
+            return jsonify({"leads": view_bucket("leads", user_email, [])}), 200
+        return jsonify({"leads": search_lead_index(user_email, q, limit=None)["leads"]}), 200
+    try:
+        limit = max(1, min(int(request.args.get("limit", 50)), 500))
+        offset = max(0, int(request.args.get("offset", 0)))
+    except ValueError:
+        return jsonify({"error": "limit/offset must be integers"}), 400
     if not q:
-        return jsonify({"leads": leads}), 200
-    out = []
-    for ld in leads:
-        blob = " ".join([
-            (ld.get("name") or ""),
-            (ld.get("email") or ""),
-            (ld.get("phone") or ""),
-            (ld.get("whatsapp") or ""),
-            " ".join(ld.get("tags") or [])
-        ]).lower()
-        if q in blob:
-            out.append(ld)
-    return jsonify({"leads": out}), 200
+        leads = view_bucket("leads", user_email, [])
+        return jsonify({"leads": leads[offset:offset + limit], "total": len(leads),
+                        "next_offset": offset + limit if offset + limit < len(leads) else None}), 200
+    # ranked, prefix- and typo-tolerant; index kept current by lead/note writes (app_search)
+    return jsonify(search_lead_index(user_email, q, limit=limit, offset=offset)), 200
 
 # =============================================================================
 # Lead Notes (per-user, per-lead) — keeps UI “add note” from breaking
@@ -306,15 +453,23 @@ def search_leads():
 
 # Note shape:
 # { "id": "...", "lead_id": "...", "user_email": "...", "text": "...", "createdAt": "...Z" }
+#
+# GET lists one lead's notes from a per-lead index (app_notes): all of them in
+# createdAt order, or one page with limit/cursor/order (order=-createdAt for
+# newest first; follow next_cursor for older ones).
+NOTE_PAGE_PARAMS = ("order", "cursor", "limit")
 
 @app.get("/api/notes/<lead_id>")
 def list_notes(lead_id):
     user_email = _email_key(request.args.get("user_email") or "")
     if not user_email:
         return jsonify({"error": "user_email required"}), 400
-    notes = load_notes().get(user_email, [])
-    notes = [n for n in notes if str(n.get("lead_id")) == str(lead_id)]
-    return jsonify({"notes": notes}), 200
+    args = {k: request.args.get(k) for k in NOTE_PAGE_PARAMS if k in request.args}
+    try:
+        return conditional_response(bucket_etag("notes", user_email, lead_id, *sorted(args.items())),
+                            lambda: page_notes(user_email, lead_id, **args))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
 
 @app.post("/api/notes/<lead_id>")
 def add_note(lead_id):
@@ -327,13 +482,9 @@ def add_note(lead_id):
         return jsonify({"error": "text required"}), 400
 
     # verify lead exists
-    leads = load_leads().get(user_email, [])
-    if not any(str(ld.get("id")) == str(lead_id) for ld in leads):
+    if lead_id not in lead_index(user_email):
         return jsonify({"error": "Lead not found"}), 404
 
-    notes = load_notes()
-    if user_email not in notes:
-        notes[user_email] = []
     note = {
         "id": _gen_id(8),
         "lead_id": str(lead_id),
@@ -341,30 +492,62 @@ def add_note(lead_id):
         "text": text,
         "createdAt": _now_iso(),
     }
-    notes[user_email].append(note)
-    save_notes(notes)
+    upsert_item("notes", user_email, note)
     return jsonify({"note": note}), 201
 
+@app.delete("/api/notes/<lead_id>/<note_id>")
+def delete_note(lead_id, note_id):
+    user_email = _email_key(request.args.get("user_email") or "")
+    if not user_email:
+        return jsonify({"error": "user_email required"}), 400
+    with bucket_lock("notes", user_email):
+        note = item_index("notes", user_email).get(note_id)
+        deleted = 1 if note is not None and str(note.get("lead_id")) == str(lead_id) else 0
+        if deleted:
+            remove_item("notes", user_email, note_id)
+    return jsonify({"deleted": deleted}), 200
+
 # =============================================================================
 # Notifications (lightweight; UI badge support)
 # =============================================================================
 
+# GET lists the hot list newest first with each entry's read flag and the
+# unread counter: all of it, or one page with limit/cursor (follow
+# next_cursor for older entries). Read state is a watermark plus per-id marks
+# kept beside the list (app_notifications), so neither route rewrites it.
+NOTIF_PAGE_PARAMS = ("cursor", "limit")
+
+def _notifications_etag(user_email: str, *variant) -> str:
+    return bucket_etag("notifications", user_email, bucket_etag("notification_state", user_email), *variant)
+
 @app.get("/api/notifications/<path:user_email>")
 def get_notifications(user_email):
     user_email = _email_key(user_email)
-    notes = load_notifications().get(user_email, [])
-    return jsonify({"notifications": notes}), 200
+    args = {k: request.args.get(k) for k in NOTIF_PAGE_PARAMS if k in request.args}
+    try:
+        return conditional_response(_notifications_etag(user_email, *sorted(args.items())),
+                            lambda: page_notifications(user_email, **args))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+@app.get("/api/notifications/<path:user_email>/unread")
+def get_unread_notifications(user_email):
+    user_email = _email_key(user_email)
+    return conditional_response(_notifications_etag(user_email, "unread"),
+                        lambda: {"unread": unread_count(user_email)})
+
+@app.post("/api/notifications/<path:user_email>/read")
+def mark_notification_read(user_email):
+    body = request.get_json(force=True, silent=True) or {}
+    ids = body.get("ids") if isinstance(body.get("ids"), list) else [body.get("id")]
+    if not any(ids):
+        return jsonify({"error": "id or ids required"}), 400
+    return jsonify(dict(mark_read(_email_key(user_email), ids), ok=True)), 200
 
 @app.post("/api/notifications/<path:user_email>/readall")
 def mark_notifications_read(user_email):
-    user_email = _email_key(user_email)
-    alln = load_notifications()
-    arr = alln.get(user_email, [])
-    for n in arr:
-        n["read"] = True
-    alln[user_email] = arr
-    save_notifications(alln)
-    return jsonify({"ok": True}), 200
+    mark_all_read(_email_key(user_email))
+    return jsonify({"ok": True, "unread": 0}), 200
 # =============================================================================
 # SendGrid helpers (safe if key missing)
 # =============================================================================
@@ -420,16 +603,8 @@ def send_welcome_email(to_email, user_name=None, business_type=None):
         from_email="welcome@retainai.ca",
     )
 
-def log_notification(user_email, subject, message, lead_email=None):
-    notes = load_notifications()
-    notes.setdefault(_email_key(user_email), []).append({
-        "timestamp": _now_iso(),
-        "subject": subject,
-        "message": message,
-        "lead_email": lead_email,
-        "read": False,
-    })
-    save_notifications(notes)
+def log_notification(user_email, subject, message, lead_email=None, kind="info"):
+    return notify(_email_key(user_email), subject, message, kind=kind, lead_email=lead_email)
 
 # =============================================================================
 # ICS / Calendar helpers for Appointments
@@ -484,8 +659,9 @@ def make_google_calendar_link(appt: Dict[str, Any]) -> str:
 # =============================================================================
 @app.route('/api/appointments/<path:user_email>', methods=['GET'])
 def get_appointments(user_email):
-    data = load_appointments()
-    return jsonify({"appointments": data.get(_email_key(user_email), [])}), 200
+    user_email = _email_key(user_email)
+    return conditional_response(bucket_etag("appointments", user_email),
+                        lambda: {"appointments": view_bucket("appointments", user_email, [])})
 
 @app.route('/api/appointments/<path:user_email>', methods=['POST'])
 def create_appointment(user_email):
@@ -502,10 +678,10 @@ def create_appointment(user_email):
         "duration": int(data.get('duration', 30)),
         "notes": data.get('notes', ""),
     }
-    appointments = load_appointments()
-    key = _email_key(user_email)
-    appointments.setdefault(key, []).append(appt)
-    save_appointments(appointments)
+    with bucket_lock("appointments", _email_key(user_email)):
+        appointments = load_user_appointments(user_email)
+        appointments.append(appt)
+        save_user_appointments(user_email, appointments)
     create_ics_file(appt)
 
     # email confirmation (best-effort)
@@ -535,33 +711,31 @@ def create_appointment(user_email):
 @app.route('/api/appointments/<path:user_email>/<appt_id>', methods=['PUT'])
 def update_appointment(user_email, appt_id):
     data = request.get_json(force=True, silent=True) or {}
-    appointments = load_appointments()
-    key = _email_key(user_email)
-    arr = appointments.get(key, [])
-    updated = None
-    for i, ap in enumerate(arr):
-        if ap['id'] == appt_id:
-            ap.update({k: v for k, v in data.items() if k in {
-                "lead_email","lead_first_name","user_name","user_email","business_name",
-                "appointment_time","appointment_location","duration","notes"
-            }})
-            arr[i] = updated = ap
-            try: create_ics_file(ap)
-            except Exception: pass
-            break
-    appointments[key] = arr
-    save_appointments(appointments)
+    with bucket_lock("appointments", _email_key(user_email)):
+        arr = load_user_appointments(user_email)
+        updated = None
+        for i, ap in enumerate(arr):
+            if ap['id'] == appt_id:
+                ap.update({k: v for k, v in data.items() if k in {
+                    "lead_email","lead_first_name","user_name","user_email","business_name",
+                    "appointment_time","appointment_location","duration","notes"
+                }})
+                arr[i] = updated = ap
+                try: create_ics_file(ap)
+                except Exception: pass
+                break
+        if updated:
+            save_user_appointments(user_email, arr)
     return jsonify({"updated": bool(updated), "appointment": updated}), 200
 
 @app.route('/api/appointments/<path:user_email>/<appt_id>', methods=['DELETE'])
 def delete_appointment(user_email, appt_id):
-    appointments = load_appointments()
-    key = _email_key(user_email)
-    arr = appointments.get(key, [])
-    before = len(arr)
-    arr = [a for a in arr if a['id'] != appt_id]
-    appointments[key] = arr
-    save_appointments(appointments)
+    with bucket_lock("appointments", _email_key(user_email)):
+        arr = load_user_appointments(user_email)
+        before = len(arr)
+        arr = [a for a in arr if a['id'] != appt_id]
+        if len(arr) != before:
+            save_user_appointments(user_email, arr)
     f = os.path.join(ICS_DIR, f"{appt_id}.ics")
     if os.path.exists(f):
         try: os.remove(f)
@@ -612,12 +786,12 @@ def signup():
     if not email or not password:
         return jsonify({'error': 'Email and password required'}), 400
 
-    users = load_users()
-    if email in users and users[email].get("status") == "active":
+    existing = get_bucket("users", email) or {}
+    if existing.get("status") == "active":
         return jsonify({'error': 'User already exists'}), 409
 
     # Store a pending profile (not allowed to login yet)
-    users[email] = {
+    save_user(email, {
         'password':                password,
         'businessType':            businessType,
         'business':                businessName,
@@ -628,8 +802,7 @@ def signup():
         'trial_start':             _now_iso(),
         'trial_ending_notice_sent': False,
         'stripe_connected':        False,
-    }
-    save_users(users)
+    })
 
     try:
         session = stripe.checkout.Session.create(
@@ -681,11 +854,7 @@ def get_stripe_connect_url():
     if not user_email:
         return jsonify({"error": "Missing user_email"}), 400
     acct = stripe.Account.create(type="express", email=user_email)
-    users = load_users()
-    users.setdefault(user_email, {})
-    users[user_email]["stripe_account_id"] = acct.id
-    users[user_email]["stripe_connected"]  = True
-    save_users(users)
+    update_user(user_email, lambda u: u.update(stripe_account_id=acct.id, stripe_connected=True))
     return_url  = f"{FRONTEND_URL}/app?stripe_connected=1"
     refresh_url = f"{FRONTEND_URL}/app?stripe_refresh=1"
     link = stripe.AccountLink.create(
@@ -739,11 +908,7 @@ def stripe_oauth_callback():
         return redirect(f"{FRONTEND_URL}/app?stripe_error=1&stripe_error_desc=missing_code_or_state")
     resp = stripe.OAuth.token(grant_type="authorization_code", code=code)
     stripe_user_id = resp["stripe_user_id"]
-    users = load_users()
-    users.setdefault(user_email, {})
-    users[user_email]["stripe_account_id"] = stripe_user_id
-    users[user_email]["stripe_connected"]  = True
-    save_users(users)
+    update_user(user_email, lambda u: u.update(stripe_account_id=stripe_user_id, stripe_connected=True))
     return redirect(f"{FRONTEND_URL}/app?stripe_connected=1")
 
 @app.route("/api/stripe/account", methods=["GET"])
@@ -941,15 +1106,12 @@ def stripe_webhook():
             except Exception:
                 pass
         if email:
-            users = load_users()
-            user = users.get(email, {
-                'password': None, 'status': 'pending_payment',
-                'name': '', 'businessType': '', 'business': ''
-            })
-            user['status'] = 'active'
-            user.setdefault('trial_start', _now_iso())
-            users[email] = user
-            save_users(users)
+            def _activate(user):
+                if not user:
+                    user.update({'password': None, 'name': '', 'businessType': '', 'business': ''})
+                user['status'] = 'active'
+                user.setdefault('trial_start', _now_iso())
+            user = update_user(email, _activate)
             try:
                 send_welcome_email(email, user.get('name'), user.get('businessType'))
             except Exception:
@@ -987,33 +1149,30 @@ def google_oauth():
         email   = _email_key(idinfo['email'])
         name    = idinfo.get('name', '') or ''
         picture = idinfo.get('picture', '') or ''
-        users = load_users()
-        user  = users.get(email)
-        if not user:
-            users[email] = {
-                'password': None, 'businessType': '', 'business': '',
-                'name': name, 'picture': picture, 'people': '',
-                'trial_start': _now_iso(), 'status': 'pending_payment',
-                'trial_ending_notice_sent': False
-            }
-        else:
+        def _merge_google(user):
+            if not user:
+                return {
+                    'password': None, 'businessType': '', 'business': '',
+                    'name': name, 'picture': picture, 'people': '',
+                    'trial_start': _now_iso(), 'status': 'pending_payment',
+                    'trial_ending_notice_sent': False
+                }
             if not user.get('name') and name:
                 user['name'] = name
             if not user.get('picture') and picture:
                 user['picture'] = picture
-            users[email] = user
-        save_users(users)
+        user = update_user(email, _merge_google)
         return jsonify({
             'message': 'Google login successful',
             'user': {
                 'email':             email,
-                'name':              users[email].get('name', name),
-                'logo':              users[email].get('picture', picture),
-                'businessType':      users[email].get('businessType',''),
-                'business':          users[email].get('business',''),
-                'people':            users[email].get('people',''),
-                'stripe_account_id': users[email].get('stripe_account_id'),
-                'stripe_connected':  users[email].get('stripe_connected', False),
+                'name':              user.get('name', name),
+                'logo':              user.get('picture', picture),
+                'businessType':      user.get('businessType',''),
+                'business':          user.get('business',''),
+                'people':            user.get('people',''),
+                'stripe_account_id': user.get('stripe_account_id'),
+                'stripe_connected':  user.get('stripe_connected', False),
             }
         }), 200
     except Exception as e:
@@ -1029,19 +1188,20 @@ def google_oauth_complete():
     name         = data.get('name','')
     logo         = data.get('logo','')
     people       = data.get('people','')
-    users = load_users()
-    if not email or email not in users:
+    if not email:
         return jsonify({'error': 'User not found'}), 404
-    rec = users[email]
-    rec.update({
-        'businessType': businessType,
-        'business':     businessName,
-        'name':         name,
-        'picture':      logo,
-        'people':       people
-    })
-    users[email] = rec
-    save_users(users)
+    with bucket_lock("users", email):
+        rec = get_bucket("users", email)
+        if rec is None:
+            return jsonify({'error': 'User not found'}), 404
+        rec.update({
+            'businessType': businessType,
+            'business':     businessName,
+            'name':         name,
+            'picture':      logo,
+            'people':       people
+        })
+        save_user(email, rec)
     return jsonify({
         'message': 'Profile updated',
         'user': {
@@ -1100,37 +1260,33 @@ def google_oauth_cb():
         headers={"Authorization": f"Bearer {access_token}"}
     )
     calendars = cal_resp.json().get("items", []) if cal_resp.ok else []
-    users = load_users()
-    user = users.get(state, {})
-    user["gcal_connected"] = True
-    user["gcal_access_token"] = access_token
-    user["gcal_refresh_token"] = refresh_token
-    user["gcal_calendars"] = [{"id": c["id"], "summary": c.get("summary"), "primary": c.get("primary", False)} for c in calendars]
-    users[state] = user
-    save_users(users)
+    update_user(state, lambda user: user.update(
+        gcal_connected=True,
+        gcal_access_token=access_token,
+        gcal_refresh_token=refresh_token,
+        gcal_calendars=[{"id": c["id"], "summary": c.get("summary"), "primary": c.get("primary", False)} for c in calendars],
+    ))
     return "Google Calendar connected! You may close this tab and return to the app."
 
 @app.get("/api/google/status/<path:email>")
 def google_status(email):
-    users = load_users()
-    user = users.get(_email_key(email))
+    user = view_bucket("users", _email_key(email))
     if not user or not user.get("gcal_connected"):
         return jsonify({"connected": False})
     return jsonify({"connected": True, "calendars": user.get("gcal_calendars", [])})
 
 @app.post("/api/google/disconnect/<path:email>")
 def google_disconnect(email):
-    users = load_users()
     k = _email_key(email)
-    user = users.get(k)
-    if user:
-        user.pop("gcal_access_token", None)
-        user.pop("gcal_refresh_token", None)
-        user["gcal_connected"] = False
-        user.pop("gcal_calendars", None)
-        users[k] = user
-        save_users(users)
-        return jsonify({"disconnected": True})
+    with bucket_lock("users", k):
+        user = get_bucket("users", k)
+        if user:
+            user.pop("gcal_access_token", None)
+            user.pop("gcal_refresh_token", None)
+            user["gcal_connected"] = False
+            user.pop("gcal_calendars", None)
+            save_user(k, user)
+            return jsonify({"disconnected": True})
     return jsonify({"disconnected": False})
 
 @app.get("/api/google/calendars/<path:email>")
@@ -1182,15 +1338,10 @@ def google_events(email):
 
 # Caches
 _MSG_CACHE: Dict[tuple, Dict[str, Any]] = {}
-_MSG_CACHE_TTL_SECONDS = 2
 _WABA_RES = {"id": None, "checked_at": None}
 _WABA_TTL_SECONDS = 300
 
-def _norm_wa(num: str) -> str:
-    d = re.sub(r"\D", "", num or "")
-    if len(d) == 10 and DEFAULT_COUNTRY_CODE.isdigit():
-        d = DEFAULT_COUNTRY_CODE + d
-    return d
+_norm_wa = norm_wa  # digits only, DEFAULT_COUNTRY_CODE prefixed to 10-digit numbers (app_wa_numbers)
 
 def _wa_env():
     if not WHATSAPP_TOKEN or not WHATSAPP_PHONE_ID:
@@ -1211,37 +1362,15 @@ def wa_normalize_lang(code: str) -> str:
 def wa_primary_lang(code: str) -> str:
     return (code or "").replace("-", "_").split("_", 1)[0].lower() if code else ""
 
-def _lead_matches_wa(lead, wa_digits):
-    for key in ("whatsapp", "phone"):
-        if _norm_wa(lead.get(key)) == wa_digits:
-            return True
-    return False
-
+# Inbound routing goes through the persistent number -> (user, lead) index.
 def find_user_by_whatsapp(wa_id):
-    wa = _norm_wa(wa_id or "")
-    leads_by_user = load_leads()
-    for user_email, leads in (leads_by_user or {}).items():
-        for lead in leads:
-            if _lead_matches_wa(lead, wa):
-                return user_email
-    return None
+    return wa_route(wa_id)[0]
 
 def find_lead_by_whatsapp(wa_id):
-    wa = _norm_wa(wa_id or "")
-    leads_by_user = load_leads()
-    for _, leads in (leads_by_user or {}).items():
-        for lead in leads:
-            if _lead_matches_wa(lead, wa):
-                return lead.get("id")
-    return None
+    return wa_route(wa_id)[1]
 
 def get_last_inbound_ts(user_email: str, lead_id: str):
-    chats = load_chats()
-    msgs = (chats.get(user_email, {}) or {}).get(lead_id, []) or []
-    for m in reversed(msgs):
-        if m.get("from") == "lead":
-            return m.get("time")
-    return None
+    return last_inbound(user_email, lead_id)  # kept in the thread header (app_chats)
 
 def within_24h(user_email: str, lead_id: str) -> bool:
     ts = get_last_inbound_ts(user_email, lead_id)
@@ -1323,15 +1452,15 @@ def send_wa_template(to_number: str, template_name: str, lang_code: str, paramet
         app.logger.error("[WA TEMPLATE ERROR] %s %s", resp.status_code, resp.text)
     return resp
 
-def _get_thread_cached(user_email, lead_id):
+def _get_thread_cached(user_email, lead_id, tag=None):
+    """Thread messages, reused while the thread's ETag (app_chats.thread_etag) is unchanged."""
     key = (str(user_email or ""), str(lead_id or ""))
-    now = dt.utcnow()
+    tag = tag or thread_etag(user_email, lead_id)
     cached = _MSG_CACHE.get(key)
-    if cached and (now - cached["at"]).total_seconds() < _MSG_CACHE_TTL_SECONDS:
+    if cached and cached["tag"] == tag:
         return cached["data"], True
-    chats = load_chats()
-    msgs = (chats.get(user_email, {}) or {}).get(lead_id, []) or []
-    _MSG_CACHE[key] = {"at": now, "data": msgs}
+    msgs = read_thread(user_email, lead_id)
+    _MSG_CACHE[key] = {"tag": tag, "data": msgs}
     return msgs, False
 
 @app.get("/api/whatsapp/health")
@@ -1456,8 +1585,8 @@ def whatsapp_window_state():
 def get_whatsapp_messages():
     user_email = _email_key(request.args.get("user_email") or "")
     lead_id = request.args.get("lead_id")
-    msgs, _ = _get_thread_cached(user_email, lead_id)
-    return jsonify({"messages": msgs}), 200
+    tag = thread_etag(user_email, lead_id)
+    return conditional_response(tag, lambda: {"messages": _get_thread_cached(user_email, lead_id, tag)[0]})
 
 @app.get("/api/whatsapp/status")
 def get_message_status():
@@ -1475,13 +1604,12 @@ def set_optout():
     opt_out = bool(data.get("opt_out", True))
     if not user_email or not lead_id:
         return jsonify({"error": "user_email and lead_id required"}), 400
-    leads = load_leads()
-    arr = leads.get(user_email, []) or []
-    for ld in arr:
-        if str(ld.get("id")) == lead_id:
+    with bucket_lock("leads", user_email):
+        found = lead_index(user_email).get(lead_id)
+        if found is not None:
+            ld = thaw(found)
             ld["wa_opt_out"] = bool(opt_out)
-    leads[user_email] = arr
-    save_leads(leads)
+            upsert_item("leads", user_email, ld)
     return jsonify({"ok": True, "opt_out": opt_out}), 200
 
 @app.post('/api/whatsapp/send')
@@ -1520,9 +1648,8 @@ def send_whatsapp_message():
 
     # Opt-out
     if user_email and lead_id:
-        for ld in load_leads().get(user_email, []) or []:
-            if str(ld.get("id")) == str(lead_id) and bool(ld.get("wa_opt_out")):
-                return jsonify({"ok": False, "error": "Lead has opted out of WhatsApp messages"}), 403
+        if bool((lead_index(user_email).get(lead_id) or {}).get("wa_opt_out")):
+            return jsonify({"ok": False, "error": "Lead has opted out of WhatsApp messages"}), 403
 
     inside24 = within_24h(user_email, lead_id)
     requested = wa_normalize_lang(language_code)
@@ -1629,17 +1756,11 @@ def send_whatsapp_message():
 
         # persist thread + status
         try:
-            chats = load_chats()
-            user_chats = (chats.get(user_email, {}) or {})
-            arr = (user_chats.get(lead_id, []) or [])
-            arr.append({"from": "user", "text": sent_text, "time": _now_iso()})
-            user_chats[lead_id] = arr; chats[user_email] = user_chats; save_chats(chats)
+            append_message(user_email, lead_id, {"from": "user", "text": sent_text, "time": _now_iso()})
             if msg_id:
-                statuses = load_statuses()
-                statuses[msg_id] = {"status": "sent_request", "user_email": user_email, "lead_id": lead_id,
-                                    "to": to_number, "mode": mode, "time": _now_iso()}
-                save_statuses(statuses)
-            _MSG_CACHE[(str(user_email or ""), str(lead_id or ""))] = {"at": dt.utcnow(), "data": arr}
+                put_bucket("statuses", msg_id, {"status": "sent_request", "user_email": user_email, "lead_id": lead_id,
+                                                "to": to_number, "mode": mode, "time": _now_iso()})
+            _MSG_CACHE.pop((str(user_email or ""), str(lead_id or "")), None)
         except Exception as e:
             app.logger.warning("[WHATSAPP] save message/status error: %s", e)
 
@@ -1673,6 +1794,15 @@ def debug_template_locales():
         "raw_status": r.status_code if r is not None else None
     }), 200
 
+def _set_wa_opt_out(wa: str, opt_out: bool):
+    for owner, lead_id in wa_lookup(wa):
+        with bucket_lock("leads", owner):  # re-read under the lock; the lookup may be stale
+            ld = lead_index(owner).get(lead_id)
+            if ld is not None and bool(ld.get("wa_opt_out")) != opt_out:
+                ld = thaw(ld)
+                ld["wa_opt_out"] = opt_out
+                upsert_item("leads", owner, ld)
+
 # ---- Webhook: verification, delivery/read statuses, inbound messages, opt-out
 @app.route("/api/whatsapp/webhook", methods=["GET", "POST"])
 def whatsapp_webhook():
@@ -1694,14 +1824,20 @@ def whatsapp_webhook():
 
                 # delivery/read statuses
                 for status in value.get("statuses", []):
-                    statuses = load_statuses()
-                    statuses[status.get("id") or "unknown"] = {
+                    sid = status.get("id") or "unknown"
+                    sent = get_bucket("statuses", sid) or {}  # the send path recorded whose message this is
+                    put_bucket("statuses", sid, {
                         "status": status.get("status"),
                         "timestamp": status.get("timestamp"),
                         "recipient": status.get("recipient_id"),
-                        "errors": status.get("errors")
-                    }
-                    save_statuses(statuses)
+                        "errors": status.get("errors"),
+                        "user_email": sent.get("user_email"),
+                        "lead_id": sent.get("lead_id"),
+                    })
+                    if sent.get("user_email"):
+                        publish_later(sent["user_email"], "status", {"message_id": sid, "lead_id": sent.get("lead_id"),
+                                                                     "status": status.get("status"),
+                                                                     "timestamp": status.get("timestamp")})
 
                 # inbound messages
                 messages = value.get("messages", [])
@@ -1720,40 +1856,23 @@ def whatsapp_webhook():
                         up = text.strip().upper()
                         if up in ("STOP", "UNSUBSCRIBE", "STOP ALL", "CANCEL"):
                             wa = _norm_wa(sender_waid)
-                            data = load_leads()
-                            changed = False
-                            for _, leads in (data or {}).items():
-                                for ld in leads:
-                                    if _lead_matches_wa(ld, wa):
-                                        ld["wa_opt_out"] = True
-                                        changed = True
-                            if changed: save_leads(data)
+                            _set_wa_opt_out(wa, True)
                             try: send_wa_text(sender_waid, "You have been unsubscribed. Reply START to opt back in.")
                             except Exception: pass
                         elif up in ("START", "UNSTOP", "SUBSCRIBE"):
                             wa = _norm_wa(sender_waid)
-                            data = load_leads()
-                            changed = False
-                            for _, leads in (data or {}).items():
-                                for ld in leads:
-                                    if _lead_matches_wa(ld, wa):
-                                        ld["wa_opt_out"] = False
-                                        changed = True
-                            if changed: save_leads(data)
+                            _set_wa_opt_out(wa, False)
                             try: send_wa_text(sender_waid, "You are now opted back in. You can reply STOP anytime to opt out.")
                             except Exception: pass
 
                     # save inbound to proper thread
-                    user_email = find_user_by_whatsapp(sender_waid) if sender_waid else None
-                    lead_id = find_lead_by_whatsapp(sender_waid) if sender_waid else None
-                    chats = load_chats()
-                    user_chats = (chats.get(user_email, {}) or {})
-                    arr = (user_chats.get(lead_id, []) or [])
-                    arr.append({"from": "lead", "text": text, "time": _now_iso()})
-                    user_chats[lead_id] = arr
-                    chats[user_email] = user_chats
-                    save_chats(chats)
-                    _MSG_CACHE[(str(user_email or ""), str(lead_id or ""))] = {"at": dt.utcnow(), "data": arr}
+                    user_email, lead_id = wa_route(sender_waid) if sender_waid else (None, None)
+                    thread = "" if lead_id is None else str(lead_id)
+                    msg = {"from": "lead", "text": text, "time": _now_iso()}
+                    append_message(user_email or "", thread, msg)
+                    _MSG_CACHE.pop((str(user_email or ""), thread), None)
+                    if user_email:
+                        publish_later(user_email, "chat", dict(msg, lead_id=lead_id))
 
     except Exception as e:
         app.logger.warning("[WHATSAPP WEBHOOK] parse error: %s", e)
@@ -1761,6 +1880,31 @@ def whatsapp_webhook():
     return "OK", 200
 
 
+# =============================================================================
+# Blueprints (team, wa-auto appointments, Google / CSV contacts import, notification archive, change feed, export, analytics)
+# =============================================================================
+# They read and write through app_storage like everything above. Only the
+# Google contacts import depends on optional configuration (the People
+# redirect URI); if it fails to import it is skipped instead of taking the API
+# down. Any other blueprint failing to import is a bug and fails the boot.
+from app_team import team_bp
+from app_wa_auto_appointments import WA_AUTO_BP
+from app_csv_import import csv_import_bp
+from app_notifications import notifications_bp
+from app_changes import changes_bp
+from app_export import export_bp
+from app_analytics import analytics_bp
+
+for _bp in (team_bp, WA_AUTO_BP, csv_import_bp, notifications_bp, changes_bp, export_bp, analytics_bp):
+    app.register_blueprint(_bp)
+
+try:
+    from app_imports import imports_bp
+    app.register_blueprint(imports_bp)
+except Exception as e:
+    app.logger.warning("[BOOT] blueprint app_imports not registered: %s", e)
+
+
 # =============================================================================
 # Scheduler — safe bootstrap (no crashes on Render; runs only if enabled)
 # =============================================================================
@@ -1773,6 +1917,11 @@ if 'APScheduler' not in globals():
 
 scheduler = None
 
+def _compact_notifications_job():
+    moved = compact_notifications()
+    app.logger.info("[SCHED] notifications compaction: archived %d entr(y/ies) for %d user(s)",
+                    sum(moved.values()), len(moved))
+
 def _start_scheduler_once():
     """
     Safe start:
@@ -1804,9 +1953,13 @@ def _start_scheduler_once():
         sch.add_job(id="trial_ending_notices", func=send_trial_ending_soon,
                     trigger="cron", hour=10, minute=0, replace_existing=True)
 
+        # Roll expired notifications into the archive at 03:00 UTC daily
+        sch.add_job(id="notifications_compaction", func=_compact_notifications_job,
+                    trigger="cron", hour=3, minute=0, replace_existing=True)
+
         sch.start()
         scheduler = sch
-        app.logger.info("[SCHED] started with 3 jobs (UTC).")
+        app.logger.info("[SCHED] started with 4 jobs (UTC).")
     except Exception as e:
         app.logger.warning("[SCHED] failed to start: %s", e)
 
@@ -0,0 +1,364 @@
+# backend/app_analytics.py
+# ======================================
+# Dashboard aggregates for Analytics.jsx, served in one small response:
+#
+#   GET /api/analytics/<user_email>
+#       -> {funnel, funnel_rates, sentiment_by_month, sources, leads_by_month, top_tags,
+#           vips, cold, tip, next_action, reminders_due, avg_days_since_contact,
+#           appointments_this_month, leaderboard, heatmap, messages, generated_at}
+#
+# Nothing here walks the leads at request time:
+#
+#   LeadStats   counters (funnel stages, sources, tags, months, sentiment) plus
+#               sorted (timestamp, id) lists for the time-relative figures —
+#               cold leads and the average age are a bisect / a running sum
+#               against "now", reminders due a two-sided bisect
+#   ApptStats   per-lead-email counts, per-month counts and the 7x24 heatmap
+#
+# Both are app_storage derived_index() views on the leads / appointments
+# buckets, so every lead or appointment write moves them by its (old, new)
+# diff and a write from another worker refreshes them the same way.
+#
+# Chat counters (messages per month, inbound / outbound) can't be rebuilt
+# from a bucket, so they live in ANALYTICS_DIR/<sha1(user_email)>.json,
+# bumped by an app_chats message watcher under the "analytics" lock. A user
+# without the file gets it built once from the thread segments on first read.
+#
+# Appointments count from the appointments entity (matched to leads by
+# lead_email); the legacy per-lead "appointments" arrays are not read.
+import os, bisect, heapq, datetime, threading
+from typing import Any, Dict, List, Optional, Tuple
+from flask import Blueprint, jsonify
+
+from app_storage import DATA_DIR, load_json, save_json, bucket_lock, derived_index, item_index, shard_name
+from app_chats import iter_thread, thread_ids, watch_messages
+
+analytics_bp = Blueprint("analytics_bp", __name__)
+
+ANALYTICS_DIR   = os.getenv("ANALYTICS_DIR", os.path.join(DATA_DIR, "analytics"))
+COLD_DAYS       = 14
+VIP_STALE_DAYS  = 10
+REMINDER_DAYS   = 7
+TOP_TAGS        = 8
+LEADERBOARD     = 5
+NAMES_LIMIT     = 20   # names listed for VIPs / cold leads (the counts are exact)
+CLOSED_TAGS     = ("Closed", "Won", "Completed")
+SENTIMENT_TAGS  = ("Happy", "Upset", "Neutral")
+DEFAULT_SOURCE  = "Other"
+DAY             = 86400.0
+
+# ----------------------------
+# Dates
+# ----------------------------
+def _parse(value: Any) -> Optional[datetime.datetime]:
+    """ISO date / datetime (``Z`` or offset) as an aware UTC datetime; naive values are taken as UTC."""
+    s = str(value or "").strip()
+    if not s:
+        return None
+    try:
+        d = datetime.datetime.fromisoformat(s.replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    if d.tzinfo is None:
+        d = d.replace(tzinfo=datetime.timezone.utc)
+    return d.astimezone(datetime.timezone.utc)
+
+def _ts(value: Any) -> Optional[float]:
+    d = _parse(value)
+    return d.timestamp() if d else None
+
+def _month(value: Any) -> str:
+    """"YYYY-MM", or "" when undated (reported under the current month, as the dashboard did)."""
+    d = _parse(value)
+    return d.strftime("%Y-%m") if d else ""
+
+def _last_contact(lead: Dict[str, Any]) -> Any:
+    return lead.get("last_contacted") or lead.get("lastContacted") or lead.get("createdAt")
+
+# ----------------------------
+# Small helpers
+# ----------------------------
+def _bump(counter: Dict[Any, int], key: Any, sign: int):
+    n = counter.get(key, 0) + sign
+    if n:
+        counter[key] = n
+    else:
+        counter.pop(key, None)
+
+def _sorted_add(keys: list, key: tuple, sign: int):
+    if sign > 0:
+        bisect.insort(keys, key)
+        return
+    i = bisect.bisect_left(keys, key)
+    if i < len(keys) and keys[i] == key:
+        del keys[i]
+
+def _tags(lead: Dict[str, Any]) -> List[str]:
+    tags = lead.get("tags")
+    return list(dict.fromkeys(t for t in tags if isinstance(t, str))) if isinstance(tags, list) else []
+
+def _name(lead: Optional[Dict[str, Any]]) -> str:
+    return str((lead or {}).get("name") or (lead or {}).get("email") or "Unknown")
+
+# ----------------------------
+# Lead aggregates (derived view on the leads bucket)
+# ----------------------------
+class LeadStats:
+    def __init__(self, items: Dict[str, Any]):
+        self.mu = threading.Lock()
+        self.total = self.contacted = self.closed = 0
+        self.sources: Dict[str, int] = {}
+        self.tags: Dict[str, int] = {}
+        self.by_month: Dict[str, int] = {}
+        self.sentiment: Dict[Tuple[str, str], int] = {}  # (month, tag) -> leads
+        self.emails: Dict[str, int] = {}                 # lowercased email -> leads carrying it
+        self.vips: Dict[str, Optional[float]] = {}       # id -> last_contacted ts (None: never)
+        self.contact: List[Tuple[float, str]] = []       # (last contact ts, id), ascending
+        self.contact_sum = 0.0
+        self.undated = 0                                 # no usable date: counts as contacted "now"
+        self.reminders: List[Tuple[float, str, int]] = []
+        for lead in items.values():
+            self._add(lead, 1)
+
+    # app_storage calls apply() under its index mutex
+    def apply(self, changes: list):
+        with self.mu:
+            for old, new in changes:
+                if old is not None:
+                    self._add(old, -1)
+                if new is not None:
+                    self._add(new, 1)
+
+    def _add(self, lead: Any, sign: int):
+        if not isinstance(lead, dict):
+            return
+        iid = str(lead.get("id"))
+        tags = _tags(lead)
+        self.total += sign
+        if lead.get("last_contacted") or lead.get("lastContacted"):
+            self.contacted += sign
+        if any(t in CLOSED_TAGS for t in tags):
+            self.closed += sign
+        _bump(self.sources, str(lead.get("source") or DEFAULT_SOURCE), sign)
+        for t in tags:
+            _bump(self.tags, t, sign)
+        _bump(self.by_month, _month(lead.get("createdAt")), sign)
+        mood = next((t for t in tags if t in SENTIMENT_TAGS), "Neutral")
+        _bump(self.sentiment, (_month(_last_contact(lead)), mood), sign)
+        email = str(lead.get("email") or "").strip().lower()
+        if email:
+            _bump(self.emails, email, sign)
+        if "VIP" in tags:
+            if sign > 0:
+                self.vips[iid] = _ts(lead.get("last_contacted"))
+            else:
+                self.vips.pop(iid, None)
+        ts = _ts(_last_contact(lead))
+        if ts is None:
+            self.undated += sign
+        else:
+            _sorted_add(self.contact, (ts, iid), sign)
+            self.contact_sum += sign * ts
+        for i, r in enumerate(lead.get("reminders") or ()):
+            rts = _ts(r.get("date")) if isinstance(r, dict) else None
+            if rts is not None:
+                _sorted_add(self.reminders, (rts, iid, i), sign)
+
+    def with_email(self, emails) -> int:
+        """Leads whose email is one of `emails` (appointments match leads by email)."""
+        with self.mu:
+            return sum(self.emails.get(e, 0) for e in emails)
+
+    def summary(self, now: float) -> Dict[str, Any]:
+        """Everything the dashboard shows from the leads alone; lead ids where names are needed."""
+        this_month = datetime.datetime.fromtimestamp(now, datetime.timezone.utc).strftime("%Y-%m")
+        with self.mu:
+            by_month: Dict[str, int] = {}
+            for m, n in self.by_month.items():
+                by_month[m or this_month] = by_month.get(m or this_month, 0) + n
+            sentiment: Dict[str, Dict[str, Any]] = {}
+            for (m, mood), n in self.sentiment.items():
+                row = sentiment.setdefault(m or this_month, {"month": m or this_month, "Happy": 0, "Upset": 0, "Neutral": 0})
+                row[mood] += n
+            cutoff = now - COLD_DAYS * DAY
+            n_cold = bisect.bisect_left(self.contact, (cutoff, ""))
+            dated = len(self.contact)
+            # mean whole-day age; leads contacted in the future or undated count as 0 days
+            future = dated - bisect.bisect_right(self.contact, (now, "\uffff"))
+            past_sum = self.contact_sum - sum(ts for ts, _ in self.contact[dated - future:])
+            ages = ((dated - future) * now - past_sum) / DAY
+            n_ages = dated + self.undated
+            stale = now - VIP_STALE_DAYS * DAY
+            return {
+                "total": self.total, "contacted": self.contacted, "closed": self.closed,
+                "sources": sorted(self.sources.items(), key=lambda kv: (-kv[1], kv[0])),
+                "tags": heapq.nsmallest(TOP_TAGS, self.tags.items(), key=lambda kv: (-kv[1], kv[0])),
+                "by_month": sorted(by_month.items()),
+                "sentiment": [sentiment[m] for m in sorted(sentiment)],
+                "vip_ids": [iid for iid, _ in heapq.nsmallest(NAMES_LIMIT, self.vips.items(),  # least recently contacted first
+                                                              key=lambda kv: (kv[1] or 0.0, kv[0]))],
+                "vip_count": len(self.vips),
+                "stale_vips": sum(1 for ts in self.vips.values() if ts is None or ts < stale),
+                "cold_ids": [iid for _, iid in self.contact[:min(n_cold, NAMES_LIMIT)]], "cold_count": n_cold,
+                "avg_days": round(ages / n_ages) if n_ages else 0,
+                "reminders_due": (bisect.bisect_right(self.reminders, (now + REMINDER_DAYS * DAY, "\uffff", 1 << 30))
+                                  - bisect.bisect_left(self.reminders, (now, "", -1))),
+            }
+
+def _lead_view(user_email: str) -> LeadStats:
+    return derived_index("leads", user_email, "analytics", LeadStats)
+
+# ----------------------------
+# Appointment aggregates (derived view on the appointments bucket)
+# ----------------------------
+class ApptStats:
+    def __init__(self, items: Dict[str, Any]):
+        self.mu = threading.Lock()
+        self.per_email: Dict[str, int] = {}   # lead_email -> appointments
+        self.names: Dict[str, str] = {}       # lead_email -> lead_first_name of its latest booking
+        self.by_month: Dict[str, int] = {}
+        self.heatmap = [[0] * 24 for _ in range(7)]  # [Sun..Sat][hour], wall-clock time as booked
+        for appt in items.values():
+            self._add(appt, 1)
+
+    def apply(self, changes: list):
+        with self.mu:
+            for old, new in changes:
+                if old is not None:
+                    self._add(old, -1)
+                if new is not None:
+                    self._add(new, 1)
+
+    def _add(self, appt: Any, sign: int):
+        if not isinstance(appt, dict):
+            return
+        email = str(appt.get("lead_email") or "").strip().lower()
+        if email:
+            _bump(self.per_email, email, sign)
+            if sign > 0 and appt.get("lead_first_name"):
+                self.names[email] = str(appt["lead_first_name"])
+            elif email not in self.per_email:
+                self.names.pop(email, None)
+        try:
+            at = datetime.datetime.fromisoformat(str(appt.get("appointment_time") or "").replace("Z", "+00:00"))
+        except ValueError:
+            return
+        _bump(self.by_month, at.strftime("%Y-%m"), sign)
+        self.heatmap[(at.weekday() + 1) % 7][at.hour] += sign
+
+    def summary(self, month: str) -> Dict[str, Any]:
+        with self.mu:
+            top = heapq.nsmallest(LEADERBOARD, self.per_email.items(), key=lambda kv: (-kv[1], kv[0]))
+            return {
+                "this_month": self.by_month.get(month, 0),
+                "emails": list(self.per_email),
+                "leaderboard": [{"name": self.names.get(e) or e, "email": e, "count": n} for e, n in top],
+                "heatmap": [row[:] for row in self.heatmap],
+            }
+
+def _appt_view(user_email: str) -> ApptStats:
+    return derived_index("appointments", user_email, "analytics", ApptStats)
+
+# ----------------------------
+# Chat counters (ANALYTICS_DIR file per user)
+# ----------------------------
+def _norm_user(user_email: str) -> str:
+    return (user_email or "").strip().lower()
+
+def _chat_path(user: str) -> str:
+    return os.path.join(ANALYTICS_DIR, shard_name(user))
+
+def _count_message(stats: Dict[str, Any], msg: Dict[str, Any]):
+    way = "in" if msg.get("from") == "lead" else "out"
+    stats["messages"] = stats.get("messages", 0) + 1
+    stats[way] = stats.get(way, 0) + 1
+    month = _month(msg.get("time"))
+    if month:
+        row = stats.setdefault("by_month", {}).setdefault(month, {"in": 0, "out": 0})
+        row[way] += 1
+    if str(msg.get("time") or "") > str(stats.get("last_at") or ""):
+        stats["last_at"] = msg.get("time")
+
+def _build_chat_stats(user: str) -> Dict[str, Any]:
+    stats: Dict[str, Any] = {"messages": 0, "in": 0, "out": 0, "by_month": {}, "last_at": None}
+    for lead in thread_ids(user):
+        for msg in iter_thread(user, lead):
+            if isinstance(msg, dict):
+                _count_message(stats, msg)
+    return stats
+
+def _on_message(user: str, lead: str, msg: Dict[str, Any]):
+    with bucket_lock("analytics", user):
+        stats = load_json(_chat_path(user), {})
+        if not stats:
+            return  # built in full (this message included) on first read
+        _count_message(stats, msg)
+        save_json(_chat_path(user), stats)
+
+watch_messages(_on_message)
+
+def chat_stats(user_email: str) -> Dict[str, Any]:
+    user = _norm_user(user_email)
+    stats = load_json(_chat_path(user), {})
+    if stats:
+        return stats
+    with bucket_lock("analytics", user):
+        stats = load_json(_chat_path(user), {})
+        if not stats:
+            stats = _build_chat_stats(user)
+            os.makedirs(ANALYTICS_DIR, exist_ok=True)
+            save_json(_chat_path(user), stats)
+    return stats
+
+# ----------------------------
+# API
+# ----------------------------
+def _rates(values: List[int]) -> List[int]:
+    return [round(cur / prev * 100) if prev else 0 for prev, cur in zip(values, values[1:])]
+
+def dashboard(user_email: str, now: Optional[float] = None) -> Dict[str, Any]:
+    user = _norm_user(user_email)
+    now = datetime.datetime.now(datetime.timezone.utc).timestamp() if now is None else now
+    month = datetime.datetime.fromtimestamp(now, datetime.timezone.utc).strftime("%Y-%m")
+    lead_view = _lead_view(user)
+    leads = lead_view.summary(now)
+    appts = _appt_view(user).summary(month)
+    index = item_index("leads", user)
+    vips = [_name(index.get(i)) for i in leads["vip_ids"]]
+    cold = [_name(index.get(i)) for i in leads["cold_ids"]]
+    stages = [leads["total"], leads["contacted"], lead_view.with_email(appts["emails"]), leads["closed"]]
+    n_vip_stale = leads["stale_vips"]
+    chats = chat_stats(user)
+    return {
+        "funnel": [{"stage": s, "value": v} for s, v in
+                   zip(("Total Leads", "Contacted", "Appointment Set", "Closed"), stages)],
+        "funnel_rates": _rates(stages),
+        "sentiment_by_month": leads["sentiment"],
+        "sources": [{"name": k, "value": v} for k, v in leads["sources"]],
+        "leads_by_month": [{"month": k, "count": v} for k, v in leads["by_month"]],
+        "top_tags": [{"tag": k, "value": v} for k, v in leads["tags"]],
+        "vips": {"count": leads["vip_count"], "names": vips},
+        "cold": {"count": leads["cold_count"], "days": COLD_DAYS, "names": cold},
+        "tip": (f"You have {n_vip_stale} VIP{'s' if n_vip_stale > 1 else ''} who need follow-up this week!"
+                if n_vip_stale else "All VIPs are up-to-date. Keep it up!"),
+        "next_action": (f"Reach out to {cold[0]} – it's been a while!" if cold
+                        else "No leads are at risk. Well managed!"),
+        "reminders_due": leads["reminders_due"],
+        "avg_days_since_contact": leads["avg_days"],
+        "appointments_this_month": appts["this_month"],
+        "leaderboard": appts["leaderboard"],
+        "heatmap": appts["heatmap"],
+        "messages": {"total": chats.get("messages", 0), "inbound": chats.get("in", 0),
+                     "outbound": chats.get("out", 0), "last_at": chats.get("last_at"),
+                     "by_month": [dict(month=m, **v) for m, v in sorted((chats.get("by_month") or {}).items())]},
+        "generated_at": datetime.datetime.fromtimestamp(now, datetime.timezone.utc).isoformat().replace("+00:00", "Z"),
+    }
+
+@analytics_bp.get("/api/analytics/<path:user_email>")
+def get_analytics(user_email):
+    user = _norm_user(user_email)
+    if not user:
+        return jsonify({"error": "user_email required"}), 400
+    resp = jsonify(dashboard(user))
+    resp.headers["Cache-Control"] = "no-cache"  # "cold" / "due" move with the clock; never serve a stale copy
+    return resp, 200
@@ -0,0 +1,246 @@
+# backend/app_changes.py
+# ======================================
+# Per-user change feed for delta sync: every create, update and delete of a
+# lead, note or appointment gets the next sequence number in the owner's
+# append-only log, and GET /api/changes/<user_email>?since=<seq> returns what
+# changed after that point — current items for upserts, tombstones for
+# deletes — so a client refresh costs O(changes) rather than O(dataset).
+#
+#   CHANGES_DIR/<sha1(user_email)>/seg-<first seq:012d>.jsonl
+#       {"seq", "entity", "id", "op": "upsert"|"delete", "at"} per line, append-only
+#
+# Entries come from app_storage item watchers on leads / notes /
+# appointments, so every path that mutates those buckets (app.py handlers,
+# wa-auto, Google import) is logged without touching its call site. They are
+# appended once the write they describe has landed (after_commit), never
+# while it is still pending in the request's batch: a reader that sees an
+# entry always finds the item's new state, and a write that fails to land is
+# never logged. The log records ids only; the feed reads the item's current
+# state, so replaying a change twice is harmless and clients only ever apply
+# the newest version.
+#
+# Old segments are dropped past CHANGES_KEEP_SEGMENTS; a cursor older than
+# the log's floor gets {"reset": true}: reload the lists, then continue from
+# the returned cursor. since=0 reads from the start while nothing has been
+# pruned yet, and resets after.
+import os, datetime
+from typing import Any, Dict, List, Optional
+from flask import Blueprint, request, jsonify
+
+from app_storage import (DATA_DIR, encode_doc, decode_doc, bucket_lock, item_index, shard_name, watch_items,
+                         after_commit)
+
+changes_bp = Blueprint("changes_bp", __name__)
+
+CHANGES_DIR             = os.getenv("CHANGES_DIR", os.path.join(DATA_DIR, "changes"))
+CHANGES_SEGMENT_ENTRIES = int(os.getenv("CHANGES_SEGMENT_ENTRIES", "5000"))
+CHANGES_KEEP_SEGMENTS   = int(os.getenv("CHANGES_KEEP_SEGMENTS", "20"))
+CHANGES_FSYNC           = os.getenv("CHANGES_FSYNC", "1") == "1"
+FEED_ENTITIES           = ("leads", "notes", "appointments")
+DEFAULT_LIMIT, MAX_LIMIT = 500, 5000
+
+# ----------------------------
+# Layout
+# ----------------------------
+def _norm_user(user_email: str) -> str:
+    return (user_email or "").strip().lower()
+
+def _log_dir(user: str) -> str:
+    return os.path.join(CHANGES_DIR, shard_name(user)[:-5])
+
+def _seg_path(d: str, first: int) -> str:
+    return os.path.join(d, f"seg-{first:012d}.jsonl")
+
+def _segments(d: str) -> List[int]:
+    """First seq of each segment, ascending."""
+    try:
+        return sorted(int(f[4:16]) for f in os.listdir(d) if f.startswith("seg-") and f.endswith(".jsonl"))
+    except FileNotFoundError:
+        return []
+
+def _size(path: str) -> int:
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
+
+def _read_lines(path: str) -> List[Dict[str, Any]]:
+    out = []
+    try:
+        with open(path, "rb") as f:
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break  # append in progress / torn by a crash
+                try:
+                    out.append(decode_doc(line))
+                except ValueError:
+                    continue
+    except FileNotFoundError:
+        pass
+    return out
+
+# ----------------------------
+# Position (seq, open segment)
+# ----------------------------
+# Nothing but the segments is persisted: seq is the last line's, the floor
+# is one below the oldest segment's first seq. Each process caches its view
+# per user and catches up by reading only the bytes appended since it last
+# looked (another worker's appends, a roll it didn't make).
+_heads: Dict[str, Dict[str, Any]] = {}
+
+def _head(user: str, d: str) -> Dict[str, Any]:
+    """Current position, caught up with the files. Caller holds the user's "changes" lock."""
+    segs = _segments(d)
+    if not segs:
+        head = {"seq": 0, "seg": 1, "seg_count": 0, "seg_bytes": 0}
+    else:
+        head = _heads.get(user)
+        path = _seg_path(d, segs[-1])
+        size = _size(path)
+        if head is None or head["seg"] != segs[-1] or size < head["seg_bytes"]:
+            head = {"seq": segs[-1] - 1, "seg": segs[-1], "seg_count": 0, "seg_bytes": 0}
+        if size > head["seg_bytes"]:
+            with open(path, "rb") as f:
+                f.seek(head["seg_bytes"])
+                raw = f.read()
+            good = raw.rfind(b"\n") + 1
+            if good < len(raw):  # torn by a crash mid-append
+                with open(path, "r+b") as f:
+                    f.truncate(head["seg_bytes"] + good)
+            for line in raw[:good].splitlines():
+                try:
+                    head["seq"] = decode_doc(line)["seq"]
+                except (ValueError, KeyError, TypeError):
+                    continue
+                head["seg_count"] += 1
+            head["seg_bytes"] += good
+    head["floor"] = segs[0] - 1 if segs else 0
+    _heads[user] = head
+    return head
+
+def _prune(d: str, head: Dict[str, Any]):
+    """Called as head["seg"] opens: keep it plus the newest CHANGES_KEEP_SEGMENTS - 1 closed segments."""
+    segs = _segments(d)
+    cut = max(0, len(segs) - max(0, CHANGES_KEEP_SEGMENTS - 1))
+    for first in segs[:cut]:
+        os.remove(_seg_path(d, first))
+    if cut:
+        head["floor"] = (segs[cut] if cut < len(segs) else head["seg"]) - 1
+
+# ----------------------------
+# Writing (item watchers)
+# ----------------------------
+def record(user_email: str, entries: List[Dict[str, Any]]) -> int:
+    """Append {"entity", "id", "op"} entries to a user's log, numbering them; returns the last seq."""
+    user = _norm_user(user_email)
+    d = _log_dir(user)
+    at = datetime.datetime.utcnow().isoformat() + "Z"
+    with bucket_lock("changes", user):
+        head = _head(user, d)
+        os.makedirs(d, exist_ok=True)
+        while entries:
+            if head["seg_count"] >= CHANGES_SEGMENT_ENTRIES:
+                head.update(seg=head["seq"] + 1, seg_count=0, seg_bytes=0)
+                _prune(d, head)
+            room = CHANGES_SEGMENT_ENTRIES - head["seg_count"]
+            chunk, entries = entries[:room], entries[room:]
+            lines = []
+            for e in chunk:
+                head["seq"] += 1
+                lines.append(encode_doc(dict(e, seq=head["seq"], at=at), "compact") + b"\n")
+            raw = b"".join(lines)
+            with open(_seg_path(d, head["seg"]), "ab") as f:
+                f.write(raw)
+                f.flush()
+                if CHANGES_FSYNC:
+                    os.fsync(f.fileno())
+            head["seg_bytes"] += len(raw)
+            head["seg_count"] += len(chunk)
+        return head["seq"]
+
+def _watcher(entity: str):
+    def on_change(user: str, changes: list):
+        entries = []
+        for old, new in changes:
+            item = new if new is not None else old
+            entries.append({"entity": entity, "id": str(item.get("id")),
+                            "op": "delete" if new is None else "upsert"})
+        if entries:
+            after_commit(lambda: record(user, entries))
+    on_change.__name__ = f"changes_{entity}"
+    return on_change
+
+for _entity in FEED_ENTITIES:
+    watch_items(_entity, _watcher(_entity))
+
+# ----------------------------
+# Reading
+# ----------------------------
+def _head_view(user: str) -> Dict[str, Any]:
+    with bucket_lock("changes", user):
+        return dict(_head(user, _log_dir(user)))
+
+def current_seq(user_email: str) -> int:
+    return int(_head_view(_norm_user(user_email))["seq"])
+
+def changes_since(user_email: str, since: Optional[int], limit: int = DEFAULT_LIMIT,
+                  entities: Optional[List[str]] = None) -> Dict[str, Any]:
+    """
+    {"changes", "cursor", "more", "reset"}: at most `limit` log entries after
+    `since`, collapsed to the newest per (entity, id) and resolved against the
+    buckets. Pass the returned cursor as the next `since`.
+    """
+    user = _norm_user(user_email)
+    d = _log_dir(user)
+    head = _head_view(user)
+    if since is None or since < head["floor"] or since > head["seq"]:
+        return {"changes": [], "cursor": head["seq"], "more": False, "reset": True}
+    segs = _segments(d)
+    start = max((i for i, first in enumerate(segs) if first <= since + 1), default=0)
+    picked: List[Dict[str, Any]] = []
+    cursor, more = since, False
+    for first in segs[start:]:
+        for e in _read_lines(_seg_path(d, first)):
+            if e["seq"] <= since:
+                continue
+            if len(picked) == limit:
+                more = True
+                break
+            picked.append(e)
+            cursor = e["seq"]
+        if more:
+            break
+    head = _head_view(user)
+    if since < head["floor"]:  # pruned while we read
+        return {"changes": [], "cursor": head["seq"], "more": False, "reset": True}
+
+    latest: Dict[tuple, Dict[str, Any]] = {}
+    for e in picked:
+        if entities and e["entity"] not in entities:
+            continue
+        latest.pop((e["entity"], e["id"]), None)
+        latest[(e["entity"], e["id"])] = e  # re-insert: ordered by its newest seq
+    out = []
+    for (entity, iid), e in latest.items():
+        item = item_index(entity, user).get(iid) if e["op"] == "upsert" else None
+        change = {"seq": e["seq"], "entity": entity, "id": iid, "op": "upsert" if item is not None else "delete"}
+        if item is not None:
+            change["item"] = item
+        out.append(change)
+    return {"changes": out, "cursor": cursor, "more": more, "reset": False}
+
+# ----------------------------
+# Routes
+# ----------------------------
+@changes_bp.get("/api/changes/<path:user_email>")
+def get_changes(user_email):
+    try:
+        since = int(request.args.get("since") or 0)
+        limit = max(1, min(int(request.args.get("limit", DEFAULT_LIMIT)), MAX_LIMIT))
+    except ValueError:
+        return jsonify({"error": "since/limit must be integers"}), 400
+    entities = [e for e in (request.args.get("entities") or "").split(",") if e.strip()]
+    bad = [e for e in entities if e not in FEED_ENTITIES]
+    if bad:
+        return jsonify({"error": f"unknown entities: {', '.join(bad)}"}), 400
+    return jsonify(changes_since(user_email, since, limit=limit, entities=entities or None)), 200
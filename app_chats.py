@@ -0,0 +1,318 @@
+# backend/app_chats.py
+# ======================================
+# WhatsApp chat threads, one directory per (user, lead):
+#
+#   CHAT_THREADS_DIR/<sha1(user_email)>/<sha1(lead_id)>/
+#       seg-000000.jsonl   append-only, one message per line
+#       seg-000001.jsonl   (a new segment every CHAT_SEGMENT_MESSAGES messages)
+#       head.json          {"count", "last_inbound", "last_at", "last_from", "last_preview", ...}
+#
+# Appending a message writes one line to the current segment and rewrites
+# the small header — no other thread (or tenant) is read or written. The
+# header also records the segment's byte size; if that disagrees with the
+# file (crash between the two writes, torn line) the header is rebuilt from
+# the segments on the next append.
+#
+# Threads still in the legacy "chats" entity (whatsapp_chats.json /
+# shards / sqlite rows) are read from there until their first append, which
+# moves them over; `python app_chats.py migrate` moves everything at once.
+import os, sys
+from typing import Any, Dict, Iterator, List, Optional
+
+from app_storage import (DATA_DIR, load_json, load_json_view, save_json, remove_json, encode_doc, decode_doc,
+                         load_entity, view_bucket, delete_bucket, remove_item, bucket_lock, bucket_etag, shard_name, thaw)
+
+CHAT_THREADS_DIR      = os.getenv("CHAT_THREADS_DIR", os.path.join(DATA_DIR, "threads"))
+CHAT_SEGMENT_MESSAGES = int(os.getenv("CHAT_SEGMENT_MESSAGES", "1000"))
+CHAT_FSYNC            = os.getenv("CHAT_FSYNC", "1") == "1"
+PREVIEW_CHARS         = 120
+
+# ----------------------------
+# Layout
+# ----------------------------
+def _norm_user(user_email: str) -> str:
+    return (user_email or "").strip().lower()
+
+def _h(s: str) -> str:
+    return shard_name(s)[:-5]
+
+def _thread_dir(user: str, lead: str) -> str:
+    return os.path.join(CHAT_THREADS_DIR, _h(user), _h(lead))
+
+def _head_path(d: str) -> str:
+    return os.path.join(d, "head.json")
+
+def _seg_path(d: str, i: int) -> str:
+    return os.path.join(d, f"seg-{i:06d}.jsonl")
+
+def _segments(d: str) -> List[str]:
+    try:
+        return sorted(os.path.join(d, f) for f in os.listdir(d) if f.startswith("seg-") and f.endswith(".jsonl"))
+    except FileNotFoundError:
+        return []
+
+def _lock_key(user: str, lead: str) -> str:
+    return f"{user}\n{lead}"
+
+def _size(path: str) -> int:
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
+
+# ----------------------------
+# Header
+# ----------------------------
+def _empty_head(user: str, lead: str) -> Dict[str, Any]:
+    return {"user": user, "lead": lead, "count": 0, "seg": 0, "seg_count": 0, "seg_bytes": 0,
+            "last_at": None, "last_from": None, "last_inbound": None, "last_preview": ""}
+
+def _note(head: Dict[str, Any], msg: Dict[str, Any]):
+    head["count"] += 1
+    head["seg_count"] += 1
+    head["last_at"] = msg.get("time")
+    head["last_from"] = msg.get("from")
+    head["last_preview"] = str(msg.get("text") or "")[:PREVIEW_CHARS]
+    if msg.get("from") == "lead":
+        head["last_inbound"] = msg.get("time")
+
+def _read_lines(path: str) -> List[Dict[str, Any]]:
+    out = []
+    try:
+        with open(path, "rb") as f:
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break  # append in progress / torn by a crash
+                try:
+                    out.append(decode_doc(line))
+                except ValueError:
+                    continue
+    except FileNotFoundError:
+        pass
+    return out
+
+def _rebuild_head(user: str, lead: str, d: str) -> Dict[str, Any]:
+    """Recount from the segments, dropping a torn trailing line. Caller holds the thread lock."""
+    head = _empty_head(user, lead)
+    segs = _segments(d)
+    for i, path in enumerate(segs):
+        with open(path, "rb") as f:
+            raw = f.read()
+        good = raw.rfind(b"\n") + 1
+        if good < len(raw):
+            with open(path, "r+b") as f:
+                f.truncate(good)
+        msgs = _read_lines(path)
+        head["seg"], head["seg_count"], head["seg_bytes"] = i, 0, good
+        for m in msgs:
+            _note(head, m)
+    if segs:
+        head["seg"] = int(os.path.basename(segs[-1])[4:10])
+    return head
+
+def _legacy_thread(user: str, lead: str) -> Optional[list]:
+    bucket = view_bucket("chats", user) or {}
+    msgs = bucket.get(lead) if isinstance(bucket, dict) else None
+    return thaw(msgs) if isinstance(msgs, list) else None
+
+def _load_head(user: str, lead: str, d: str) -> Dict[str, Any]:
+    """Current header for an append: repaired if stale, legacy thread imported if not yet moved."""
+    head = load_json(_head_path(d), {})
+    if head:
+        if _size(_seg_path(d, head.get("seg", 0))) != head.get("seg_bytes", 0):
+            head = _rebuild_head(user, lead, d)
+        return head
+    if _segments(d):
+        return _rebuild_head(user, lead, d)
+    head = _empty_head(user, lead)
+    legacy = _legacy_thread(user, lead)
+    if legacy:
+        _write(d, head, legacy)
+        remove_item("chats", user, lead)
+    return head
+
+def _write(d: str, head: Dict[str, Any], msgs: List[Dict[str, Any]]):
+    """Append messages to the thread's segments, rolling as needed; updates `head` in place."""
+    os.makedirs(d, exist_ok=True)
+    while msgs:
+        if head["seg_count"] >= CHAT_SEGMENT_MESSAGES:
+            head["seg"] += 1
+            head["seg_count"] = head["seg_bytes"] = 0
+        room = CHAT_SEGMENT_MESSAGES - head["seg_count"]
+        chunk, msgs = msgs[:room], msgs[room:]
+        raw = b"".join(encode_doc(m, "compact") + b"\n" for m in chunk)
+        with open(_seg_path(d, head["seg"]), "ab") as f:
+            f.write(raw)
+            f.flush()
+            if CHAT_FSYNC:
+                os.fsync(f.fileno())
+        head["seg_bytes"] += len(raw)
+        for m in chunk:
+            _note(head, m)
+
+# ----------------------------
+# Message watchers
+# ----------------------------
+# Derived data (analytics counters, ...) registers watch_messages(fn) rather
+# than hooking the webhook and send paths: fn(user, lead, msg) runs under the
+# thread lock after each append_message. Moves and migrations don't notify.
+_watchers: list = []
+
+def watch_messages(fn):
+    _watchers.append(fn)
+
+def _notify_watchers(user: str, lead: str, msg: Dict[str, Any]):
+    for fn in _watchers:
+        try:
+            fn(user, lead, msg)
+        except Exception as e:  # derived data must never fail the append it follows
+            print(f"[CHATS] message watcher {getattr(fn, '__name__', fn)} failed: {e}", file=sys.stderr)
+
+# ----------------------------
+# API
+# ----------------------------
+def append_message(user_email: str, lead_id: Any, msg: Dict[str, Any]) -> Dict[str, Any]:
+    """Append one message to a thread; returns the updated header."""
+    user, lead = _norm_user(user_email), str(lead_id or "")
+    d = _thread_dir(user, lead)
+    with bucket_lock("threads", _lock_key(user, lead)):
+        head = _load_head(user, lead, d)
+        _write(d, head, [msg])
+        save_json(_head_path(d), head)
+        _notify_watchers(user, lead, msg)
+    return head
+
+def thread_header(user_email: str, lead_id: Any) -> Optional[Dict[str, Any]]:
+    """Read-only header (count, last inbound, last preview), or None for an unknown thread."""
+    user, lead = _norm_user(user_email), str(lead_id or "")
+    head = load_json_view(_head_path(_thread_dir(user, lead)), {})
+    if head:
+        return head
+    legacy = _legacy_thread(user, lead)
+    if not legacy:
+        return None
+    head = _empty_head(user, lead)
+    for m in legacy:
+        _note(head, m)
+    return head
+
+def thread_etag(user_email: str, lead_id: Any) -> str:
+    """Validator for read_thread(): the header's segment position and last message move with every append."""
+    user, lead = _norm_user(user_email), str(lead_id or "")
+    head = load_json_view(_head_path(_thread_dir(user, lead)), {})
+    if not head:
+        return bucket_etag("chats", user, lead)  # legacy (or no) thread
+    return bucket_etag("threads", _lock_key(user, lead), head.get("seg"), head.get("seg_bytes"), head.get("count"),
+                       head.get("last_at"), head.get("last_preview"))
+
+def read_thread(user_email: str, lead_id: Any, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+    """Messages oldest first; with `limit`, only the newest `limit` (reading just the tail segments)."""
+    user, lead = _norm_user(user_email), str(lead_id or "")
+    segs = _segments(_thread_dir(user, lead))
+    if not segs:
+        msgs = _legacy_thread(user, lead) or []
+        return msgs[-limit:] if limit else msgs
+    out: List[Dict[str, Any]] = []
+    for path in reversed(segs):
+        out = _read_lines(path) + out
+        if limit and len(out) >= limit:
+            return out[-limit:]
+    return out
+
+def iter_thread(user_email: str, lead_id: Any) -> Iterator[Dict[str, Any]]:
+    """Messages oldest first, one line at a time (no segment is held whole); stops at a torn tail."""
+    user, lead = _norm_user(user_email), str(lead_id or "")
+    segs = _segments(_thread_dir(user, lead))
+    if not segs:
+        yield from _legacy_thread(user, lead) or []
+        return
+    for path in segs:
+        try:
+            with open(path, "rb") as f:
+                for line in f:
+                    if not line.endswith(b"\n"):
+                        return  # append in progress
+                    try:
+                        yield decode_doc(line)
+                    except ValueError:
+                        continue
+        except FileNotFoundError:
+            return  # thread deleted under us
+
+def thread_ids(user_email: str) -> List[str]:
+    """Lead ids of every thread a user has, moved or still in the legacy entity."""
+    user = _norm_user(user_email)
+    root = os.path.join(CHAT_THREADS_DIR, _h(user))
+    ids = []
+    if os.path.isdir(root):
+        for name in sorted(os.listdir(root)):
+            head = load_json_view(_head_path(os.path.join(root, name)), {})
+            if head and head.get("lead") is not None:
+                ids.append(str(head["lead"]))
+    legacy = view_bucket("chats", user) or {}
+    if isinstance(legacy, dict):
+        moved = set(ids)
+        ids += [str(k) for k in legacy if str(k) not in moved]
+    return ids
+
+def last_inbound(user_email: str, lead_id: Any) -> Optional[str]:
+    head = thread_header(user_email, lead_id)
+    return head.get("last_inbound") if head else None
+
+def list_threads(user_email: str) -> List[Dict[str, Any]]:
+    """Headers of a user's threads, most recent activity first."""
+    root = os.path.join(CHAT_THREADS_DIR, _h(_norm_user(user_email)))
+    heads = []
+    if os.path.isdir(root):
+        for name in os.listdir(root):
+            head = load_json_view(_head_path(os.path.join(root, name)), {})
+            if head:
+                heads.append(head)
+    return sorted(heads, key=lambda h: h.get("last_at") or "", reverse=True)
+
+def delete_thread(user_email: str, lead_id: Any):
+    user, lead = _norm_user(user_email), str(lead_id or "")
+    d = _thread_dir(user, lead)
+    with bucket_lock("threads", _lock_key(user, lead)):
+        remove_json(_head_path(d))
+        for path in _segments(d):
+            os.remove(path)
+        try:
+            os.rmdir(d)
+        except OSError:
+            pass
+        if _legacy_thread(user, lead) is not None:
+            remove_item("chats", user, lead)
+
+# ----------------------------
+# Migration: legacy "chats" entity -> thread directories
+# ----------------------------
+def migrate_legacy_chats() -> Dict[str, int]:
+    """Move every thread out of the legacy entity; returns {user: threads moved}."""
+    moved = {}
+    for key, threads in load_entity("chats").items():
+        if not isinstance(threads, dict):
+            continue
+        user = _norm_user(key)
+        for lead, msgs in threads.items():
+            lead = str(lead)
+            d = _thread_dir(user, lead)
+            with bucket_lock("threads", _lock_key(user, lead)):
+                if load_json(_head_path(d), {}) or _segments(d):
+                    continue  # already moved (its legacy copy is stale)
+                head = _empty_head(user, lead)
+                _write(d, head, list(msgs or []))
+                save_json(_head_path(d), head)
+            moved[user] = moved.get(user, 0) + 1
+        delete_bucket("chats", key)
+    return moved
+
+if __name__ == "__main__":
+    if sys.argv[1:] != ["migrate"]:
+        print("usage: python app_chats.py migrate")
+        sys.exit(2)
+    counts = migrate_legacy_chats()
+    for user, n in counts.items():
+        print(f"[CHATS] {user or '(unknown sender)'}: {n} thread(s) -> {CHAT_THREADS_DIR}")
+    if not counts:
+        print("[CHATS] no legacy chats to migrate")
@@ -0,0 +1,612 @@
+# backend/app_csv_import.py
+# ======================================
+# CSV contact import (ImportContacts.jsx):
+#
+#   POST /api/import/csv/preview           multipart "file" (or a raw text/csv body)
+#        -> {import_id, mapping, columns, rows: [first CSV_PREVIEW_ROWS], total_rows,
+#            preview_count, valid_rows, duplicate_rows}
+#   POST /api/import/csv/commit            {import_id, skip_rows: [row numbers], mapping?, background?}
+#                                          (or the legacy {rows: [...]} of preview rows)
+#        -> {summary: {imported, merged, skipped, invalid, total_after}}
+#   GET  /api/import/csv/status/<import_id> -> progress of a running / finished commit
+#
+# The upload is staged to IMPORTS_DIR/<sha1(user)>/<import_id>.csv and read
+# back with csv.reader one row at a time, so neither step holds the file in
+# memory. The column mapping comes from the header names, falling back to
+# the sampled values (a column of e-mail or phone-looking cells) and to no
+# header at all when the first row is already data.
+#
+# Rows dedupe against an email / phone index of the user's leads (a
+# derived_index view, kept in step with lead writes) and against earlier rows
+# of the same file: a match merges the row into that lead (missing fields,
+# extra emails/phones, tags) instead of creating another one. Phones are
+# normalized with norm_wa, the same form the WhatsApp routing index uses.
+#
+# A commit records its owner (host, pid) and checkpoints the counts after
+# every chunk that lands. A "committing" import whose owner process is gone,
+# or that has not checkpointed for CSV_COMMIT_STALE_SECONDS, can be committed
+# again, as can a failed one: the retry resumes after the last checkpoint.
+# Rows of a chunk that landed just before the crash are read again; the
+# dedupe index merges them into the leads they created (a row with neither
+# email nor phone is the one thing that can come back twice).
+#
+# Commit writes in chunks of CSV_COMMIT_CHUNK rows, one upsert_items per chunk
+# under the leads lock carrying only the leads the chunk created or changed,
+# and checkpoints after each. Memory stays bounded by the chunk. The write
+# itself is one log record with STORAGE_WAL=leads; the json and sqlite
+# backends store a tenant's leads as one document and still rewrite it per
+# chunk.
+import os, re, csv, json, time, socket, datetime, threading
+from contextlib import closing
+from itertools import islice
+from uuid import uuid4
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from flask import Blueprint, request, jsonify
+
+from app_storage import (DATA_DIR, load_json, save_json, remove_json, bucket_lock, upsert_items, item_index,
+                         derived_index, shard_name, thaw, write_batch, write_through)
+from app_wa_numbers import norm_wa
+
+csv_import_bp = Blueprint("csv_import_bp", __name__)
+
+IMPORTS_DIR          = os.getenv("IMPORTS_DIR", os.path.join(DATA_DIR, "imports"))
+CSV_PREVIEW_ROWS     = int(os.getenv("CSV_PREVIEW_ROWS", "200"))
+CSV_SAMPLE_ROWS      = 500         # rows looked at for value-based column detection
+CSV_COMMIT_CHUNK     = int(os.getenv("CSV_COMMIT_CHUNK", "5000"))
+CSV_IMPORT_MAX_BYTES = int(os.getenv("CSV_IMPORT_MAX_BYTES", str(100 * 1024 * 1024)))
+CSV_STAGED_TTL_HOURS = int(os.getenv("CSV_STAGED_TTL_HOURS", "24"))
+CSV_COMMIT_STALE_SECONDS = int(os.getenv("CSV_COMMIT_STALE_SECONDS", "300"))  # no progress for this long: committer is gone
+IMPORT_TAG           = "Imported"  # same tag the Google import puts on new leads
+
+_EMAIL_RE = re.compile(r"^[^@\s,;]+@[^@\s,;]+\.[^@\s,;]+$")
+_PHONE_RE = re.compile(r"^\+?[\d\s().-]{7,}$")
+_SPLIT_RE = re.compile(r"[;,|\n]| ::: ")  # multi-value cells ("a@x.com; b@y.com", Google's " ::: ")
+
+# header patterns, first match wins (title before company: "Organization 1 - Title")
+_HEADER_PATTERNS = [
+    ("first_name", re.compile(r"^(first|given)[ _-]?name$")),
+    ("last_name",  re.compile(r"^(last|family)[ _-]?name$|^surname$")),
+    ("email",      re.compile(r"e-?mail")),
+    ("phone",      re.compile(r"phone|mobile|cell|^tel|whats ?app")),
+    ("title",      re.compile(r"title|position|^role$")),
+    ("company",    re.compile(r"company|organi[sz]ation|^org$|business|employer")),
+    ("notes",      re.compile(r"note|comment|description|^bio")),
+    ("tags",       re.compile(r"tag|label|group")),
+    ("name",       re.compile(r"name|^contact$")),
+]
+_SINGLE = ("first_name", "last_name", "name", "company", "title", "notes")
+FIELDS = ("name", "first_name", "last_name", "email", "phone", "company", "title", "notes", "tags")
+
+class ImportStateError(Exception):
+    """The import is not in a state that allows the request (already committing or done)."""
+
+# ----------------------------
+# Staging
+# ----------------------------
+def _user_dir(user: str) -> str:
+    return os.path.join(IMPORTS_DIR, shard_name(user)[:-5])
+
+def _csv_path(user: str, import_id: str) -> str:
+    return os.path.join(_user_dir(user), f"{import_id}.csv")
+
+def _meta_path(user: str, import_id: str) -> str:
+    return os.path.join(_user_dir(user), f"{import_id}.json")
+
+def _valid_id(import_id: Any) -> bool:
+    return bool(re.fullmatch(r"[0-9a-f]{32}", str(import_id or "")))
+
+def _save_meta(user: str, meta: Dict[str, Any]):
+    meta["updated_at"] = datetime.datetime.utcnow().isoformat() + "Z"
+    with write_through():  # progress must be visible to other workers now, not at the end of this request
+        save_json(_meta_path(user, meta["import_id"]), meta)
+
+def _sweep(user: str):
+    """Drop staged uploads (and their status files) older than CSV_STAGED_TTL_HOURS."""
+    cutoff = time.time() - CSV_STAGED_TTL_HOURS * 3600
+    d = _user_dir(user)
+    try:
+        names = os.listdir(d)
+    except FileNotFoundError:
+        return
+    for name in names:
+        path = os.path.join(d, name)
+        try:
+            if os.path.getmtime(path) >= cutoff:
+                continue
+            if name.endswith(".csv"):
+                os.remove(path)
+            elif name.endswith(".json"):
+                remove_json(path)
+        except OSError:
+            pass
+
+def _stage(user: str, stream, limit: int) -> Tuple[str, int]:
+    """Copy an upload stream to a new staged file in 1 MB blocks; returns (import_id, bytes)."""
+    import_id = uuid4().hex
+    os.makedirs(_user_dir(user), exist_ok=True)
+    path, size = _csv_path(user, import_id), 0
+    with open(path, "wb") as out:
+        while True:
+            block = stream.read(1 << 20)
+            if not block:
+                break
+            size += len(block)
+            if size > limit:
+                out.close()
+                os.remove(path)
+                raise ValueError(f"file larger than {limit // (1024 * 1024)} MB")
+            out.write(block)
+    return import_id, size
+
+# ----------------------------
+# Parsing
+# ----------------------------
+def _open_rows(path: str, delimiter: str) -> Iterable[List[str]]:
+    with open(path, "r", encoding="utf-8-sig", errors="replace", newline="") as f:
+        for row in csv.reader(f, delimiter=delimiter):
+            if any(cell.strip() for cell in row):
+                yield row
+
+def _sniff(path: str) -> str:
+    with open(path, "r", encoding="utf-8-sig", errors="replace", newline="") as f:
+        sample = f.read(64 * 1024)
+    try:
+        return csv.Sniffer().sniff(sample, delimiters=",;\t|").delimiter
+    except csv.Error:
+        return ","
+
+def _split_values(cell: str) -> List[str]:
+    return [v.strip() for v in _SPLIT_RE.split(cell or "") if v.strip()]
+
+def _looks(kind: str, values: List[str]) -> bool:
+    vals = [v for cell in values for v in _split_values(cell)]
+    if not vals:
+        return False
+    rx = _EMAIL_RE if kind == "email" else _PHONE_RE
+    return sum(1 for v in vals if rx.match(v) and (kind == "email" or len(re.sub(r"\D", "", v)) >= 7)) >= 0.6 * len(vals)
+
+def detect_mapping(first: List[str], sample: List[List[str]]) -> Tuple[bool, List[str], Dict[str, List[int]]]:
+    """(has_header, column names, field -> column indexes) from the first row and a sample of the rest."""
+    has_header = not any(_EMAIL_RE.match(c.strip()) or (_PHONE_RE.match(c.strip()) and len(re.sub(r"\D", "", c)) >= 7)
+                         for c in first)
+    rows = sample if has_header else [first] + sample
+    width = max([len(first)] + [len(r) for r in rows])
+    columns = [(first[i].strip() if has_header and i < len(first) else "") or f"Column {i + 1}" for i in range(width)]
+    mapping: Dict[str, List[int]] = {}
+    taken = set()
+    if has_header:
+        for i, col in enumerate(columns):
+            h = col.lower().strip()
+            if ("type" in h or "label" in h) and ("phone" in h or "mail" in h):
+                continue  # Google/Outlook "Phone 1 - Type", "E-mail 1 - Label"
+            for field, rx in _HEADER_PATTERNS:
+                if rx.search(h):
+                    if field in _SINGLE and field in mapping:
+                        break
+                    mapping.setdefault(field, []).append(i)
+                    taken.add(i)
+                    break
+    for i in range(width):
+        if i in taken:
+            continue
+        values = [r[i] for r in rows[:CSV_SAMPLE_ROWS] if i < len(r) and r[i].strip()]
+        for kind in ("email", "phone"):
+            if _looks(kind, values):
+                mapping.setdefault(kind, []).append(i)
+                taken.add(i)
+                break
+    if not has_header and "name" not in mapping:  # bare "name,email,phone" exports: first text column
+        for i in range(width):
+            if i not in taken and any(i < len(r) and r[i].strip() for r in rows[:CSV_SAMPLE_ROWS]):
+                mapping["name"] = [i]
+                break
+    return has_header, columns, mapping
+
+def _mapping_by_name(columns: List[str], named: Dict[str, Any]) -> Dict[str, List[int]]:
+    """Client override {field: column name | [names]} -> field -> indexes (unknown names ignored)."""
+    index = {c: i for i, c in enumerate(columns)}
+    out: Dict[str, List[int]] = {}
+    for field, cols in (named or {}).items():
+        if field not in FIELDS:
+            continue
+        for c in cols if isinstance(cols, list) else [cols]:
+            if c in index:
+                out.setdefault(field, []).append(index[c])
+    return out
+
+def _mapping_names(columns: List[str], mapping: Dict[str, List[int]]) -> Dict[str, List[str]]:
+    return {field: [columns[i] for i in idx] for field, idx in mapping.items()}
+
+def to_record(row: List[str], mapping: Dict[str, List[int]]) -> Dict[str, Any]:
+    """One CSV row as {name, emails, phones, company, title, notes, tags} (phones norm_wa'd)."""
+    def cells(field):
+        return [row[i].strip() for i in mapping.get(field, ()) if i < len(row) and row[i].strip()]
+    emails, phones, tags = [], [], []
+    for cell in cells("email"):
+        for v in _split_values(cell):
+            v = v.lower()
+            if _EMAIL_RE.match(v) and v not in emails:
+                emails.append(v)
+    for cell in cells("phone"):
+        for v in _split_values(cell):
+            p = norm_wa(v)
+            if len(p) >= 7 and p not in phones:
+                phones.append(p)
+    for cell in cells("tags"):
+        for v in _split_values(cell):
+            if v not in tags and not v.startswith("* "):  # Google's "* myContacts" system groups
+                tags.append(v)
+    name = " ".join(cells("name")) or " ".join(cells("first_name") + cells("last_name"))
+    return {"name": name, "emails": emails, "phones": phones, "company": " ".join(cells("company")),
+            "title": " ".join(cells("title")), "notes": "\n".join(cells("notes")), "tags": tags}
+
+def _valid(rec: Dict[str, Any]) -> bool:
+    return bool(rec.get("name") or rec.get("emails") or rec.get("phones"))
+
+# ----------------------------
+# Dedupe index (derived view on the leads bucket)
+# ----------------------------
+def lead_keys(lead: Any) -> set:
+    if not isinstance(lead, dict):
+        return set()
+    keys = set()
+    for e in [lead.get("email")] + list(lead.get("emails") or []):
+        if isinstance(e, str) and e.strip():
+            keys.add("e:" + e.strip().lower())
+    for p in [lead.get("phone"), lead.get("whatsapp")] + list(lead.get("phones") or []):
+        n = norm_wa(p)
+        if len(n) >= 7:
+            keys.add("p:" + n)
+    return keys
+
+def record_keys(rec: Dict[str, Any]) -> List[str]:
+    return ["e:" + e for e in rec["emails"]] + ["p:" + p for p in rec["phones"]]
+
+class DedupeIndex:
+    """"e:<email>" / "p:<phone>" -> ids of the leads carrying it."""
+    def __init__(self, items: Dict[str, Any]):
+        self.mu = threading.Lock()
+        self.ids: Dict[str, List[str]] = {}
+        for iid, lead in items.items():
+            for k in lead_keys(lead):
+                self.ids.setdefault(k, []).append(iid)
+
+    def apply(self, changes: list):
+        with self.mu:
+            for old, new in changes:
+                if old is not None:
+                    iid = str(old.get("id"))
+                    for k in lead_keys(old):
+                        ids = self.ids.get(k)
+                        if ids and iid in ids:
+                            ids.remove(iid)
+                            if not ids:
+                                del self.ids[k]
+                if new is not None:
+                    iid = str(new.get("id"))
+                    for k in lead_keys(new):
+                        ids = self.ids.setdefault(k, [])
+                        if iid not in ids:
+                            ids.append(iid)
+
+    def find(self, keys: Iterable[str]) -> Optional[str]:
+        with self.mu:
+            for k in keys:
+                ids = self.ids.get(k)
+                if ids:
+                    return ids[0]
+        return None
+
+def _dedupe_view(user: str) -> DedupeIndex:
+    return derived_index("leads", user, "dedupe", DedupeIndex)
+
+# ----------------------------
+# Merge / create
+# ----------------------------
+def _now_iso() -> str:
+    return datetime.datetime.utcnow().isoformat() + "Z"
+
+def new_lead(rec: Dict[str, Any]) -> Dict[str, Any]:
+    phone = rec["phones"][0] if rec["phones"] else ""
+    return {
+        "id": str(uuid4()),
+        "name": rec["name"] or (rec["emails"][0] if rec["emails"] else phone),
+        "email": rec["emails"][0] if rec["emails"] else "",
+        "emails": rec["emails"],
+        "phone": phone,
+        "phones": rec["phones"],
+        "whatsapp": phone,
+        "company": rec["company"] or None,
+        "title": rec["title"] or None,
+        "notes": rec["notes"] or None,
+        "tags": [IMPORT_TAG] + [t for t in rec["tags"] if t != IMPORT_TAG],
+        "source": "csv",
+        "createdAt": _now_iso(),
+        "updatedAt": _now_iso(),
+        "last_contacted": None,
+        "wa_opt_out": False,
+    }
+
+def merge_into(lead: Dict[str, Any], rec: Dict[str, Any]) -> bool:
+    """Fill `lead` (mutable) from a duplicate row; True if anything changed."""
+    before = json.dumps(lead, sort_keys=True, default=str)
+    emails = [e for e in [lead.get("email")] + list(lead.get("emails") or []) if e]
+    phones = list(dict.fromkeys(p for p in [lead.get("phone")] + list(lead.get("phones") or []) if p))
+    known = {norm_wa(p) for p in phones}
+    lead["emails"] = list(dict.fromkeys([e.lower() for e in emails] + rec["emails"]))
+    lead["phones"] = phones + [p for p in rec["phones"] if p not in known]
+    if not lead.get("email") and lead["emails"]:
+        lead["email"] = lead["emails"][0]
+    if not lead.get("phone") and lead["phones"]:
+        lead["phone"] = lead["phones"][0]
+    if not lead.get("whatsapp") and lead.get("phone"):
+        lead["whatsapp"] = lead["phone"]
+    for field in ("name", "company", "title", "notes"):
+        if not lead.get(field) and rec.get(field):
+            lead[field] = rec[field]
+    tags = list(lead.get("tags") or [])
+    lead["tags"] = tags + [t for t in rec["tags"] if t not in tags]
+    if json.dumps(lead, sort_keys=True, default=str) == before:
+        return False
+    lead["updatedAt"] = _now_iso()
+    return True
+
+# ----------------------------
+# Preview
+# ----------------------------
+def preview(user: str, stream, filename: str = "") -> Dict[str, Any]:
+    _sweep(user)
+    import_id, size = _stage(user, stream, CSV_IMPORT_MAX_BYTES)
+    path = _csv_path(user, import_id)
+    delimiter = _sniff(path)
+
+    with closing(_open_rows(path, delimiter)) as rows:  # closes the file before any os.remove below
+        first = next(rows, None)
+        sample = list(islice(rows, CSV_SAMPLE_ROWS))
+    if first is None:
+        os.remove(path)
+        raise ValueError("the file has no rows")
+    has_header, columns, mapping = detect_mapping(first, sample)
+    if not any(f in mapping for f in ("name", "first_name", "last_name", "email", "phone")):
+        os.remove(path)
+        raise ValueError("could not find a name, email or phone column")
+
+    dedupe = _dedupe_view(user)
+    seen, out = set(), []
+    total = valid = dupes = 0
+    for n, row in enumerate(_open_rows(path, delimiter)):
+        if n == 0 and has_header:
+            continue
+        total += 1
+        rec = to_record(row, mapping)
+        if not _valid(rec):
+            continue
+        valid += 1
+        keys = record_keys(rec)
+        dup = bool(dedupe.find(keys)) or any(k in seen for k in keys)
+        seen.update(keys)
+        dupes += dup
+        if len(out) < CSV_PREVIEW_ROWS:
+            out.append(dict(rec, row=total, duplicate=dup, selected=True))
+    meta = {"import_id": import_id, "user": user, "filename": filename, "bytes": size, "delimiter": delimiter,
+            "has_header": has_header, "columns": columns, "mapping": mapping, "total_rows": total,
+            "state": "previewed", "created_at": _now_iso()}
+    _save_meta(user, meta)
+    return {"import_id": import_id, "columns": columns, "mapping": _mapping_names(columns, mapping),
+            "has_header": has_header, "rows": out, "preview_count": len(out), "total_rows": total,
+            "valid_rows": valid, "duplicate_rows": dupes}
+
+# ----------------------------
+# Commit
+# ----------------------------
+def _apply_chunk(user: str, recs: List[Dict[str, Any]], counts: Dict[str, int]):
+    """Create / merge one chunk of records with a single write of the leads it touches."""
+    with write_batch(), bucket_lock("leads", user):  # index watchers' bucket writes land with the chunk
+        dedupe = _dedupe_view(user)
+        index = item_index("leads", user)
+        local: Dict[str, str] = {}  # keys of leads created or merged in this chunk
+        touched: Dict[str, Dict[str, Any]] = {}
+        for rec in recs:
+            keys = record_keys(rec)
+            lead_id = next((local[k] for k in keys if k in local), None) or dedupe.find(keys)
+            if lead_id is not None and (lead_id in touched or lead_id in index):
+                lead = touched.get(lead_id) or thaw(index.get(lead_id))
+                if merge_into(lead, rec):
+                    touched[lead_id] = lead
+                    counts["merged"] += 1
+                else:
+                    counts["skipped"] += 1
+            else:
+                lead = new_lead(rec)
+                lead_id = lead["id"]
+                touched[lead_id] = lead
+                counts["imported"] += 1
+            for k in keys:
+                local.setdefault(k, lead_id)
+        upsert_items("leads", user, list(touched.values()))
+        counts["total_after"] = len(item_index("leads", user))
+
+def _records(user: str, meta: Dict[str, Any], mapping: Dict[str, List[int]], skip: set,
+             counts: Dict[str, int]) -> Iterable[Dict[str, Any]]:
+    """Records of the rows past counts["processed"] (rows an interrupted commit already landed)."""
+    path, landed, row_no = _csv_path(user, meta["import_id"]), counts["processed"], 0
+    for n, row in enumerate(_open_rows(path, meta["delimiter"])):
+        if n == 0 and meta["has_header"]:
+            continue
+        row_no += 1
+        if row_no <= landed:
+            continue
+        counts["processed"] += 1
+        if counts["processed"] in skip:
+            counts["skipped"] += 1
+            continue
+        rec = to_record(row, mapping)
+        if not _valid(rec):
+            counts["invalid"] += 1
+            continue
+        yield rec
+
+def _run_commit(user: str, meta: Dict[str, Any], recs: Iterable[Dict[str, Any]], counts: Dict[str, int]):
+    chunk: List[Dict[str, Any]] = []
+    checkpoint = dict(counts)
+    with write_through():  # each chunk lands (and releases the leads lock) on its own
+        try:
+            for rec in recs:
+                chunk.append(rec)
+                if len(chunk) >= CSV_COMMIT_CHUNK:
+                    _apply_chunk(user, chunk, counts)
+                    chunk, checkpoint = [], dict(counts)
+                    meta.update(progress=checkpoint, checkpoint=checkpoint)
+                    if meta.get("import_id"):  # legacy row payloads have nothing to resume
+                        _save_meta(user, meta)
+            if chunk:
+                _apply_chunk(user, chunk, counts)
+            counts["total_after"] = len(item_index("leads", user))
+            meta.update(state="done", progress=dict(counts))
+        except Exception as e:
+            meta.update(state="failed", error=str(e), progress=dict(counts), checkpoint=checkpoint)
+            raise
+        finally:
+            if meta.get("import_id"):
+                _save_meta(user, meta)
+                if meta["state"] == "done":
+                    try:
+                        os.remove(_csv_path(user, meta["import_id"]))
+                    except OSError:
+                        pass
+
+def _new_counts(user: str) -> Dict[str, int]:
+    return {"processed": 0, "imported": 0, "merged": 0, "skipped": 0, "invalid": 0,
+            "total_after": len(item_index("leads", user))}
+
+def _abandoned(meta: Dict[str, Any]) -> bool:
+    """A "committing" import whose committer is gone: its process died, or it stopped checkpointing."""
+    owner = meta.get("owner") or {}
+    if owner.get("host") == socket.gethostname() and owner.get("pid"):
+        try:
+            os.kill(int(owner["pid"]), 0)
+        except ProcessLookupError:
+            return True
+        except (PermissionError, ValueError):
+            pass
+    try:
+        last = datetime.datetime.fromisoformat(str(meta.get("updated_at") or "").rstrip("Z"))
+    except ValueError:
+        return True
+    return (datetime.datetime.utcnow() - last).total_seconds() > CSV_COMMIT_STALE_SECONDS
+
+def start_commit(user: str, import_id: str, skip_rows: Iterable[Any] = (), mapping: Optional[Dict[str, Any]] = None,
+                 background: bool = False) -> Dict[str, Any]:
+    """
+    Commit a staged upload; returns the final counts, or the starting status
+    when `background`. A failed or abandoned commit resumes after its last
+    checkpoint (with the mapping it started with).
+    """
+    with bucket_lock("imports", import_id):
+        meta = load_json(_meta_path(user, import_id), {})
+        if not meta or meta.get("user") != user or not os.path.exists(_csv_path(user, import_id)):
+            raise LookupError("unknown or expired import_id")
+        state = meta.get("state")
+        if state == "done" or (state == "committing" and not _abandoned(meta)):
+            raise ImportStateError(f"import already {state}")
+        resume = meta.get("checkpoint") if state in ("committing", "failed") else None
+        if mapping and not resume:
+            meta["mapping"] = _mapping_by_name(meta["columns"], mapping)
+        meta.pop("error", None)
+        meta.update(state="committing", total_rows=meta.get("total_rows"),
+                    owner={"host": socket.gethostname(), "pid": os.getpid()})
+        _save_meta(user, meta)
+    counts = _new_counts(user)
+    if resume:
+        counts.update({k: int(resume.get(k) or 0) for k in ("processed", "imported", "merged", "skipped", "invalid")})
+    skip = {int(r) for r in skip_rows or () if str(r).isdigit()}
+    recs = _records(user, meta, meta["mapping"], skip, counts)
+    if not background:
+        _run_commit(user, meta, recs, counts)
+        return counts
+    threading.Thread(target=_run_commit, args=(user, meta, recs, counts), daemon=True,
+                     name=f"csv-import-{import_id[:8]}").start()
+    return {"import_id": import_id, "state": "committing", "total_rows": meta.get("total_rows")}
+
+def commit_rows(user: str, rows: List[Dict[str, Any]]) -> Dict[str, int]:
+    """Legacy payload: the preview rows themselves (already normalized), `selected` honoured."""
+    counts = _new_counts(user)
+    def recs():
+        for r in rows:
+            counts["processed"] += 1
+            if not isinstance(r, dict) or r.get("selected") is False:
+                counts["skipped"] += 1
+                continue
+            rec = {"name": str(r.get("name") or "").strip(),
+                   "emails": [e.strip().lower() for e in r.get("emails") or [] if _EMAIL_RE.match(str(e).strip())],
+                   "phones": [p for p in (norm_wa(x) for x in r.get("phones") or []) if len(p) >= 7],
+                   "company": str(r.get("company") or ""), "title": str(r.get("title") or ""),
+                   "notes": str(r.get("notes") or ""), "tags": [str(t) for t in r.get("tags") or []]}
+            if _valid(rec):
+                yield rec
+            else:
+                counts["invalid"] += 1
+    _run_commit(user, {}, recs(), counts)
+    return counts
+
+def import_status(user: str, import_id: str) -> Optional[Dict[str, Any]]:
+    meta = load_json(_meta_path(user, import_id), {})
+    if not meta or meta.get("user") != user:
+        return None
+    return {k: meta.get(k) for k in ("import_id", "state", "filename", "total_rows", "progress", "error",
+                                     "created_at", "updated_at")}
+
+# ----------------------------
+# Routes
+# ----------------------------
+def _user() -> str:
+    return (request.headers.get("X-User-Email") or request.args.get("user_email")
+            or (request.form.get("user_email") if request.form else None) or "").strip().lower()
+
+@csv_import_bp.post("/api/import/csv/preview")
+def csv_preview():
+    user = _user()
+    if not user:
+        return jsonify({"error": "X-User-Email header (or user_email) required"}), 400
+    upload = request.files.get("file")
+    if upload is None and not (request.mimetype or "").startswith("text/"):
+        return jsonify({"error": "upload a CSV as multipart field 'file'"}), 400
+    try:
+        res = preview(user, upload.stream if upload is not None else request.stream,
+                      filename=upload.filename if upload is not None else "")
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify(res), 200
+
+@csv_import_bp.post("/api/import/csv/commit")
+def csv_commit():
+    user = _user()
+    if not user:
+        return jsonify({"error": "X-User-Email header (or user_email) required"}), 400
+    body = request.get_json(force=True, silent=True) or {}
+    import_id = body.get("import_id")
+    if import_id:
+        if not _valid_id(import_id):
+            return jsonify({"error": "invalid import_id"}), 400
+        try:
+            res = start_commit(user, import_id, skip_rows=body.get("skip_rows") or (),
+                               mapping=body.get("mapping"), background=bool(body.get("background")))
+        except LookupError as e:
+            return jsonify({"error": str(e)}), 404
+        except ImportStateError as e:
+            return jsonify({"error": str(e)}), 409
+        if body.get("background"):
+            return jsonify(res), 202
+        return jsonify({"summary": res}), 200
+    rows = body.get("rows")
+    if not isinstance(rows, list):
+        return jsonify({"error": "import_id or rows required"}), 400
+    return jsonify({"summary": commit_rows(user, rows)}), 200
+
+@csv_import_bp.get("/api/import/csv/status/<import_id>")
+def csv_status(import_id):
+    user = _user()
+    status = import_status(user, import_id) if user and _valid_id(import_id) else None
+    if status is None:
+        return jsonify({"error": "unknown import_id"}), 404
+    return jsonify(status), 200
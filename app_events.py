@@ -0,0 +1,271 @@
+# backend/app_events.py
+# ======================================
+# Live event bus behind GET /api/notifications/stream (Server-Sent Events).
+#
+#   EVENTS_DIR/<sha1(user_email)>/seg-<first offset:012d>.log
+#       {"type", "data", "at"} per line, append-only
+#
+# publish() appends one line to the user's log (publish_later() once the
+# request's write batch has landed, so a failed write is never announced). An event's id is the
+# absolute byte offset just past its line, so ids grow across segments and
+# across gunicorn workers without a shared counter, and a Last-Event-ID is
+# exactly where a reconnecting stream resumes reading.
+#
+# Every worker runs one tailer thread for the users it has open streams for:
+# a stat of the user's newest segment every EVENTS_POLL_SECONDS (at once when
+# this process publishes) and a read of the bytes past each subscriber's
+# position. An event published by any worker reaches every worker's streams
+# through the file; nothing polls the API any more.
+#
+# The log is a live feed, not a record — the notifications entity is. It
+# rolls at EVENTS_SEGMENT_BYTES and keeps the newest EVENTS_KEEP_SEGMENTS; a
+# Last-Event-ID below that floor (or past the end of a wiped log) gets a
+# "reset" event: reload, then carry on from the id it carries.
+#
+# An open stream holds a worker thread for up to SSE_MAX_SECONDS, after which
+# the browser reconnects with Last-Event-ID; serve with a threaded or gevent
+# gunicorn worker class so streams don't starve the API.
+import os, sys, time, queue, datetime, threading
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
+
+from app_storage import DATA_DIR, encode_doc, decode_doc, file_lock, shard_name, after_commit
+
+EVENTS_DIR            = os.getenv("EVENTS_DIR", os.path.join(DATA_DIR, "events"))
+EVENTS_SEGMENT_BYTES  = int(os.getenv("EVENTS_SEGMENT_BYTES", str(1 << 20)))
+EVENTS_KEEP_SEGMENTS  = max(1, int(os.getenv("EVENTS_KEEP_SEGMENTS", "4")))
+EVENTS_POLL_SECONDS   = float(os.getenv("EVENTS_POLL_SECONDS", "0.5"))
+SSE_HEARTBEAT_SECONDS = float(os.getenv("SSE_HEARTBEAT_SECONDS", "15"))
+SSE_MAX_SECONDS       = float(os.getenv("SSE_MAX_SECONDS", "300"))
+SSE_RETRY_MS          = int(os.getenv("SSE_RETRY_MS", "3000"))
+
+Event = Tuple[int, str, Any]  # (id, type, data)
+
+# ----------------------------
+# Layout
+# ----------------------------
+def _norm_user(user_email: str) -> str:
+    return (user_email or "").strip().lower()
+
+def _log_dir(user: str) -> str:
+    return os.path.join(EVENTS_DIR, shard_name(user)[:-5])
+
+def _seg_path(d: str, first: int) -> str:
+    return os.path.join(d, f"seg-{first:012d}.log")
+
+def _segments(d: str) -> List[int]:
+    """First offset of each segment, ascending."""
+    try:
+        return sorted(int(f[4:16]) for f in os.listdir(d) if f.startswith("seg-") and f.endswith(".log"))
+    except FileNotFoundError:
+        return []
+
+def _size(path: str) -> int:
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
+
+def _bounds(d: str) -> Tuple[List[int], int, int]:
+    """(segments, floor, end): the offsets the log still holds are [floor, end]."""
+    segs = _segments(d)
+    if not segs:
+        return segs, 0, 0
+    return segs, segs[0], segs[-1] + _size(_seg_path(d, segs[-1]))
+
+def _seal(path: str) -> int:
+    """Size of a segment after cutting a line torn by a crash mid-append. Caller holds the log lock."""
+    size = _size(path)
+    if not size:
+        return 0
+    with open(path, "r+b") as f:
+        f.seek(size - 1)
+        if f.read(1) == b"\n":
+            return size
+        f.seek(0)
+        good = f.read().rfind(b"\n") + 1
+        f.truncate(good)
+        return good
+
+# ----------------------------
+# Writing
+# ----------------------------
+def publish(user_email: str, event_type: str, data: Any = None) -> int:
+    """Append one event to a user's live feed; returns its id (0 without a user)."""
+    user = _norm_user(user_email)
+    if not user:
+        return 0
+    d = _log_dir(user)
+    line = encode_doc({"type": event_type, "data": data,
+                       "at": datetime.datetime.utcnow().isoformat() + "Z"}, "compact") + b"\n"
+    os.makedirs(d, exist_ok=True)
+    with file_lock(os.path.join(d, "lock")):
+        segs = _segments(d)
+        first = segs[-1] if segs else 0
+        size = _seal(_seg_path(d, first))
+        if size >= EVENTS_SEGMENT_BYTES:
+            first, size = first + size, 0
+            for old in segs[:max(0, len(segs) + 1 - EVENTS_KEEP_SEGMENTS)]:
+                try:
+                    os.remove(_seg_path(d, old))
+                except FileNotFoundError:
+                    pass
+        with open(_seg_path(d, first), "ab") as f:
+            f.write(line)
+    _bus.wake()
+    return first + size + len(line)
+
+def publish_later(user_email: str, event_type: str, data: Any = None):
+    """publish() once the caller's write batch has landed (dropped if it fails)."""
+    after_commit(lambda: publish(user_email, event_type, data))
+
+# ----------------------------
+# Reading
+# ----------------------------
+def _read(d: str, segs: List[int], after: int) -> List[Event]:
+    """Complete events past offset `after`, oldest first."""
+    out: List[Event] = []
+    pos = after
+    for i, first in enumerate(segs):
+        nxt = segs[i + 1] if i + 1 < len(segs) else None
+        if nxt is not None and pos >= nxt:
+            continue
+        try:
+            with open(_seg_path(d, first), "rb") as f:
+                f.seek(max(0, pos - first))
+                raw = f.read()
+        except FileNotFoundError:
+            continue  # pruned under us
+        good = raw.rfind(b"\n") + 1
+        for line in raw[:good].splitlines(keepends=True):
+            pos += len(line)
+            try:
+                ev = decode_doc(line)
+                out.append((pos, str(ev["type"]), ev.get("data")))
+            except (ValueError, KeyError, TypeError):
+                continue
+        if good < len(raw):
+            break  # append in progress
+        if nxt is not None:
+            pos = nxt
+    return out
+
+# ----------------------------
+# Fan-out (one tailer per process)
+# ----------------------------
+class Subscription:
+    def __init__(self, user: str, pos: int):
+        self.user, self.pos = user, pos
+        self.queue: "queue.Queue[Event]" = queue.Queue()
+
+class _Bus:
+    def __init__(self):
+        self.mu = threading.Lock()
+        self.subs: Dict[str, Set[Subscription]] = {}
+        self._wake = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.stats = {"ticks": 0, "reads": 0, "delivered": 0}
+
+    def subscribe(self, user: str, last_id: Optional[int] = None) -> Subscription:
+        """New events only, or everything after last_id (the tailer replays it on its next pass)."""
+        sub = Subscription(user, _bounds(_log_dir(user))[2] if last_id is None else last_id)
+        with self.mu:
+            self.subs.setdefault(user, set()).add(sub)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="events-tailer", daemon=True)
+                self._thread.start()
+        self._wake.set()
+        return sub
+
+    def unsubscribe(self, sub: Subscription):
+        with self.mu:
+            subs = self.subs.get(sub.user)
+            if subs is not None:
+                subs.discard(sub)
+                if not subs:
+                    del self.subs[sub.user]
+
+    def wake(self):
+        if self.subs:
+            self._wake.set()
+
+    def _run(self):
+        while True:
+            self._wake.wait(EVENTS_POLL_SECONDS)
+            self._wake.clear()
+            with self.mu:
+                work = {user: list(subs) for user, subs in self.subs.items()}
+                if not work:
+                    self._thread = None  # the next subscribe starts a fresh one
+                    return
+            self.stats["ticks"] += 1
+            for user, subs in work.items():
+                try:
+                    self._deliver(user, subs)
+                except Exception as e:
+                    print(f"[EVENTS] tail of {user} failed: {e}", file=sys.stderr)
+
+    def _deliver(self, user: str, subs: List[Subscription]):
+        d = _log_dir(user)
+        segs, floor, end = _bounds(d)
+        behind = []
+        for sub in subs:
+            if sub.pos < floor or sub.pos > end:
+                sub.pos = end
+                sub.queue.put((end, "reset", None))
+            elif sub.pos < end:
+                behind.append(sub)
+        if not behind:
+            return
+        events = _read(d, segs, min(sub.pos for sub in behind))
+        self.stats["reads"] += 1
+        for sub in behind:
+            for ev in events:
+                if ev[0] > sub.pos:
+                    sub.queue.put(ev)
+                    sub.pos = ev[0]
+                    self.stats["delivered"] += 1
+
+_bus = _Bus()
+
+def subscribe(user_email: str, last_id: Optional[int] = None) -> Subscription:
+    return _bus.subscribe(_norm_user(user_email), last_id)
+
+def unsubscribe(sub: Subscription):
+    _bus.unsubscribe(sub)
+
+def bus_stats() -> Dict[str, int]:
+    with _bus.mu:
+        return dict(_bus.stats, users=len(_bus.subs), streams=sum(len(s) for s in _bus.subs.values()))
+
+# ----------------------------
+# SSE framing
+# ----------------------------
+def sse_event(ev: Event) -> str:
+    """Notifications go out as the default "message" event; anything else is named by its type."""
+    eid, etype, data = ev
+    head = f"id: {eid}\n" + ("" if etype == "notification" else f"event: {etype}\n")
+    return head + f"data: {encode_doc(data, 'compact').decode('utf-8')}\n\n"  # compact JSON is a single line
+
+def sse_stream(user_email: str, last_id: Optional[int] = None) -> Iterator[str]:
+    """
+    The body of one stream: the retry hint, then events as they are published,
+    with a comment line every SSE_HEARTBEAT_SECONDS of quiet (keeps proxies
+    from timing the connection out and surfaces a gone client as a write
+    error), until SSE_MAX_SECONDS have passed.
+    """
+    sub = subscribe(user_email, last_id)
+    try:
+        yield f"retry: {SSE_RETRY_MS}\n\n"
+        deadline = time.monotonic() + SSE_MAX_SECONDS
+        while True:
+            left = deadline - time.monotonic()
+            if left <= 0:
+                return
+            try:
+                ev = sub.queue.get(timeout=min(SSE_HEARTBEAT_SECONDS, left))
+            except queue.Empty:
+                yield ": ping\n\n"
+                continue
+            yield sse_event(ev)
+    finally:
+        unsubscribe(sub)
@@ -0,0 +1,139 @@
+# backend/app_export.py
+# ======================================
+# Tenant data export, streamed:
+#
+#   GET /api/export/<kind>/<user_email>?format=ndjson|csv&gzip=1
+#       kind: leads | notes | chats   (chats: every WhatsApp thread, one row per message)
+#
+# The body is produced by a generator behind a Flask Response, a row at a
+# time, and flushed in EXPORT_FLUSH_BYTES blocks (through a streaming
+# zlib compressor with gzip=1), so the response never exists in memory as
+# a whole, however large the tenant.
+#
+# No lock is held while streaming. Leads and notes are read from the
+# bucket's frozen view (the snapshot the read cache already holds; writers
+# replace it rather than mutate it), and chat segments are append-only
+# files read line by line, so writers carry on while an export runs and
+# the export sees each bucket as of the moment it started reading it.
+import io, csv, json, zlib, datetime
+from typing import Any, Dict, Iterable, Iterator, List
+from flask import Blueprint, Response, request, jsonify
+
+from app_storage import view_bucket
+from app_chats import iter_thread, thread_ids
+
+export_bp = Blueprint("export_bp", __name__)
+
+EXPORT_FLUSH_BYTES = 64 * 1024
+FORMATS            = ("ndjson", "csv")
+
+# CSV columns per kind; NDJSON carries the records as stored
+LEAD_COLUMNS = ("id", "name", "email", "phone", "whatsapp", "company", "title", "tags", "source",
+                "createdAt", "updatedAt", "last_contacted", "wa_opt_out", "notes")
+NOTE_COLUMNS = ("id", "lead_id", "text", "createdAt")
+CHAT_COLUMNS = ("lead_id", "time", "from", "text", "message_id", "status")
+
+# ----------------------------
+# Rows
+# ----------------------------
+def _norm_user(user_email: str) -> str:
+    return (user_email or "").strip().lower()
+
+def iter_leads(user_email: str) -> Iterator[Dict[str, Any]]:
+    for lead in view_bucket("leads", _norm_user(user_email), []) or []:
+        if isinstance(lead, dict):
+            yield lead
+
+def iter_notes(user_email: str) -> Iterator[Dict[str, Any]]:
+    for note in view_bucket("notes", _norm_user(user_email), []) or []:
+        if isinstance(note, dict):
+            yield note
+
+def iter_chats(user_email: str) -> Iterator[Dict[str, Any]]:
+    """Every message of every thread, thread by thread, each tagged with its lead_id."""
+    for lead_id in thread_ids(user_email):
+        for msg in iter_thread(user_email, lead_id):
+            if isinstance(msg, dict):
+                yield dict(msg, lead_id=lead_id)
+
+KINDS = {"leads": (iter_leads, LEAD_COLUMNS),
+         "notes": (iter_notes, NOTE_COLUMNS),
+         "chats": (iter_chats, CHAT_COLUMNS)}
+
+# ----------------------------
+# Encoding
+# ----------------------------
+def _cell(value: Any) -> Any:
+    if value is None:
+        return ""
+    if isinstance(value, (list, tuple)):
+        return "; ".join(str(v) for v in value)
+    if isinstance(value, dict):
+        return json.dumps(value, ensure_ascii=False, separators=(",", ":"))
+    return value
+
+def ndjson_lines(rows: Iterable[Dict[str, Any]]) -> Iterator[str]:
+    for row in rows:
+        yield json.dumps(row, ensure_ascii=False, separators=(",", ":"), default=str) + "\n"
+
+def csv_lines(rows: Iterable[Dict[str, Any]], columns: List[str]) -> Iterator[str]:
+    buf = io.StringIO()
+    w = csv.writer(buf)
+    w.writerow(columns)
+    for row in rows:
+        w.writerow([_cell(row.get(c)) for c in columns])
+        yield buf.getvalue()
+        buf.seek(0)
+        buf.truncate()
+    yield buf.getvalue()  # header of an empty export
+
+def blocks(lines: Iterable[str], compress: bool = False) -> Iterator[bytes]:
+    """Join lines into ~EXPORT_FLUSH_BYTES chunks, optionally gzip'd on the fly."""
+    z = zlib.compressobj(6, zlib.DEFLATED, 31) if compress else None  # wbits 31: gzip container
+    pending: List[bytes] = []
+    size = 0
+    for line in lines:
+        b = line.encode("utf-8")
+        pending.append(b)
+        size += len(b)
+        if size >= EXPORT_FLUSH_BYTES:
+            out = b"".join(pending)
+            pending, size = [], 0
+            out = z.compress(out) if z else out
+            if out:
+                yield out
+    out = b"".join(pending)
+    if z:
+        out = z.compress(out) + z.flush()
+    if out:
+        yield out
+
+def export_stream(user_email: str, kind: str, fmt: str = "ndjson", compress: bool = False) -> Iterator[bytes]:
+    rows_of, columns = KINDS[kind]
+    rows = rows_of(user_email)
+    lines = csv_lines(rows, list(columns)) if fmt == "csv" else ndjson_lines(rows)
+    return blocks(lines, compress)
+
+# ----------------------------
+# Routes
+# ----------------------------
+@export_bp.get("/api/export/<kind>/<path:user_email>")
+def export_data(kind, user_email):
+    user = _norm_user(user_email)
+    fmt = (request.args.get("format") or "ndjson").strip().lower()
+    compress = (request.args.get("gzip") or "").strip().lower() in ("1", "true", "yes")
+    if kind not in KINDS:
+        return jsonify({"error": f"kind must be one of: {', '.join(KINDS)}"}), 400
+    if fmt not in FORMATS:
+        return jsonify({"error": f"format must be one of: {', '.join(FORMATS)}"}), 400
+    if not user:
+        return jsonify({"error": "user_email required"}), 400
+
+    stamp = datetime.datetime.utcnow().strftime("%Y%m%d-%H%M%S")
+    filename = f"{kind}-{stamp}.{fmt}" + (".gz" if compress else "")
+    mimetype = "application/gzip" if compress else ("text/csv" if fmt == "csv" else "application/x-ndjson")
+    resp = Response(export_stream(user, kind, fmt, compress), mimetype=mimetype)
+    resp.headers["Content-Disposition"] = f'attachment; filename="{filename}"'
+    resp.headers["Cache-Control"] = "no-store"
+    resp.headers["X-Accel-Buffering"] = "no"  # let nginx / Render pass chunks through as they are produced
+    return resp
@@ -6,6 +6,8 @@ from uuid import uuid4
 
 import os
 
+from app_storage import get_bucket, put_bucket, delete_bucket, bucket_lock
+
 # Prefer FRONTEND_BASE; fall back to FRONTEND_URL; then localhost for dev
 FRONTEND_BASE = (
     os.getenv("FRONTEND_BASE")
@@ -53,20 +55,10 @@ print("[GOOGLE PEOPLE AUTH] redirect_uri=", GOOGLE_PEOPLE_REDIRECT_URI)
 imports_bp = Blueprint("imports_bp", __name__)
 
 # ---------- Storage ----------
-LEADS_FILE  = "leads.json"
-TOKENS_FILE = "google_tokens.json"   # per-user Google tokens (simple file store)
-SYNC_FILE   = "google_sync.json"     # nextSyncToken for incremental sync
-
-def _load_json(path, default):
-    try:
-        with open(path, "r", encoding="utf-8") as f:
-            return json.load(f)
-    except Exception:
-        return default
-
-def _save_json(path, data):
-    with open(path, "w", encoding="utf-8") as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
+# Shared app_storage entities (same DATA_DIR store app.py's list_leads reads):
+#   leads          per-user lead list
+#   google_tokens  per-user Google tokens
+#   google_sync    per-user nextSyncToken for incremental sync
 
 def _normalize_email(e):
     return (e or "").strip().lower()
@@ -80,33 +72,27 @@ def _emails_from_lead(lead):
     return [_normalize_email(x) for x in emails if x]
 
 def _load_leads_bucket(user_email):
-    all_leads = _load_json(LEADS_FILE, {})
-    return all_leads.get(user_email) or []
+    return get_bucket("leads", user_email, []) or []
 
 def _save_leads_bucket(user_email, leads):
-    all_leads = _load_json(LEADS_FILE, {})
-    all_leads[user_email] = leads
-    _save_json(LEADS_FILE, all_leads)
+    put_bucket("leads", user_email, leads)
 
 # ---------- Token helpers ----------
 
 def _set_token(user_email, token_payload):
-    tokens = _load_json(TOKENS_FILE, {})
-    tokens[user_email] = token_payload
-    _save_json(TOKENS_FILE, tokens)
+    put_bucket("google_tokens", user_email, token_payload)
 
 def _get_token(user_email):
-    tokens = _load_json(TOKENS_FILE, {})
-    return tokens.get(user_email)
+    return get_bucket("google_tokens", user_email)
+
+def _clear_token(user_email):
+    delete_bucket("google_tokens", user_email)
 
 def _set_sync_token(user_email, sync_token):
-    syncs = _load_json(SYNC_FILE, {})
-    syncs[user_email] = {"sync_token": sync_token, "updated_at": int(time.time())}
-    _save_json(SYNC_FILE, syncs)
+    put_bucket("google_sync", user_email, {"sync_token": sync_token, "updated_at": int(time.time())})
 
 def _get_sync_token(user_email):
-    syncs = _load_json(SYNC_FILE, {})
-    entry = syncs.get(user_email)
+    entry = get_bucket("google_sync", user_email)
     return entry.get("sync_token") if entry else None
 
 def _exchange_code_for_tokens(code):
@@ -252,6 +238,11 @@ def _ensure_unique_ids(leads):
 # ---------- Upsert / Merge (SAFE: by external_id ONLY) ----------
 
 def _upsert_leads_google(user_email, mapped):
+    # the merge reads the whole bucket, so hold it until the write lands
+    with bucket_lock("leads", user_email):
+        return _merge_leads_google(user_email, mapped)
+
+def _merge_leads_google(user_email, mapped):
     """
     Upsert Google People into leads with MAX safety:
       - Merge only by external_id (Google resourceName).
@@ -465,9 +456,7 @@ def google_import_now():
                 if "ACCESS_TOKEN_SCOPE_INSUFFICIENT" in body_json:
                     print("[GOOGLE IMPORT NOW] insufficient scope; clearing token to force fresh consent")
                     try:
-                        tokens = _load_json(TOKENS_FILE, {})
-                        tokens.pop(user_email, None)
-                        _save_json(TOKENS_FILE, tokens)
+                        _clear_token(user_email)
                     except Exception:
                         pass
                     return jsonify({"status": "error", "error": "insufficient_scope"}), 400
@@ -615,9 +604,7 @@ def google_people_oauth_callback():
                 if "ACCESS_TOKEN_SCOPE_INSUFFICIENT" in body_json:
                     print("[GOOGLE PEOPLE OAUTH] insufficient scope; clearing saved token to force fresh consent")
                     try:
-                        tokens = _load_json(TOKENS_FILE, {})
-                        tokens.pop(user_email, None)
-                        _save_json(TOKENS_FILE, tokens)
+                        _clear_token(user_email)
                     except Exception:
                         pass
                     return Response(_popup_close_html(), mimetype="text/html", status=400)
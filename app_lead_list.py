@@ -0,0 +1,154 @@
+# backend/app_lead_list.py
+# ======================================
+# Paged lead listing for GET /api/leads/<user_email>: server-side sort,
+# tag/source filters, field projection and opaque cursors.
+#
+#   sort     createdAt | updatedAt | last_contacted | name | email   ("-" prefix: descending)
+#   cursor   base64url of [sort, value, id] — the last row of the previous page
+#
+# Rows are ordered by (sort value, id), so a cursor pins an exact position:
+# leads added or removed between requests never repeat or skip a row.
+#
+# One sorted key list per user per sort field, kept as an app_storage
+# derived_index() on the leads bucket — lead writes move single keys
+# (bisect) and a page is a bisect to the cursor plus a walk of `limit`
+# matching rows, instead of a sort of the whole bucket per request.
+import json, base64, bisect, threading
+from typing import Any, Dict, List, Optional, Tuple
+
+from app_storage import derived_index, item_index
+
+SORT_FIELDS    = ("createdAt", "updatedAt", "last_contacted", "name", "email")
+DEFAULT_SORT   = "createdAt"
+DEFAULT_LIMIT  = 50
+MAX_LIMIT      = 500
+DEFAULT_SOURCE = "manual"  # leads created through the API carry no "source"
+
+# ----------------------------
+# Sorted view (one per user per sort field)
+# ----------------------------
+def _sort_value(lead: Any, field: str) -> str:
+    v = lead.get(field) if isinstance(lead, dict) else None
+    if v is None:
+        return ""
+    return str(v).lower() if field in ("name", "email") else str(v)
+
+class SortedLeads:
+    def __init__(self, items: Dict[str, Any], field: str):
+        self.field = field
+        self.mu = threading.Lock()
+        self.key_of: Dict[str, Tuple[str, str]] = {
+            iid: (_sort_value(ld, field), iid) for iid, ld in items.items()}
+        self.keys: List[Tuple[str, str]] = sorted(self.key_of.values())
+
+    # app_storage calls apply() under its index mutex
+    def apply(self, changes: list):
+        with self.mu:
+            for old, new in changes:
+                if old is not None:
+                    key = self.key_of.pop(str(old.get("id")), None)
+                    if key is not None:
+                        i = bisect.bisect_left(self.keys, key)
+                        if i < len(self.keys) and self.keys[i] == key:
+                            del self.keys[i]
+                if new is not None:
+                    iid = str(new.get("id"))
+                    key = self.key_of[iid] = (_sort_value(new, self.field), iid)
+                    bisect.insort(self.keys, key)
+
+    def walk(self, after: Optional[Tuple[str, str]], descending: bool, chunk: int = 256):
+        """Ids in sort order, starting just past `after`; copied out in chunks so writers aren't held up."""
+        while True:
+            with self.mu:
+                if descending:
+                    i = len(self.keys) if after is None else bisect.bisect_left(self.keys, after)
+                    keys = self.keys[max(0, i - chunk):i][::-1]
+                else:
+                    i = 0 if after is None else bisect.bisect_right(self.keys, after)
+                    keys = self.keys[i:i + chunk]
+            if not keys:
+                return
+            for key in keys:
+                yield key
+            after = keys[-1]
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+def _view(user_email: str, field: str) -> SortedLeads:
+    return derived_index("leads", user_email, f"sort:{field}", lambda items: SortedLeads(items, field))
+
+# ----------------------------
+# Cursors
+# ----------------------------
+def encode_cursor(sort: str, key: Tuple[str, str]) -> str:
+    raw = json.dumps([sort, key[0], key[1]], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_cursor(cursor: str, sort: str) -> Tuple[str, str]:
+    try:
+        s, value, iid = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except Exception:
+        raise ValueError("invalid cursor")
+    if s != sort:
+        raise ValueError("cursor was issued for a different sort")
+    return (str(value), str(iid))
+
+# ----------------------------
+# Query
+# ----------------------------
+def _split(value: Optional[str]) -> List[str]:
+    return [v.strip().lower() for v in (value or "").split(",") if v.strip()]
+
+def _matches(lead: Dict[str, Any], tags: List[str], sources: List[str]) -> bool:
+    if tags:
+        have = {str(t).lower() for t in (lead.get("tags") or [])}
+        if not all(t in have for t in tags):
+            return False
+    if sources and str(lead.get("source") or DEFAULT_SOURCE).lower() not in sources:
+        return False
+    return True
+
+def _project(lead: Dict[str, Any], fields: List[str]) -> Dict[str, Any]:
+    out = {"id": lead.get("id")}
+    for f in fields:
+        if f in lead:
+            out[f] = lead[f]
+    return out
+
+def page_leads(user_email: str, sort: Optional[str] = None, cursor: Optional[str] = None,
+               limit: Any = None, tag: Optional[str] = None, source: Optional[str] = None,
+               fields: Optional[str] = None) -> Dict[str, Any]:
+    """
+    One page of a user's leads: {"leads", "next_cursor", "total"}. tag= (comma
+    separated) requires every tag, source= any of the sources; both are case
+    insensitive. total counts the unfiltered bucket and is null when filtering.
+    Raises ValueError on a bad sort, limit or cursor.
+    """
+    sort = (sort or DEFAULT_SORT).strip()
+    descending, field = sort.startswith("-"), sort.lstrip("-")
+    if field not in SORT_FIELDS:
+        raise ValueError(f"sort must be one of: {', '.join(SORT_FIELDS)} (prefix '-' for descending)")
+    try:
+        limit = DEFAULT_LIMIT if limit in (None, "") else int(limit)
+    except (TypeError, ValueError):
+        raise ValueError("limit must be an integer")
+    limit = max(1, min(limit, MAX_LIMIT))
+    after = decode_cursor(cursor, sort) if cursor else None
+    tags, sources = _split(tag), _split(source)
+    projection = [f.strip() for f in (fields or "").split(",") if f.strip()]
+
+    view, index = _view(user_email, field), item_index("leads", user_email)
+    page, last, more = [], None, False
+    for key in view.walk(after, descending):
+        lead = index.get(key[1])
+        if lead is None or not _matches(lead, tags, sources):
+            continue
+        if len(page) == limit:
+            more = True
+            break
+        page.append(_project(lead, projection) if projection else lead)
+        last = key
+    return {"leads": page,
+            "next_cursor": encode_cursor(sort, last) if more else None,
+            "total": None if (tags or sources) else len(view)}
@@ -0,0 +1,121 @@
+# backend/app_notes.py
+# ======================================
+# Per-lead view of the notes entity for GET /api/notes/<lead_id>: a lead's
+# notes in createdAt order, paged with opaque cursors, without filtering the
+# tenant's whole notes bucket on every drawer open.
+#
+#   order    createdAt | -createdAt   (newest first)
+#   cursor   base64url of [order, createdAt, id] — the last row of the previous page
+#
+# One sorted (createdAt, id) key list per lead, kept as an app_storage
+# derived_index() on the notes bucket, so note writes move single keys
+# (bisect) and a page is a bisect to the cursor plus `limit` lookups in the
+# item index. The same view answers "which notes belong to this lead" for
+# lead deletes.
+import bisect, threading
+from typing import Any, Dict, List, Optional, Tuple
+
+from app_storage import derived_index, item_index
+from app_lead_list import encode_cursor, decode_cursor
+
+ORDERS        = ("createdAt", "-createdAt")
+DEFAULT_ORDER = "createdAt"
+MAX_LIMIT     = 500
+
+# ----------------------------
+# Per-lead sorted view
+# ----------------------------
+class NotesByLead:
+    def __init__(self, items: Dict[str, Any]):
+        self.mu = threading.Lock()
+        self.keys: Dict[str, List[Tuple[str, str]]] = {}  # lead_id -> [(createdAt, note id)], ascending
+        self.lead_of: Dict[str, Tuple[str, Tuple[str, str]]] = {}  # note id -> (lead_id, key)
+        for note in items.values():
+            self._add(note, insort=False)
+        for keys in self.keys.values():
+            keys.sort()
+
+    # app_storage calls apply() under its index mutex
+    def apply(self, changes: list):
+        with self.mu:
+            for old, new in changes:
+                if old is not None:
+                    self._remove(str(old.get("id")))
+                if new is not None:
+                    self._add(new)
+
+    def _add(self, note: Any, insort: bool = True):
+        if not isinstance(note, dict):
+            return
+        nid, lead = str(note.get("id")), str(note.get("lead_id"))
+        key = (str(note.get("createdAt") or ""), nid)
+        self.lead_of[nid] = (lead, key)
+        keys = self.keys.setdefault(lead, [])
+        if insort:
+            bisect.insort(keys, key)
+        else:
+            keys.append(key)
+
+    def _remove(self, nid: str):
+        found = self.lead_of.pop(nid, None)
+        if found is None:
+            return
+        lead, key = found
+        keys = self.keys.get(lead) or []
+        i = bisect.bisect_left(keys, key)
+        if i < len(keys) and keys[i] == key:
+            del keys[i]
+        if not keys:
+            self.keys.pop(lead, None)
+
+    def count(self, lead: str) -> int:
+        with self.mu:
+            return len(self.keys.get(lead) or ())
+
+    def note_ids(self, lead: str) -> List[str]:
+        with self.mu:
+            return [nid for _, nid in self.keys.get(lead) or ()]
+
+    def page(self, lead: str, after: Optional[Tuple[str, str]], descending: bool, limit: int):
+        """Up to limit + 1 keys past `after`, in order (the extra one says there is more)."""
+        with self.mu:
+            keys = self.keys.get(lead) or []
+            if descending:
+                i = len(keys) if after is None else bisect.bisect_left(keys, after)
+                return keys[max(0, i - limit - 1):i][::-1]
+            i = 0 if after is None else bisect.bisect_right(keys, after)
+            return keys[i:i + limit + 1]
+
+def _view(user_email: str) -> NotesByLead:
+    return derived_index("notes", user_email, "by_lead", NotesByLead)
+
+# ----------------------------
+# API
+# ----------------------------
+def lead_note_ids(user_email: str, lead_id: Any) -> List[str]:
+    return _view(user_email).note_ids(str(lead_id))
+
+def page_notes(user_email: str, lead_id: Any, order: Optional[str] = None, cursor: Optional[str] = None,
+               limit: Any = None) -> Dict[str, Any]:
+    """
+    One lead's notes: {"notes", "next_cursor", "total"}. Without a limit
+    every note of the lead (the old response, now ordered by createdAt).
+    Raises ValueError on a bad order, limit or cursor.
+    """
+    order = (order or DEFAULT_ORDER).strip()
+    if order not in ORDERS:
+        raise ValueError(f"order must be one of: {', '.join(ORDERS)}")
+    try:
+        limit = None if limit in (None, "") else max(1, min(int(limit), MAX_LIMIT))
+    except (TypeError, ValueError):
+        raise ValueError("limit must be an integer")
+    after = decode_cursor(cursor, order) if cursor else None
+    lead, view, index = str(lead_id), _view(user_email), item_index("notes", user_email)
+    total = view.count(lead)
+    keys = view.page(lead, after, order.startswith("-"), total if limit is None else limit)
+    more = limit is not None and len(keys) > limit
+    keys = keys[:limit] if more else keys
+    notes = [n for n in (index.get(nid) for _, nid in keys) if n is not None]
+    return {"notes": notes,
+            "next_cursor": encode_cursor(order, keys[-1]) if more else None,
+            "total": total}
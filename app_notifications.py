@@ -0,0 +1,436 @@
+# backend/app_notifications.py
+# ======================================
+# Notification retention: a small "hot" list per user plus compressed,
+# month-partitioned archive segments for everything older.
+#
+#   notifications entity   { "<user_email>": [ ...recent entries, oldest first... ] }
+#   archive segments       NOTIF_ARCHIVE_DIR/<sha1(user_email)>/<YYYY-MM>.jsonl.gz
+#
+# Entries leave the hot list once older than NOTIF_HOT_DAYS or beyond the
+# newest NOTIF_HOT_MAX. The daily compaction job (and any append that pushes
+# the list past NOTIF_HOT_MAX + slack) moves them into the segment for their
+# month. Segments are append-only: each roll adds one gzip member, and gzip
+# readers see the concatenation as one stream. The hot path — notify(),
+# GET /api/notifications/<user> — only ever touches the hot list;
+# GET /api/notifications/<user>/archive reads just the months asked for.
+#
+# notify() is the one producer API: app.py's log_notification and wa-auto's
+# _notify both call it, so every entry has the same shape and an id, and an
+# append is an item write (upsert_item: one log record under STORAGE_WAL,
+# coalesced with the rest of the request's writes in its batch) rather than
+# a rewrite of the list.
+#
+# Repeats coalesce: an entry identical to one raised within the last
+# NOTIF_COALESCE_SECONDS (same type, subject, lead and message) folds into
+# it — "count" goes up, "timestamp" moves to the latest occurrence,
+# "first_timestamp" keeps the first — and comes back unread, instead of
+# adding a row. The window slides with each repeat; 0 turns folding off.
+#
+# Read state lives beside the list, not in it (see "Read state" below):
+# marking one entry or all of them read writes a small per-user record, and
+# the unread badge is a counter kept up to date by every append.
+#
+# Every appended entry is also published to app_events once its write has
+# landed, and GET /api/notifications/stream?user_email= serves that feed as
+# Server-Sent Events (Last-Event-ID resumes it), so clients stop polling.
+import os, re, json, gzip, bisect, hashlib, datetime
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from flask import Blueprint, Response, request, jsonify
+
+from app_storage import (DATA_DIR, load_entity, get_bucket, view_bucket, put_bucket, upsert_item, item_index,
+                         bucket_lock, shard_name)
+from app_lead_list import encode_cursor, decode_cursor
+from app_events import publish_later, sse_stream
+
+notifications_bp = Blueprint("notifications_bp", __name__)
+
+NOTIF_HOT_DAYS    = int(os.getenv("NOTIF_HOT_DAYS", "30"))
+NOTIF_HOT_MAX     = int(os.getenv("NOTIF_HOT_MAX", "500"))
+NOTIF_HOT_SLACK   = max(1, NOTIF_HOT_MAX // 10)  # appends roll inline only past MAX + SLACK
+NOTIF_ARCHIVE_DIR = os.getenv("NOTIF_ARCHIVE_DIR", os.path.join(DATA_DIR, "notifications_archive"))
+NOTIF_COALESCE_SECONDS = float(os.getenv("NOTIF_COALESCE_SECONDS", "900"))
+PAGE_ORDER        = "-time"  # the one listing order: newest first
+MAX_LIMIT         = 500
+
+_MONTH_RE = re.compile(r"^\d{4}-\d{2}$")
+
+# ----------------------------
+# Helpers
+# ----------------------------
+def _key(user_email: str) -> str:
+    return (user_email or "").strip().lower()
+
+def entry_time(n: Dict[str, Any]) -> str:
+    """ISO time of an entry; app.py writes "timestamp", wa-auto "created_at"."""
+    return str(n.get("timestamp") or n.get("created_at") or "")
+
+def entry_id(n: Dict[str, Any]) -> str:
+    """An entry's id; entries written before ids were assigned get a stable one from their content."""
+    if n.get("id"):
+        return str(n["id"])
+    raw = "\0".join(str(n.get(k) or "") for k in ("timestamp", "created_at", "subject", "title", "message", "body"))
+    return "n" + hashlib.sha1(raw.encode("utf-8")).hexdigest()[:15]
+
+# One record shape for every producer:
+#   {"id", "timestamp", "type", "subject", "message", "lead_email", "lead_id", "read"}
+# Older entries (wa-auto's {title, body, created_at}, app.py's id-less ones)
+# are rewritten once per user, on that user's next append (state "schema"),
+# and mapped on the way out until then; archived ones are mapped on read.
+# Schema 3 also folds the repeats already in the list (see _coalesce).
+SCHEMA_VERSION = 3
+_LEGACY_FIELDS = ("title", "body", "created_at")
+
+def normalize_entry(n: Dict[str, Any]) -> Dict[str, Any]:
+    out = {"id": entry_id(n), "timestamp": entry_time(n), "type": str(n.get("type") or "info"),
+           "subject": n.get("subject") or n.get("title") or "", "message": n.get("message") or n.get("body") or "",
+           "lead_email": n.get("lead_email"), "lead_id": n.get("lead_id"), "read": bool(n.get("read"))}
+    out.update((k, v) for k, v in n.items() if k not in out and k not in _LEGACY_FIELDS)
+    return out
+
+def _parse_time(ts: str) -> Optional[datetime.datetime]:
+    try:
+        return datetime.datetime.fromisoformat(ts.rstrip("Z")[:26]).replace(tzinfo=None)
+    except ValueError:
+        return None
+
+def _month(n: Dict[str, Any]) -> str:
+    m = entry_time(n)[:7]
+    return m if _MONTH_RE.match(m) else "0000-00"
+
+def _split_hot(arr: List[Dict[str, Any]], now: Optional[datetime.datetime] = None) -> Tuple[list, list]:
+    """(hot, cold): cold is everything past the retention window or the size cap."""
+    cutoff = ((now or datetime.datetime.utcnow()) - datetime.timedelta(days=NOTIF_HOT_DAYS)).isoformat()
+    hot, cold = [], []
+    for n in arr:
+        ts = entry_time(n)
+        (cold if ts and ts < cutoff else hot).append(n)
+    if len(hot) > NOTIF_HOT_MAX:
+        # by time, not position: a folded repeat keeps its slot but carries its latest timestamp
+        hot.sort(key=entry_time)
+        cold += hot[:-NOTIF_HOT_MAX]
+        hot = hot[-NOTIF_HOT_MAX:]
+    return hot, cold
+
+# ----------------------------
+# Archive segments
+# ----------------------------
+def _archive_dir(user_email: str) -> str:
+    return os.path.join(NOTIF_ARCHIVE_DIR, shard_name(_key(user_email))[:-5])
+
+def _segment_path(user_email: str, month: str) -> str:
+    return os.path.join(_archive_dir(user_email), f"{month}.jsonl.gz")
+
+def _archive(user_email: str, entries: List[Dict[str, Any]]):
+    """Append entries to their month segments (one gzip member per segment). Caller holds the bucket lock."""
+    by_month: Dict[str, List[Dict[str, Any]]] = {}
+    for n in entries:
+        by_month.setdefault(_month(n), []).append(n)
+    os.makedirs(_archive_dir(user_email), exist_ok=True)
+    for month, items in by_month.items():
+        raw = "".join(json.dumps(n, ensure_ascii=False, separators=(",", ":")) + "\n" for n in items)
+        with open(_segment_path(user_email, month), "ab") as f:
+            f.write(gzip.compress(raw.encode("utf-8")))
+            f.flush()
+            os.fsync(f.fileno())
+
+def _read_segment(path: str) -> List[Dict[str, Any]]:
+    out = []
+    try:
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    out.append(json.loads(line))
+                except ValueError:
+                    continue
+    except FileNotFoundError:
+        pass
+    except (EOFError, OSError):
+        pass  # torn trailing member from a crash mid-append; keep what decoded
+    return out
+
+def archive_months(user_email: str) -> List[str]:
+    d = _archive_dir(user_email)
+    if not os.path.isdir(d):
+        return []
+    return sorted((f[:-len(".jsonl.gz")] for f in os.listdir(d) if f.endswith(".jsonl.gz")), reverse=True)
+
+def query_archive(user_email: str, since: str = "", until: str = "", q: str = "",
+                  limit: int = 50, offset: int = 0) -> Dict[str, Any]:
+    """Archived entries newest first, reading only the month segments that overlap [since, until]."""
+    q = (q or "").strip().lower()
+    items, seen, skipped = [], set(), 0
+    for month in archive_months(user_email):
+        if (since and month < since[:7]) or (until and month > until[:7]):
+            continue
+        entries = _read_segment(_segment_path(user_email, month))
+        entries.sort(key=entry_time, reverse=True)
+        for n in entries:
+            ts = entry_time(n)
+            if (since and ts < since) or (until and ts[:len(until)] > until):
+                continue
+            if q and q not in " ".join(str(n.get(k) or "") for k in ("subject", "message", "title", "body", "lead_email")).lower():
+                continue
+            sig = json.dumps(n, sort_keys=True)  # a crash between archive and hot write can archive an entry twice
+            if sig in seen:
+                continue
+            seen.add(sig)
+            if skipped < offset:
+                skipped += 1
+                continue
+            items.append(normalize_entry(n))
+            if len(items) > limit:
+                return {"items": items[:limit], "next_offset": offset + limit}
+    return {"items": items, "next_offset": None}
+
+# ----------------------------
+# Coalescing
+# ----------------------------
+def _coalesce_key(n: Dict[str, Any]) -> str:
+    raw = "\0".join(str(n.get(k) or "") for k in ("type", "subject", "lead_email", "lead_id", "message"))
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()[:16]
+
+def _within_window(earlier: str, later: str) -> bool:
+    a, b = _parse_time(earlier), _parse_time(later)
+    return a is not None and b is not None and abs((b - a).total_seconds()) <= NOTIF_COALESCE_SECONDS
+
+def _fold(into: Dict[str, Any], n: Dict[str, Any]) -> Dict[str, Any]:
+    """`into` absorbing a repeat: one entry showing the latest occurrence, counting all of them."""
+    first, last = sorted((entry_time(into), entry_time(n)))
+    return dict(into, timestamp=last, first_timestamp=min(into.get("first_timestamp") or first, first),
+                count=int(into.get("count") or 1) + int(n.get("count") or 1),
+                read=bool(into.get("read")) and bool(n.get("read")))
+
+def _coalesce(arr: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Fold the repeats in an already-written list, oldest first."""
+    out: List[Dict[str, Any]] = []
+    last: Dict[str, int] = {}
+    for n in sorted(arr, key=entry_time):
+        k = _coalesce_key(n)
+        i = last.get(k)
+        if NOTIF_COALESCE_SECONDS > 0 and i is not None and _within_window(entry_time(out[i]), entry_time(n)):
+            out[i] = _fold(out[i], n)
+            continue
+        last[k] = len(out)
+        out.append(n)
+    return out
+
+def _remember(state: Dict[str, Any], n: Dict[str, Any]):
+    """Note n as the latest of its kind; drop keys whose window has closed."""
+    state["recent"][_coalesce_key(n)] = [n["id"], entry_time(n)]
+    state["recent"] = {k: v for k, v in state["recent"].items() if _within_window(v[1], entry_time(n))}
+
+# ----------------------------
+# Read state
+# ----------------------------
+# notification_state entity  { "<user_email>": {"read_through", "read_ids", "newest", "unread", "schema", "recent"} }
+#
+# An entry is read if it says so itself (read: true, from before this state
+# existed), if its time is at or before the read_through watermark, or if
+# its id is in read_ids (marked one at a time since the watermark last
+# moved). "Read all" moves the watermark to `newest` and empties read_ids;
+# appends, single reads and rolls into the archive adjust `unread`, which
+# counts the hot list only. "recent" maps coalescing keys to the [id, time]
+# of their latest entry while its window is open. All of it changes under
+# the notifications lock.
+def _is_read(n: Dict[str, Any], state: Dict[str, Any]) -> bool:
+    if n.get("read"):
+        return True
+    mark = state["read_through"]
+    return (bool(mark) and entry_time(n) <= mark) or entry_id(n) in state["read_ids"]
+
+def _count(state: Dict[str, Any], n: Dict[str, Any]):
+    state["newest"] = max(state["newest"], entry_time(n))
+    if not _is_read(n, state):
+        state["unread"] += 1
+
+def _forget(state: Dict[str, Any], gone: Iterable[Dict[str, Any]]):
+    """Entries leaving the hot list stop counting."""
+    for n in gone:
+        if not _is_read(n, state):
+            state["unread"] -= 1
+        state["read_ids"].discard(entry_id(n))
+    state["unread"] = max(0, state["unread"])
+
+def _load_state(user: str, arr: Optional[list] = None) -> Dict[str, Any]:
+    raw = view_bucket("notification_state", user)
+    if raw:
+        return {"read_through": str(raw.get("read_through") or ""), "read_ids": set(raw.get("read_ids") or ()),
+                "newest": str(raw.get("newest") or ""), "unread": max(0, int(raw.get("unread") or 0)),
+                "schema": int(raw.get("schema") or 0), "recent": dict(raw.get("recent") or {})}
+    state = {"read_through": "", "read_ids": set(), "newest": "", "unread": 0, "schema": 0, "recent": {}}
+    for n in (view_bucket("notifications", user, []) if arr is None else arr) or []:
+        _count(state, n)  # first touch: one count of the list, kept incrementally from here on
+    return state
+
+def _save_state(user: str, state: Dict[str, Any]):
+    put_bucket("notification_state", user, dict(state, read_ids=sorted(state["read_ids"])))
+
+def unread_count(user_email: str) -> int:
+    return _load_state(_key(user_email))["unread"]
+
+def mark_read(user_email: str, ids: Iterable[Any]) -> Dict[str, int]:
+    """Mark hot-list entries read by id; {"marked", "unread"}."""
+    user, want = _key(user_email), {str(i) for i in ids if i not in (None, "")}
+    with bucket_lock("notifications", user):
+        arr = view_bucket("notifications", user, []) or []
+        state = _load_state(user, arr)
+        marked = 0
+        for n in arr:
+            nid = entry_id(n)
+            if nid in want and not _is_read(n, state):
+                state["read_ids"].add(nid)
+                state["unread"] -= 1
+                marked += 1
+        if marked:
+            state["unread"] = max(0, state["unread"])
+            _save_state(user, state)
+        return {"marked": marked, "unread": state["unread"]}
+
+def mark_all_read(user_email: str):
+    """Move the watermark past the newest entry: one small write, however long the list."""
+    user = _key(user_email)
+    with bucket_lock("notifications", user):
+        state = _load_state(user)
+        state.update(read_through=max(state["read_through"], state["newest"]), read_ids=set(), unread=0)
+        _save_state(user, state)
+
+# ----------------------------
+# Hot list: append, listing, compaction
+# ----------------------------
+def _upgrade(user: str, state: Dict[str, Any]):
+    """Rewrite a hot list written before SCHEMA_VERSION in the current shape, folded, and recount. Caller holds the lock."""
+    arr, seen = [], set()
+    for n in get_bucket("notifications", user, []) or []:
+        if isinstance(n, dict):
+            n = normalize_entry(n)  # ids derived from the old fields, so read marks carry over
+            if n["id"] not in seen:
+                seen.add(n["id"])
+                arr.append(n)
+    arr = _coalesce(arr)
+    put_bucket("notifications", user, arr)
+    state.update(newest="", unread=0, schema=SCHEMA_VERSION, recent={})
+    for n in arr:
+        _count(state, n)
+        _remember(state, n)
+
+def append_notification(user_email: str, entry: Dict[str, Any]) -> Dict[str, Any]:
+    """Append one entry (normalized, given an id if it has none, or folded into a recent repeat); returns what was stored."""
+    user = _key(user_email)
+    entry = normalize_entry(dict(entry, id=entry.get("id") or os.urandom(8).hex()))
+    with bucket_lock("notifications", user):
+        state = _load_state(user)
+        if state["schema"] < SCHEMA_VERSION:
+            _upgrade(user, state)
+        hit = state["recent"].get(_coalesce_key(entry)) if NOTIF_COALESCE_SECONDS > 0 else None
+        prev = item_index("notifications", user).get(hit[0]) if hit else None
+        if prev is not None and _within_window(entry_time(prev), entry_time(entry)):
+            was_read = _is_read(prev, state)
+            entry = _fold(prev, entry)
+            state["read_ids"].discard(entry["id"])
+            state["newest"] = max(state["newest"], entry_time(entry))
+            if was_read and not _is_read(entry, state):
+                state["unread"] += 1
+        else:
+            _count(state, entry)
+        upsert_item("notifications", user, entry)
+        _remember(state, entry)
+        if len(item_index("notifications", user)) > NOTIF_HOT_MAX + NOTIF_HOT_SLACK:
+            arr, cold = _split_hot(get_bucket("notifications", user, []) or [])
+            _archive(user, cold)
+            _forget(state, cold)
+            put_bucket("notifications", user, arr)
+        _save_state(user, state)
+    publish_later(user, "notification", entry)
+    return entry
+
+def notify(user_email: str, subject: str, message: str = "", kind: str = "info",
+           lead_email: Optional[str] = None, lead_id: Any = None) -> Dict[str, Any]:
+    """Raise a notification for a user — the entry point for every producer."""
+    return append_notification(user_email, {
+        "timestamp": datetime.datetime.utcnow().isoformat() + "Z",
+        "type": kind,
+        "subject": subject,
+        "message": message,
+        "lead_email": lead_email,
+        "lead_id": lead_id,
+        "read": False,
+    })
+
+def page_notifications(user_email: str, cursor: Optional[str] = None, limit: Any = None) -> Dict[str, Any]:
+    """
+    The hot list newest first, each entry with its id and read flag:
+    {"notifications", "next_cursor", "total", "unread"}. Without a limit the
+    whole list. Raises ValueError on a bad limit or cursor.
+    """
+    try:
+        limit = None if limit in (None, "") else max(1, min(int(limit), MAX_LIMIT))
+    except (TypeError, ValueError):
+        raise ValueError("limit must be an integer")
+    after = decode_cursor(cursor, PAGE_ORDER) if cursor else None
+    user = _key(user_email)
+    arr = [n for n in view_bucket("notifications", user, []) or [] if isinstance(n, dict)]
+    state = _load_state(user, arr)
+    keys = sorted((entry_time(n), entry_id(n), i) for i, n in enumerate(arr))
+    end = len(keys) if after is None else bisect.bisect_left(keys, after)
+    take = end if limit is None else limit
+    page = keys[max(0, end - take):end][::-1]
+    more = limit is not None and end > limit
+    return {"notifications": [dict(normalize_entry(arr[i]), read=_is_read(arr[i], state)) for _, _, i in page],
+            "next_cursor": encode_cursor(PAGE_ORDER, page[-1][:2]) if more and page else None,
+            "total": len(arr),
+            "unread": state["unread"]}
+
+def compact_user(user_email: str, now: Optional[datetime.datetime] = None) -> int:
+    """Roll one user's expired entries into the archive; returns how many moved."""
+    user = _key(user_email)
+    with bucket_lock("notifications", user):
+        arr = get_bucket("notifications", user, []) or []
+        if not isinstance(arr, list):
+            return 0
+        hot, cold = _split_hot(arr, now)
+        if not cold:
+            return 0
+        _archive(user, cold)  # durable before the hot list drops them
+        state = _load_state(user, arr)
+        _forget(state, cold)
+        put_bucket("notifications", user, hot)
+        _save_state(user, state)
+        return len(cold)
+
+def compact_all(now: Optional[datetime.datetime] = None) -> Dict[str, int]:
+    moved = {}
+    for user in list(load_entity("notifications").keys()):
+        n = compact_user(user, now)
+        if n:
+            moved[user] = n
+    return moved
+
+# ----------------------------
+# Routes
+# ----------------------------
+@notifications_bp.get("/api/notifications/<path:user_email>/archive")
+def get_notification_archive(user_email):
+    try:
+        limit = max(1, min(int(request.args.get("limit", 50)), 500))
+        offset = max(0, int(request.args.get("offset", 0)))
+    except ValueError:
+        return jsonify({"error": "limit/offset must be integers"}), 400
+    res = query_archive(user_email, since=request.args.get("since", ""), until=request.args.get("until", ""),
+                        q=request.args.get("q", ""), limit=limit, offset=offset)
+    res["months"] = archive_months(user_email)
+    return jsonify(res), 200
+
+@notifications_bp.get("/api/notifications/stream")
+def notification_stream():
+    user = _key(request.args.get("user_email", ""))
+    if not user:
+        return jsonify({"error": "user_email required"}), 400
+    last = request.headers.get("Last-Event-ID") or request.args.get("last_event_id") or ""
+    try:
+        last_id = int(last) if last.strip() else None
+    except ValueError:
+        last_id = -1  # not one of ours: the stream opens with a reset
+    resp = Response(sse_stream(user, last_id), mimetype="text/event-stream")
+    resp.headers["Cache-Control"] = "no-cache"
+    resp.headers["X-Accel-Buffering"] = "no"  # let nginx / Render pass events through as they are produced
+    return resp
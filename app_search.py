@@ -0,0 +1,309 @@
+# backend/app_search.py
+# ======================================
+# Lead search: a per-user inverted index over name, email(s), phone digits,
+# tags, company and notes.
+#
+#   postings   term -> {doc: field weight}       words, email parts, phone digit strings
+#   trigrams   trigram -> {term}                 over the word vocabulary, padded as "^term$"
+#   dgrams     trigram -> {digit term}           the same over phone digit strings
+#   vocab      sorted term list                  prefix lookups by bisect
+#   rvocab     sorted reversed digit terms       suffix lookups ("last 4 digits")
+#
+# Each query word is expanded to vocabulary terms — exact, prefix, substring
+# (trigram intersection) and, when none of those hit, within edit distance
+# 1 (2 for long words) via trigram overlap plus a bounded edit-distance check.
+# Digit words match digit terms by prefix, suffix or (3+ digits) substring
+# instead, so "555" finds 416-555-1234.
+# A lead must match every word; leads rank by the summed field weight x match
+# quality, ties in bucket order.
+#
+# Two views per user, both app_storage derived_index()es, so lead and note
+# writes update them in place and a write from another worker rebuilds them:
+# one over the lead fields, one over the notes entity (posted under the
+# note's lead_id).
+import re, bisect, threading, unicodedata
+from typing import Any, Dict, Iterable, List, Optional
+
+from app_storage import derived_index, item_index
+from app_wa_numbers import norm_wa
+
+LEAD_FIELDS = {"name": 3.0, "email": 2.0, "emails": 2.0, "company": 2.0, "tags": 2.0, "notes": 1.0}
+_BY_WEIGHT = sorted({w: [f for f, fw in LEAD_FIELDS.items() if fw == w] for w in LEAD_FIELDS.values()}.items())
+PHONE_FIELDS = ("phone", "whatsapp", "phones")
+PHONE_WEIGHT = 2.0
+NOTE_WEIGHT = 1.0
+PREFIX_MAX_TERMS = 5000  # expansions per query word (a one-letter prefix can cover the whole vocabulary)
+
+_WORD_RE = re.compile(r"[^\W\d_]+|\d+")  # letter runs and digit runs: "garcia42@x.io" -> garcia, 42, x, io
+_PHONEISH_RE = re.compile(r"^[\d\s()+./-]+$")
+_NON_DIGIT_RE = re.compile(r"\D")
+
+# ----------------------------
+# Text
+# ----------------------------
+def _fold(text: Any) -> str:
+    text = str(text)
+    if text.isascii():
+        return text.lower()
+    text = unicodedata.normalize("NFKD", text).lower()
+    return "".join(c for c in text if not unicodedata.combining(c))
+
+def _text(value: Any) -> str:
+    if isinstance(value, (list, tuple)):
+        return " ".join(_text(v) for v in value)
+    return str(value) if value else ""
+
+def _words(value: Any) -> List[str]:
+    return _WORD_RE.findall(_fold(_text(value)))
+
+def _digits(value: Any) -> Iterable[str]:
+    for v in value if isinstance(value, (list, tuple)) else [value]:
+        d = _NON_DIGIT_RE.sub("", str(v or ""))
+        if len(d) >= 3:
+            yield d
+            if len(d) == 10:
+                yield norm_wa(d)
+
+def _trigrams(term: str) -> set:
+    t = f"^{term}$"
+    return {t[i:i + 3] for i in range(len(t) - 2)}
+
+def _within(a: str, b: str, k: int) -> int:
+    """Edit distance of a and b (adjacent transpositions count as one edit) if <= k, else k + 1."""
+    if abs(len(a) - len(b)) > k:
+        return k + 1
+    pprev, prev = None, list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        cur = [i] + [0] * len(b)
+        for j, cb in enumerate(b, 1):
+            cur[j] = min(prev[j] + 1, cur[j - 1] + 1, prev[j - 1] + (ca != cb))
+            if pprev is not None and j > 1 and ca == b[j - 2] and a[i - 2] == cb:
+                cur[j] = min(cur[j], pprev[j - 2] + 1)
+        if min(cur) > k:
+            return k + 1
+        pprev, prev = prev, cur
+    return prev[-1]
+
+def query_words(q: str) -> List[str]:
+    """A phone-looking query is one digit string; anything else is split like the indexed text."""
+    if _PHONEISH_RE.match(q or "") and sum(c.isdigit() for c in q) >= 3:
+        return [_NON_DIGIT_RE.sub("", q)]
+    return list(dict.fromkeys(_words(q)))
+
+def lead_terms(lead: Dict[str, Any]) -> Dict[str, float]:
+    terms: Dict[str, float] = {}
+    for weight, fields in _BY_WEIGHT:  # ascending, so a word keeps its strongest field's weight
+        terms.update(dict.fromkeys(_words([lead.get(f) for f in fields]), weight))
+    for field in PHONE_FIELDS:
+        for d in _digits(lead.get(field)):
+            terms[d] = max(terms.get(d, 0.0), PHONE_WEIGHT)
+    return terms
+
+def note_terms(note: Dict[str, Any]) -> Dict[str, float]:
+    return dict.fromkeys(_words(note.get("text")), NOTE_WEIGHT)
+
+# ----------------------------
+# Term index (one per user per view)
+# ----------------------------
+# Items are numbered in bucket order (an upsert keeps its number) and the
+# postings hold those ints: score maps, AND-ing and the tie-break sort then
+# run over small ints instead of id strings.
+class TermIndex:
+    def __init__(self, items: Dict[str, Any], terms_of, owner_of=None):
+        self.terms_of, self.owner_of = terms_of, owner_of
+        self.mu = threading.Lock()
+        self.postings: Dict[str, Dict[int, float]] = {}
+        self.trigrams: Dict[str, set] = {}
+        self.dgrams: Dict[str, set] = {}
+        self.vocab: List[str] = []
+        self.rvocab: List[str] = []
+        self.num: Dict[str, int] = {}                # item id -> doc number (bucket order)
+        self.ids: Dict[int, str] = {}                # doc number -> item id
+        self.docs: Dict[int, Dict[str, float]] = {}  # doc number -> its terms, to undo on change
+        self.owner: Dict[int, str] = {}              # doc number -> lead id (owner_of None: the items are leads)
+        self._next = 0
+        for item in items.values():
+            self._add(item)
+        self.vocab.sort()
+        self.rvocab.sort()
+
+    # -- maintenance (app_storage calls apply() under its index mutex) --
+    def apply(self, changes: list):
+        with self.mu:
+            for old, new in changes:
+                if old is not None:
+                    self._remove(str(old.get("id")), keep_num=new is not None)
+                if new is not None:
+                    self._add(new, insort=True)
+
+    def _add(self, item: Any, insort: bool = False):
+        if not isinstance(item, dict):
+            return
+        iid = str(item.get("id"))
+        n = self.num.get(iid)
+        if n is None:
+            n = self.num[iid] = self._next
+            self.ids[n], self._next = iid, self._next + 1
+        terms = self.docs[n] = self.terms_of(item)
+        if self.owner_of is not None:
+            self.owner[n] = str(self.owner_of(item))
+        for term, weight in terms.items():
+            posting = self.postings.get(term)
+            if posting is None:
+                posting = self.postings[term] = {}
+                if term.isdigit():
+                    self._vocab_add(self.rvocab, term[::-1], insort)
+                grams = self.dgrams if term.isdigit() else self.trigrams
+                for g in _trigrams(term):
+                    grams.setdefault(g, set()).add(term)
+                self._vocab_add(self.vocab, term, insort)
+            posting[n] = weight
+
+    @staticmethod
+    def _vocab_add(vocab: List[str], term: str, insort: bool):
+        if insort:
+            bisect.insort(vocab, term)
+        else:
+            vocab.append(term)
+
+    @staticmethod
+    def _vocab_remove(vocab: List[str], term: str):
+        i = bisect.bisect_left(vocab, term)
+        if i < len(vocab) and vocab[i] == term:
+            del vocab[i]
+
+    def _remove(self, iid: str, keep_num: bool = False):
+        n = self.num.get(iid)
+        if n is None:
+            return
+        if not keep_num:
+            del self.num[iid], self.ids[n]
+        self.owner.pop(n, None)
+        for term in self.docs.pop(n, None) or {}:
+            posting = self.postings.get(term)
+            if posting is None:
+                continue
+            posting.pop(n, None)
+            if posting:
+                continue
+            del self.postings[term]
+            self._vocab_remove(self.vocab, term)
+            if term.isdigit():
+                self._vocab_remove(self.rvocab, term[::-1])
+            grams = self.dgrams if term.isdigit() else self.trigrams
+            for g in _trigrams(term):
+                bucket = grams.get(g)
+                if bucket is not None:
+                    bucket.discard(term)
+                    if not bucket:
+                        del grams[g]
+
+    # -- lookup --
+    @staticmethod
+    def _starting(vocab: List[str], prefix: str) -> List[str]:
+        i = bisect.bisect_left(vocab, prefix)
+        out = []
+        for term in vocab[i:i + PREFIX_MAX_TERMS]:
+            if not term.startswith(prefix):
+                break
+            out.append(term)
+        return out
+
+    @staticmethod
+    def _containing(grams: Dict[str, set], word: str) -> Iterable[str]:
+        """Terms with `word` (3+ chars) as a substring: intersect its trigrams' term sets, then confirm."""
+        sets = sorted((grams.get(word[j:j + 3], ()) for j in range(len(word) - 2)), key=len)
+        if not sets or not sets[0]:
+            return ()
+        return [term for term in set(sets[0]).intersection(*sets[1:]) if word in term]
+
+    def _expand(self, word: str) -> Dict[str, float]:
+        """Vocabulary terms matching `word`, with a match quality in (0, 1]."""
+        found: Dict[str, float] = {}
+        if word in self.postings:
+            found[word] = 1.0
+        for term in self._starting(self.vocab, word):
+            found.setdefault(term, 0.6 + 0.3 * len(word) / len(term))
+        if word.isdigit():
+            for rterm in self._starting(self.rvocab, word[::-1]):
+                found.setdefault(rterm[::-1], 0.5)
+            if len(word) >= 3:
+                for term in self._containing(self.dgrams, word):
+                    found.setdefault(term, 0.4)
+            return found
+        if len(word) >= 3:
+            for term in self._containing(self.trigrams, word):
+                found.setdefault(term, 0.5)
+        if not found and len(word) >= 4:
+            k = 1 if len(word) < 8 else 2
+            counts: Dict[str, int] = {}
+            for g in _trigrams(word):
+                for term in self.trigrams.get(g, ()):
+                    counts[term] = counts.get(term, 0) + 1
+            need = max(1, len(word) - 4 * k)  # one edit (or swap) breaks up to 3 (4) padded trigrams
+            for term, c in counts.items():
+                if c >= need:
+                    d = _within(word, term, k)
+                    if d <= k:
+                        found[term] = 0.45 - 0.1 * (d - 1)
+        return found
+
+    def match(self, word: str) -> Dict[int, float]:
+        """doc number -> best score for one query word."""
+        with self.mu:
+            best: Dict[int, float] = {}
+            for term, quality in self._expand(word).items():
+                posting = self.postings[term]
+                if not best:
+                    best = {n: weight * quality for n, weight in posting.items()}
+                    continue
+                for n, weight in posting.items():
+                    s = weight * quality
+                    if s > best.get(n, 0.0):
+                        best[n] = s
+            return best
+
+    def match_leads(self, word: str) -> Dict[str, float]:
+        """lead id -> best score for one query word (views whose items belong to leads)."""
+        best = self.match(word)
+        with self.mu:
+            out: Dict[str, float] = {}
+            for n, s in best.items():
+                lead = self.owner.get(n)
+                if lead is not None and s > out.get(lead, 0.0):
+                    out[lead] = s
+            return out
+
+def _lead_view(user_email: str) -> TermIndex:
+    return derived_index("leads", user_email, "search", lambda items: TermIndex(items, lead_terms))
+
+def _note_view(user_email: str) -> TermIndex:
+    return derived_index("notes", user_email, "search",
+                         lambda items: TermIndex(items, note_terms, lambda n: n.get("lead_id")))
+
+# ----------------------------
+# API
+# ----------------------------
+def search(user_email: str, q: str, limit: Optional[int] = 50, offset: int = 0) -> Dict[str, Any]:
+    """Ranked leads matching every word of q: {"leads", "total", "next_offset"} (limit=None: all of them)."""
+    leads, notes = _lead_view(user_email), _note_view(user_email)
+    scores: Dict[int, float] = {}
+    for i, word in enumerate(query_words(q)):
+        best = leads.match(word)
+        for lead, s in notes.match_leads(word).items():
+            n = leads.num.get(lead)
+            if n is not None and s > best.get(n, 0.0):
+                best[n] = s
+        if i == 0:
+            scores = best
+        else:
+            scores = {n: total + best[n] for n, total in scores.items() if n in best}
+        if not scores:
+            break
+    ranked = sorted(scores)                             # bucket order ...
+    ranked.sort(key=scores.__getitem__, reverse=True)   # ... then best first (stable, so ties stay in order)
+    index = item_index("leads", user_email)
+    end = len(ranked) if limit is None else offset + limit
+    page = [index.get(leads.ids.get(n)) for n in ranked[offset:end]]
+    return {"leads": [ld for ld in page if ld is not None], "total": len(ranked),
+            "next_offset": end if end < len(ranked) else None}
@@ -0,0 +1,1835 @@
+# backend/app_storage.py
+# ======================================
+# Storage engine shared by app.py and the blueprints (app_imports, app_team,
+# app_wa_auto_appointments): one DATA_DIR layout, one cache, one lock discipline.
+#
+# Every entity (leads, users, notifications, ...) is a dict keyed by a
+# "bucket" key — the user email for per-user data, the message id for
+# WhatsApp statuses. Backends persist those buckets:
+#
+#   STORAGE_BACKEND=json    (default) one JSON document per entity in DATA_DIR
+#   STORAGE_BACKEND=sharded one file per bucket for per-user entities, e.g.
+#                           DATA_DIR/leads/<sha1(user_email)>.json
+#   STORAGE_BACKEND=sqlite  one row per (entity, bucket) in DATA_DIR/retainai.sqlite3
+#                           (WAL mode; saves upsert only the buckets that changed)
+#
+# Request handlers should use get_bucket/put_bucket so a tenant's read or
+# write only touches that tenant's shard/row, and the item-level helpers
+# (upsert_item/remove_item/append_item) for single-record changes
+# (upsert_items for many records of one bucket in one write).
+#
+# STORAGE_WAL=leads,chats puts a write-ahead log in front of the backend for
+# those entities: each mutation is appended as one JSON line to
+# DATA_DIR/wal/<entity>.log and applied to an in-memory image; a background
+# compactor folds the log into the backend once it passes STORAGE_WAL_MAX_BYTES
+# or STORAGE_WAL_MAX_AGE seconds. On restart the log tail is replayed.
+#
+# load_json keeps a process-local cache of parsed files, revalidated with
+# os.stat on every call (JSON_CACHE_BYTES budget, LRU). load_json hands out a
+# private mutable copy; read-only handlers use load_json_view / view_bucket,
+# which return the shared parsed object frozen against mutation.
+#
+# save_json writes are group-committed: inside write_batch() (app.py opens one
+# per request) each file is written once, on exit; with JSON_COALESCE_MS > 0
+# writes from concurrent requests landing in the same window are merged too.
+# Either way the caller returns only after the fsync'd atomic replace, and
+# load_json sees pending writes before they hit disk. after_commit(fn) holds
+# a side effect (a live event, say) back until the batch has landed.
+# STORAGE_BACKEND=sqlite bucket writes join the same batch: they are held per
+# thread and land in one transaction (synchronous=FULL) as the batch commits.
+#
+# Concurrency across gunicorn workers: every bucket write takes that bucket's
+# flock (DATA_DIR/locks/<entity>/...), which also stores its version stamp,
+# and bucket writes to a monolithic file are applied as patches to its current
+# content under a short file lock. Read-modify-write callers hold
+# bucket_lock() across the read, or use update_bucket() to retry on a version
+# conflict. See "Bucket locks & version stamps" below.
+#
+# STORAGE_CODEC picks the on-disk encoding of those files: "json" (indented,
+# the historical format), "compact" (no whitespace; orjson when installed) or
+# "msgpack". Reads sniff the first byte, so files written in any codec keep
+# loading and are converted as they are rewritten (or all at once: recode).
+#
+# Import existing JSON files into SQLite / split them into shards:
+#   python app_storage.py migrate [--src DIR]
+#   python app_storage.py split   [--src DIR]
+#   python app_storage.py compact
+#   python app_storage.py adopt-legacy [--src DIR]   (blueprints' old root-level files)
+#   python app_storage.py recode [--codec msgpack]   (rewrite DATA_DIR files in one codec)
+
+from __future__ import annotations
+
+import os, sys, json, copy, time, random, pickle, hashlib, sqlite3, threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional
+
+try:
+    import fcntl  # POSIX advisory locks (Render/Linux); absent on Windows dev boxes
+except Exception:
+    fcntl = None
+
+try:
+    import orjson  # optional: faster parse + compact dumps
+except Exception:
+    orjson = None
+
+try:
+    import msgpack  # optional: STORAGE_CODEC=msgpack
+except Exception:
+    msgpack = None
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DATA_DIR = os.getenv("DATA_DIR", os.path.join(BASE_DIR, "data"))
+os.makedirs(DATA_DIR, exist_ok=True)
+
+STORAGE_BACKEND = (os.getenv("STORAGE_BACKEND") or "json").strip().lower()
+SQLITE_PATH     = os.getenv("SQLITE_PATH", os.path.join(DATA_DIR, "retainai.sqlite3"))
+
+WAL_DIR           = os.getenv("STORAGE_WAL_DIR", os.path.join(DATA_DIR, "wal"))
+WAL_ENTITIES      = tuple(e.strip() for e in (os.getenv("STORAGE_WAL") or "").split(",") if e.strip())
+WAL_MAX_BYTES     = int(os.getenv("STORAGE_WAL_MAX_BYTES", str(4 * 1024 * 1024)))
+WAL_MAX_AGE       = float(os.getenv("STORAGE_WAL_MAX_AGE", "300"))
+WAL_FSYNC         = os.getenv("STORAGE_WAL_FSYNC", "1") == "1"
+WAL_COMPACT_EVERY = float(os.getenv("STORAGE_WAL_COMPACT_EVERY", "5"))
+
+JSON_CACHE_BYTES  = int(os.getenv("JSON_CACHE_BYTES", str(64 * 1024 * 1024)))
+JSON_COALESCE_MS  = float(os.getenv("JSON_COALESCE_MS", "0"))
+JSON_FSYNC        = os.getenv("JSON_FSYNC", "1") == "1"
+STORAGE_CODEC     = (os.getenv("STORAGE_CODEC") or "json").strip().lower()  # json | compact | msgpack
+
+LOCK_DIR          = os.getenv("STORAGE_LOCK_DIR", os.path.join(DATA_DIR, "locks"))
+LOCK_TIMEOUT      = float(os.getenv("STORAGE_LOCK_TIMEOUT", "30"))
+UNLOCKED_ENTITIES = ("statuses",)  # blind per-message writes; a lock file per message id isn't worth it
+
+# entity -> file name under DATA_DIR (the JSON layout app.py has always used)
+ENTITY_FILES = {
+    "leads":         "leads.json",
+    "users":         "users.json",
+    "notifications": "notifications.json",
+    "appointments":  "appointments.json",
+    "chats":         "whatsapp_chats.json",  # legacy; threads now live in app_chats
+    "statuses":      "whatsapp_status.json",
+    "notes":         "notes.json",
+    # blueprints
+    "appointments_pending": "appointments_pending.json",  # wa-auto suggestions, per user
+    "invites":              "invites.json",               # team invites, per token
+    "google_tokens":        "google_tokens.json",         # People API tokens, per user
+    "google_sync":          "google_sync.json",           # People API nextSyncToken, per user
+    # derived
+    "wa_numbers":           "whatsapp_numbers.json",      # hash bucket -> {number: [[user, lead_id]]} (app_wa_numbers)
+    "notification_state":   "notification_state.json",    # read watermark + unread counter, per user (app_notifications)
+}
+
+# entities the sharded backend splits one file per bucket (per user; wa_numbers per hash bucket)
+SHARDED_ENTITIES = ("leads", "chats", "notes", "notifications", "notification_state", "appointments", "appointments_pending",
+                    "wa_numbers")
+
+def entity_path(entity: str, base_dir: Optional[str] = None) -> str:
+    return os.path.join(base_dir or DATA_DIR, ENTITY_FILES[entity])
+
+def shard_name(key: str) -> str:
+    return hashlib.sha1(str(key).encode("utf-8")).hexdigest()[:20] + ".json"
+
+# ----------------------------
+# Read-only views
+# ----------------------------
+def _readonly(self, *a, **k):
+    raise TypeError("read-only storage view; use load_json()/get_bucket() for a mutable copy")
+
+class FrozenDict(dict):
+    __setitem__ = __delitem__ = __ior__ = _readonly
+    pop = popitem = setdefault = update = clear = _readonly
+    def __copy__(self): return dict(self)
+    def __deepcopy__(self, memo): return thaw(self)
+    def __reduce__(self): return (dict, (thaw(self),))
+
+class FrozenList(list):
+    __setitem__ = __delitem__ = __iadd__ = __imul__ = _readonly
+    append = extend = insert = pop = remove = clear = sort = reverse = _readonly
+    def __copy__(self): return list(self)
+    def __deepcopy__(self, memo): return thaw(self)
+    def __reduce__(self): return (list, (thaw(self),))
+
+def freeze(obj: Any) -> Any:
+    if isinstance(obj, dict):
+        return FrozenDict((k, freeze(v)) for k, v in obj.items())
+    if isinstance(obj, list):
+        return FrozenList(freeze(v) for v in obj)
+    return obj
+
+def thaw(obj: Any) -> Any:
+    if isinstance(obj, dict):
+        return {k: thaw(v) for k, v in obj.items()}
+    if isinstance(obj, list):
+        return [thaw(v) for v in obj]
+    return obj
+
+# ----------------------------
+# Parsed-file cache (validated by os.stat)
+# ----------------------------
+class _CacheEntry:
+    __slots__ = ("stamp", "blob", "view", "plain", "key_reads")
+    def __init__(self, stamp, blob):
+        self.stamp, self.blob, self.view, self.plain, self.key_reads = stamp, blob, None, None, 0
+
+    @property
+    def cost(self) -> int:
+        # parsed copies are full Python object graphs; weigh them well above the pickle
+        return len(self.blob) * (1 + 4 * (self.view is not None) + 4 * (self.plain is not None))
+
+_cache: "OrderedDict[str, _CacheEntry]" = OrderedDict()
+_cache_mu = threading.Lock()
+_cache_bytes = 0
+_cache_stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+def _stamp(path: str):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+def _cache_store(path: str, stamp, data: Any) -> Optional[_CacheEntry]:
+    """Remember `data` as the parsed content of `path` at `stamp`. Caller holds _cache_mu."""
+    global _cache_bytes
+    old = _cache.pop(path, None)
+    if old is not None:
+        _cache_bytes -= old.cost
+    if stamp is None or JSON_CACHE_BYTES <= 0:
+        return None
+    entry = _CacheEntry(stamp, pickle.dumps(data, protocol=pickle.HIGHEST_PROTOCOL))
+    if entry.cost > JSON_CACHE_BYTES:
+        return None
+    _cache[path] = entry
+    _cache_bytes += entry.cost
+    _cache_evict()
+    return entry
+
+def _cache_evict():
+    global _cache_bytes
+    while _cache_bytes > JSON_CACHE_BYTES and _cache:
+        _, old = _cache.popitem(last=False)
+        _cache_bytes -= old.cost
+        _cache_stats["evictions"] += 1
+
+def _cache_lookup(path: str):
+    """(entry, stamp) — entry is None on a miss."""
+    stamp = _stamp(path)
+    with _cache_mu:
+        entry = _cache.get(path)
+        if entry is not None and stamp is not None and entry.stamp == stamp:
+            _cache.move_to_end(path)
+            _cache_stats["hits"] += 1
+            return entry, stamp
+        _cache_stats["misses"] += 1
+        return None, stamp
+
+def cache_stats() -> Dict[str, int]:
+    with _cache_mu:
+        return dict(_cache_stats, entries=len(_cache), bytes=_cache_bytes, budget=JSON_CACHE_BYTES)
+
+def cache_clear():
+    global _cache_bytes
+    with _cache_mu:
+        _cache.clear()
+        _cache_bytes = 0
+
+# ----------------------------
+# Codecs
+# ----------------------------
+CODECS = ("json", "compact", "msgpack")
+
+if STORAGE_CODEC not in CODECS:
+    raise RuntimeError(f"Unknown STORAGE_CODEC={STORAGE_CODEC!r} (expected one of {CODECS})")
+if STORAGE_CODEC == "msgpack" and msgpack is None:
+    print("[STORAGE] STORAGE_CODEC=msgpack but msgpack is not installed; writing compact JSON", file=sys.stderr)
+
+def encode_doc(data: Any, codec: Optional[str] = None) -> bytes:
+    codec = codec or STORAGE_CODEC
+    if codec == "msgpack" and msgpack is not None:
+        return msgpack.packb(data, use_bin_type=True)
+    if codec in ("compact", "msgpack"):
+        if orjson is not None:
+            return orjson.dumps(data, option=orjson.OPT_NON_STR_KEYS)
+        return json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    if orjson is not None:
+        return orjson.dumps(data, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS)
+    return json.dumps(data, indent=2, ensure_ascii=False).encode("utf-8")
+
+def decode_doc(raw: bytes) -> Any:
+    """Decode a data file in any codec: JSON documents start with '{' or '[', anything else is msgpack."""
+    if raw[:64].lstrip()[:1] in (b"{", b"["):
+        return orjson.loads(raw) if orjson is not None else json.loads(raw.decode("utf-8"))
+    if msgpack is None:
+        raise ValueError("msgpack-encoded data file but msgpack is not installed")
+    return msgpack.unpackb(raw, raw=False, strict_map_key=False)
+
+# ----------------------------
+# JSON helpers (atomic I/O)
+# ----------------------------
+# A pending write is either a whole document, _DELETED (remove the file) or a
+# _Patch of bucket-level changes. Patches are applied to the file's current
+# content under its lock at write time, so writers that touch different
+# buckets of the same monolithic file (different tenants, different gunicorn
+# workers) never drop each other's changes.
+_DELETED = object()
+
+class _Patch(dict):
+    """key -> new bucket value (or _DELETED) for one JSON document."""
+
+def _apply_patch(doc: Any, patch: Dict[str, Any]) -> Dict[str, Any]:
+    doc = doc if isinstance(doc, dict) else {}
+    for k, v in patch.items():
+        if v is _DELETED:
+            doc.pop(k, None)
+        else:
+            doc[k] = v
+    return doc
+
+def _merge_write(old: Any, new: Any) -> Any:
+    """Fold a newer pending write for the same path into an older one."""
+    if not isinstance(new, _Patch):
+        return new
+    if isinstance(old, _Patch):
+        merged = _Patch(old)
+        merged.update(new)
+        return merged
+    return _apply_patch({} if old is _DELETED else dict(old), new)
+
+def _read_json_file(path: str):
+    with open(path, "rb") as f:
+        return decode_doc(f.read())
+
+def _load_disk(path: str):
+    """Private copy of the on-disk content of `path` (None if missing or unreadable)."""
+    entry, stamp = _cache_lookup(path)
+    if entry is not None:
+        return pickle.loads(entry.blob)
+    if stamp is None:
+        return None
+    try:
+        data = _read_json_file(path)
+    except Exception:
+        return None
+    with _cache_mu:
+        _cache_store(path, stamp, data)
+    return data
+
+def _resolve_pending(path: str, data: Any):
+    if data is _DELETED:
+        return None
+    if isinstance(data, _Patch):
+        return _apply_patch(_load_disk(path), data)
+    return data
+
+def load_json(path: str, default: Any = None):
+    """Parsed content of `path` as a private, mutable copy (served from the cache when unchanged)."""
+    found, data = _pending_write(path)
+    if found:
+        data = _resolve_pending(path, data)
+        if data is None:
+            return default if default is not None else {}
+        return pickle.loads(pickle.dumps(data, protocol=pickle.HIGHEST_PROTOCOL))
+    data = _load_disk(path)
+    return (default if default is not None else {}) if data is None else data
+
+def load_json_view(path: str, default: Any = None):
+    """Shared, frozen parsed content of `path` for read-only callers (no copy on a hit)."""
+    found, data = _pending_write(path)
+    if found:
+        data = _resolve_pending(path, data)
+        return (default if default is not None else {}) if data is None else freeze(data)
+    return _disk_view(path, default)
+
+def load_json_key(path: str, key: str, default: Any = None):
+    """
+    load_json(path).get(key, default), copying only that key: a get of one
+    bucket from a monolithic entity file doesn't copy every other tenant's.
+    """
+    found, data = _pending_write(path)
+    if found and isinstance(data, _Patch):
+        if key in data:
+            return default if data[key] is _DELETED else _copy(data[key])
+        found = False  # this key is as on disk
+    if found:
+        doc, shared = _resolve_pending(path, data), False
+    else:
+        doc, shared = _disk_keyed(path)
+    if not isinstance(doc, dict) or key not in doc:
+        return default
+    return _copy(doc[key]) if shared else doc[key]
+
+def load_json_key_view(path: str, key: str, default: Any = None):
+    """
+    load_json_view(path).get(key, default), without resolving the whole
+    document when the open batch only holds patches to other keys (a
+    monolithic entity file mid-request).
+    """
+    found, data = _pending_write(path)
+    if found and isinstance(data, _Patch):
+        if key in data:
+            return default if data[key] is _DELETED else freeze(data[key])
+        found = False  # this key is as on disk
+    doc = load_json_view(path, {}) if found else _disk_view(path, {})
+    return doc.get(key, default) if isinstance(doc, dict) else default
+
+def _copy(obj: Any) -> Any:
+    return pickle.loads(pickle.dumps(obj, protocol=pickle.HIGHEST_PROTOCOL))
+
+def _disk_keyed(path: str):
+    """
+    (doc, shared): the parsed on-disk content of `path` for load_json_key.
+    The first read of a file version unpickles a private copy, as load_json
+    would; a second one keeps a plain parsed copy on the cache entry (or uses
+    the frozen view if one is built) and later reads copy just their key out
+    of it. A file read once per write never pays for the shared copy.
+    """
+    global _cache_bytes
+    entry, stamp = _cache_lookup(path)
+    if entry is None:
+        return _load_disk(path), False
+    if entry.view is not None:
+        return entry.view, True
+    if entry.plain is not None:
+        return entry.plain, True
+    entry.key_reads += 1
+    if entry.key_reads < 2:
+        return pickle.loads(entry.blob), False
+    plain = pickle.loads(entry.blob)
+    with _cache_mu:
+        if _cache.get(path) is entry and entry.plain is None:
+            _cache_bytes -= entry.cost
+            entry.plain = plain
+            _cache_bytes += entry.cost
+            _cache_evict()
+    return plain, True
+
+def _disk_view(path: str, default: Any = None):
+    global _cache_bytes
+    entry, stamp = _cache_lookup(path)
+    if entry is None:
+        if stamp is None:
+            return default if default is not None else {}
+        try:
+            data = _read_json_file(path)
+        except Exception:
+            return default if default is not None else {}
+        with _cache_mu:
+            entry = _cache_store(path, stamp, data)
+        if entry is None:
+            return freeze(data)
+    if entry.view is None:
+        view = freeze(entry.plain if entry.plain is not None else pickle.loads(entry.blob))
+        with _cache_mu:
+            if _cache.get(path) is entry and entry.view is None:
+                _cache_bytes -= entry.cost
+                entry.view = view
+                _cache_bytes += entry.cost
+                _cache_evict()
+        return view
+    return entry.view
+
+def _write_json_file(path: str, data: Any):
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"  # per-writer, so concurrent replaces never collide
+    with open(tmp, "wb") as f:
+        f.write(encode_doc(data))
+        if JSON_FSYNC:
+            f.flush()
+            os.fsync(f.fileno())
+    os.replace(tmp, path)
+    with _cache_mu:
+        _cache_store(path, _stamp(path), data)
+
+def _commit_file(path: str, data: Any):
+    """Make one pending write durable, under the file's cross-process lock."""
+    with file_lock(_file_lock_path(path)):
+        if isinstance(data, _Patch):
+            data = _apply_patch(_load_disk(path), data)
+        if data is _DELETED:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            with _cache_mu:
+                _cache_store(path, None, None)
+            return
+        _write_json_file(path, data)
+
+def _queue_write(path: str, data: Any):
+    pending = getattr(_batch, "pending", None)
+    if pending is not None:
+        pending[path] = _merge_write(pending[path], data) if path in pending else data
+        pending.move_to_end(path)
+        return
+    _flush_writes({path: data})
+
+def save_json(path: str, data: Any):
+    _queue_write(path, data)
+
+def patch_json(path: str, key: str, value: Any = _DELETED):
+    """Set (or, without `value`, drop) one top-level key of the JSON document at `path`."""
+    _queue_write(path, _Patch({key: value}))
+
+def remove_json(path: str):
+    _queue_write(path, _DELETED)
+
+# ----------------------------
+# Group commit
+# ----------------------------
+_batch = threading.local()
+
+class _GroupCommitter:
+    """
+    Merges writes arriving within JSON_COALESCE_MS of each other: each path is
+    written once per group (patches to it stacked), then every submitter whose
+    write was in the group is released (or gets the write error).
+    """
+    def __init__(self, window_ms: float):
+        self.window = window_ms / 1000.0
+        self._cv = threading.Condition()
+        self._pending: "OrderedDict[str, Any]" = OrderedDict()
+        self._inflight: Dict[str, Any] = {}
+        self._waiters: list = []
+        self._thread: Optional[threading.Thread] = None
+        self.stats = {"submits": 0, "flushes": 0, "files_written": 0}
+
+    def peek(self, path: str):
+        with self._cv:
+            if path in self._pending:
+                if path in self._inflight:
+                    return True, _merge_write(self._inflight[path], self._pending[path])
+                return True, self._pending[path]
+            if path in self._inflight:
+                return True, self._inflight[path]
+        return False, None
+
+    def submit(self, writes: Dict[str, Any]):
+        done, box = threading.Event(), {}
+        with self._cv:
+            for path, data in writes.items():
+                self._pending[path] = _merge_write(self._pending[path], data) if path in self._pending else data
+                self._pending.move_to_end(path)
+            self._waiters.append((done, box, set(writes)))
+            self.stats["submits"] += 1
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="json-group-commit", daemon=True)
+                self._thread.start()
+            self._cv.notify()
+        done.wait()
+        if box.get("error") is not None:
+            raise box["error"]
+
+    def _run(self):
+        while True:
+            with self._cv:
+                while not self._pending:
+                    self._cv.wait()
+            time.sleep(self.window)  # let the rest of the burst arrive
+            with self._cv:
+                group, self._pending = self._pending, OrderedDict()
+                waiters, self._waiters = self._waiters, []
+                self._inflight = dict(group)
+            errors = {}
+            for path, data in group.items():
+                try:
+                    _commit_file(path, data)
+                except Exception as e:
+                    errors[path] = e
+            with self._cv:
+                self._inflight = {}
+                self.stats["flushes"] += 1
+                self.stats["files_written"] += len(group)
+            for done, box, paths in waiters:
+                box["error"] = next((errors[p] for p in paths if p in errors), None)
+                done.set()
+
+_committer = _GroupCommitter(JSON_COALESCE_MS) if JSON_COALESCE_MS > 0 else None
+
+def _pending_write(path: str):
+    pending = getattr(_batch, "pending", None)
+    if pending is not None and path in pending:
+        if _committer is not None and isinstance(pending[path], _Patch):
+            found, queued = _committer.peek(path)
+            if found:
+                return True, _merge_write(queued, pending[path])
+        return True, pending[path]
+    if _committer is not None:
+        return _committer.peek(path)
+    return False, None
+
+def _flush_writes(writes: Dict[Any, Any]):
+    rows = [(k, v) for k, v in writes.items() if isinstance(k, tuple)]
+    if rows:  # SqliteBackend rows, keyed (db path, entity, key); everything else is a file path
+        writes = OrderedDict((k, v) for k, v in writes.items() if not isinstance(k, tuple))
+        by_db: Dict[str, list] = {}
+        for (db, entity, key), value in rows:
+            by_db.setdefault(db, []).append((entity, key, value))
+        for db, changes in by_db.items():
+            _sqlite_backends[db].commit_rows(changes)
+    if not writes:
+        return
+    if _committer is not None:
+        _committer.submit(writes)
+        return
+    for path, data in writes.items():
+        _commit_file(path, data)
+
+def begin_write_batch():
+    """Defer save_json in this thread until commit_write_batch(). Nested calls join the open batch."""
+    if getattr(_batch, "pending", None) is None:
+        _batch.pending = OrderedDict()
+        _batch.depth = 0
+        _batch.after = []
+    _batch.depth += 1
+
+def commit_write_batch(force: bool = False):
+    """
+    Write every file touched since begin_write_batch() once; returns after
+    they are durable. Bucket locks taken during the batch are released (and
+    their versions bumped) only then.
+    """
+    pending = getattr(_batch, "pending", None)
+    if pending is None:
+        _release_retained(bump=True)
+        return
+    _batch.depth -= 1
+    if _batch.depth > 0 and not force:
+        return
+    _batch.pending = None
+    after, _batch.after = getattr(_batch, "after", None) or [], []
+    try:
+        _flush_writes(pending)
+    except BaseException:
+        _release_retained(bump=True, landed=False)
+        raise
+    _release_retained(bump=True)
+    _run_after(after)
+
+def after_commit(fn):
+    """
+    Run fn once this thread's open write batch is durable (right away outside
+    a batch, or under write_through). Dropped if the batch fails to land, so
+    side effects such as live events never announce writes that were lost.
+    """
+    if getattr(_batch, "pending", None) is None:
+        _run_after([fn])
+        return
+    _batch.after.append(fn)
+
+def _run_after(fns: list):
+    for fn in fns:
+        try:
+            fn()
+        except Exception as e:
+            print(f"[STORAGE] after-commit hook {getattr(fn, '__name__', fn)} failed: {e}", file=sys.stderr)
+
+def _flush_batch_early():
+    """Write out the open batch and drop the bucket locks it retains (the batch stays open)."""
+    pending = getattr(_batch, "pending", None)
+    if pending:
+        writes = OrderedDict(pending)
+        pending.clear()
+        _flush_writes(writes)
+    _release_retained(bump=True)
+
+@contextmanager
+def write_batch():
+    begin_write_batch()
+    try:
+        yield
+    finally:
+        commit_write_batch()
+
+@contextmanager
+def write_through():
+    """
+    Write immediately even inside a batch (WAL snapshots must hit disk before
+    the log is reset). A write_batch() opened inside is a batch of its own: the
+    outer batch's pending writes, after-commit hooks and retained bucket locks
+    are set aside until the block exits, so committing the inner one neither
+    flushes the outer batch nor releases locks whose writes have yet to land.
+    """
+    saved = (getattr(_batch, "pending", None), getattr(_batch, "depth", 0), getattr(_batch, "after", None) or [])
+    retained = [lk for lk in _held().values() if lk.depth == 0]
+    for lk in retained:
+        lk.depth += 1  # still re-entrant for this thread, but not released by an inner commit
+    _batch.pending = None
+    try:
+        yield
+    finally:
+        for lk in retained:
+            lk.depth -= 1
+        _batch.pending, _batch.depth, _batch.after = saved
+
+def write_stats() -> Dict[str, int]:
+    return dict(_committer.stats, window_ms=JSON_COALESCE_MS) if _committer is not None else {"window_ms": 0}
+
+def _dumps(value: Any) -> str:
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":"))
+
+@contextmanager
+def file_lock(path: str, shared: bool = False):
+    """Advisory lock on `path` (created if missing). No-op where fcntl is unavailable."""
+    if fcntl is None:
+        yield
+        return
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+        yield
+    finally:
+        try: fcntl.flock(fd, fcntl.LOCK_UN)
+        finally: os.close(fd)
+
+def _file_lock_path(path: str) -> str:
+    return os.path.join(LOCK_DIR, "files", shard_name(os.path.abspath(path))[:-5] + ".lock")
+
+# ----------------------------
+# Bucket locks & version stamps
+# ----------------------------
+# Each (entity, bucket) has a lock file DATA_DIR/locks/<entity>/<sha1(key)>.lock
+# whose content is the bucket's version stamp. put_bucket/delete_bucket and the
+# item helpers hold it (flock, exclusive) around the change, so workers writing
+# different tenants run in parallel while writers of one tenant queue up.
+#
+# Inside a write batch a lock is retained until the batch is durable (until
+# then the new data exists only in this worker's memory); the version is
+# bumped as the lock is released. If a lock is busy while this thread retains
+# finished ones, the batch is flushed and those released first, so two
+# requests never wait on each other's retained locks.
+#
+# Read-modify-write cycles either hold the lock across the read:
+#   with bucket_lock("leads", user):
+#       arr = get_bucket("leads", user, []); ...; put_bucket("leads", user, arr)
+# or go optimistic — re-read and retry if the version moved:
+#   update_bucket("leads", user, fn, [])
+class VersionConflict(RuntimeError):
+    """The bucket's version changed between read and write."""
+
+class LockTimeout(RuntimeError):
+    pass
+
+class BucketLock:
+    __slots__ = ("entity", "key", "fd", "version", "depth", "dirty", "writes")
+    def __init__(self, entity, key, fd, version):
+        self.entity, self.key, self.fd, self.version = entity, key, fd, version
+        self.depth, self.dirty, self.writes = 0, False, 0
+
+    @property
+    def current(self) -> int:
+        """Version as this thread sees it (a pending change counts)."""
+        return self.version + (1 if self.dirty else 0)
+
+_locks = threading.local()
+
+def _held() -> Dict[tuple, BucketLock]:
+    held = getattr(_locks, "held", None)
+    if held is None:
+        held = _locks.held = {}
+    return held
+
+def _lock_path(entity: str, key: str) -> str:
+    return os.path.join(LOCK_DIR, entity, shard_name(key)[:-5] + ".lock")
+
+def _read_version(fd: int) -> int:
+    os.lseek(fd, 0, os.SEEK_SET)
+    try:
+        return int(os.read(fd, 32) or 0)
+    except ValueError:
+        return 0
+
+def _try_flock(fd: int) -> bool:
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        return True
+    except (BlockingIOError, PermissionError):
+        return False
+
+def _acquire(entity: str, key: str) -> BucketLock:
+    path = _lock_path(entity, key)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        if fcntl is not None and not _try_flock(fd):
+            if any(lk.depth == 0 for lk in _held().values()):
+                _flush_batch_early()
+            deadline, delay = time.monotonic() + LOCK_TIMEOUT, 0.0005
+            while not _try_flock(fd):
+                if time.monotonic() > deadline:
+                    raise LockTimeout(f"{entity}/{key}: lock busy for {LOCK_TIMEOUT:g}s")
+                time.sleep(delay)
+                delay = min(delay * 2, 0.01)
+        return BucketLock(entity, key, fd, _read_version(fd))
+    except BaseException:
+        os.close(fd)
+        raise
+
+def _release(lk: BucketLock, bump: bool, landed: bool = True):
+    try:
+        if bump and lk.dirty:
+            os.lseek(lk.fd, 0, os.SEEK_SET)
+            os.write(lk.fd, str(lk.version + 1).encode("ascii"))  # stamps only grow, no truncate needed
+        if lk.writes:
+            _index_restamp(lk, (lk.version + 1, 0) if (bump and landed) else None)
+    finally:
+        try:
+            if fcntl is not None:
+                fcntl.flock(lk.fd, fcntl.LOCK_UN)
+        finally:
+            os.close(lk.fd)
+
+def _release_retained(bump: bool, landed: bool = True):
+    held = _held()
+    for k, lk in list(held.items()):
+        if lk.depth == 0:
+            held.pop(k, None)
+            _release(lk, bump, landed)
+
+@contextmanager
+def bucket_lock(entity: str, key: str):
+    """Exclusive cross-process lock on one bucket; re-entrant within a thread. Yields the BucketLock."""
+    held, k = _held(), (entity, str(key))
+    lk = held.get(k)
+    if lk is None:
+        lk = held[k] = _acquire(entity, str(key))
+    lk.depth += 1
+    try:
+        yield lk
+    finally:
+        lk.depth -= 1
+        if lk.depth == 0 and getattr(_batch, "pending", None) is None:
+            held.pop(k, None)
+            _release(lk, bump=True)
+
+def bucket_version(entity: str, key: str) -> int:
+    """Version stamp of a bucket; grows by one with every committed change."""
+    lk = _held().get((entity, str(key)))
+    if lk is not None:
+        return lk.current
+    try:
+        fd = os.open(_lock_path(entity, key), os.O_RDONLY)
+    except FileNotFoundError:
+        return 0
+    try:
+        return _read_version(fd)
+    finally:
+        os.close(fd)
+
+def bucket_etag(entity: str, key: str, *variant: Any) -> str:
+    """
+    Strong validator for a response built from one bucket (plus whatever
+    `variant` selects from it): moves with every committed write, without
+    reading or serializing the bucket. Take it before reading the bucket, so
+    a write landing in between can only pair newer data with the older tag.
+    """
+    raw = "\0".join([entity, str(key), str(bucket_version(entity, key))] + [str(v) for v in variant])
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()[:24]
+
+def conditional_response(tag: str, build):
+    """
+    GET body behind a strong ETag (bucket_etag): 304 when the client already
+    holds `tag`, otherwise build() is serialized. no-cache makes browsers
+    revalidate every poll instead of serving their copy blind.
+    """
+    from flask import request, jsonify, make_response  # request-time only; storage itself stays Flask-free
+    if request.if_none_match.contains(tag):
+        resp = make_response("", 304)
+    else:
+        resp = make_response(jsonify(build()), 200)
+    resp.set_etag(tag)
+    resp.headers["Cache-Control"] = "no-cache"
+    return resp
+
+def _bucket_stamp(entity: str, key: str) -> tuple:
+    """(committed version, writes by this thread's open lock) — changes with every write anyone makes."""
+    lk = _held().get((entity, str(key)))
+    if lk is not None:
+        return (lk.version, lk.writes)
+    return (bucket_version(entity, key), 0)
+
+@contextmanager
+def _changing(entity: str, key: str, expect_version: Optional[int] = None):
+    """Yields the held BucketLock (None for UNLOCKED_ENTITIES) around one write to a bucket."""
+    if entity in UNLOCKED_ENTITIES:
+        yield None
+        _index_drop(entity, key)
+        return
+    with bucket_lock(entity, key) as lk:
+        if expect_version is not None and lk.current != expect_version:
+            raise VersionConflict(f"{entity}/{key}: version {lk.current}, expected {expect_version}")
+        lk.dirty = True
+        try:
+            yield lk
+        except BaseException:
+            _index_drop(entity, key)
+            raise
+        lk.writes += 1
+
+# ----------------------------
+# Item index (id -> item per list bucket)
+# ----------------------------
+# List buckets (leads, notes, appointments, ...) are looked up by item id all
+# the time. item_index() keeps an id -> frozen item map per bucket, in bucket
+# order, stamped with _bucket_stamp(): a write from another worker moves the
+# version and forces a rebuild, while this process's own upsert_item /
+# remove_item / put_bucket calls update the cached map in place, so a tenant
+# with 50k leads pays the O(n) build once rather than on every edit. Views
+# derived from the items (derived_index) survive a rebuild: they are handed
+# the diff between the stale map and the fresh one.
+ITEM_INDEX_BUCKETS = int(os.getenv("ITEM_INDEX_BUCKETS", "512"))
+
+class ItemIndex:
+    """Read-only id -> item map for one list bucket (items are frozen; thaw() before editing)."""
+    __slots__ = ("stamp", "items", "gen", "derived")
+    def __init__(self, stamp, items: Dict[str, Any]):
+        self.stamp, self.items = stamp, items
+        self.gen = 0       # in-place updates applied
+        self.derived = {}  # name -> view kept in step via .apply(changes); see derived_index()
+
+    @classmethod
+    def build(cls, stamp, bucket) -> "ItemIndex":
+        items: Dict[str, Any] = {}
+        for x in bucket or ():
+            if isinstance(x, dict):
+                items.setdefault(str(x.get("id")), x)  # first match wins, like apply_record's upsert
+        return cls(stamp, items)
+
+    def get(self, item_id: Any, default: Any = None) -> Any:
+        return self.items.get(str(item_id), default)
+
+    def __contains__(self, item_id: Any) -> bool:
+        return str(item_id) in self.items
+
+    def __len__(self) -> int:
+        return len(self.items)
+
+    def __iter__(self):
+        return iter(self.items.values())
+
+_indexes: "OrderedDict[tuple, ItemIndex]" = OrderedDict()
+_index_mu = threading.Lock()
+_index_stats = {"hits": 0, "builds": 0, "refreshes": 0, "updates": 0}
+
+def item_index(entity: str, key: str) -> ItemIndex:
+    k, stamp = (entity, str(key)), _bucket_stamp(entity, key)
+    with _index_mu:
+        stale = _indexes.get(k)
+        if stale is not None and stale.stamp == stamp:
+            _indexes.move_to_end(k)
+            _index_stats["hits"] += 1
+            return stale
+        gen = stale.gen if stale is not None else None
+        before = dict(stale.items) if stale is not None and stale.derived else None
+    idx = ItemIndex.build(stamp, view_bucket(entity, key, []))
+    # derived views of a stale index catch up on the difference instead of being rebuilt
+    changes = _diff_items(before, idx.items) if before is not None else None
+    with _index_mu:
+        if changes is not None and _indexes.get(k) is stale and stale.gen == gen:
+            for view in stale.derived.values():
+                view.apply(changes)
+            idx.derived = stale.derived
+            _index_stats["refreshes"] += 1
+        else:
+            _index_stats["builds"] += 1
+        _indexes[k] = idx
+        _indexes.move_to_end(k)
+        while len(_indexes) > ITEM_INDEX_BUCKETS:
+            _indexes.popitem(last=False)
+    return idx
+
+def derived_index(entity: str, key: str, name: str, build):
+    """
+    A view computed from a bucket's items (search postings, aggregates, ...),
+    cached on its ItemIndex: build(items) makes it, and every in-place index
+    update calls view.apply([(old, new), ...]) under the index mutex. A
+    rebuilt ItemIndex starts without views, so they never outlive their data.
+    """
+    while True:
+        idx = item_index(entity, key)
+        with _index_mu:
+            view, gen = idx.derived.get(name), idx.gen
+        if view is not None:
+            return view
+        view = build(idx.items)
+        with _index_mu:
+            if idx.gen == gen:  # no write slipped in while we built
+                return idx.derived.setdefault(name, view)
+
+def index_stats() -> Dict[str, int]:
+    with _index_mu:
+        return dict(_index_stats, buckets=len(_indexes))
+
+def _index_drop(entity: str, key: str):
+    """Mark a bucket's index stale (the next item_index() refreshes it)."""
+    with _index_mu:
+        idx = _indexes.get((entity, str(key)))
+        if idx is not None:
+            idx.stamp = None
+
+def _index_update(lk: Optional[BucketLock], entity: str, key: str, fn):
+    """
+    After a write under `lk`: apply fn(items) to the cached index if it was
+    current, else drop it. fn returns the [(old, new), ...] it made, which
+    its derived views get too.
+    """
+    k = (entity, str(key))
+    with _index_mu:
+        idx = _indexes.get(k)
+        if idx is None:
+            return
+        if lk is None or idx.stamp != (lk.version, lk.writes):
+            idx.stamp = None
+            return
+        changes = fn(idx.items)
+        for view in idx.derived.values():
+            view.apply(changes)
+        idx.gen += 1
+        idx.stamp = (lk.version, lk.writes + 1)
+        _index_stats["updates"] += 1
+
+def _index_restamp(lk: BucketLock, stamp: Optional[tuple]):
+    """On lock release: carry our own index over to the bumped version (or mark it stale if the write didn't land)."""
+    k = (lk.entity, lk.key)
+    with _index_mu:
+        idx = _indexes.get(k)
+        if idx is not None and idx.stamp == (lk.version, lk.writes):
+            idx.stamp = stamp
+
+# ----------------------------
+# Item watchers
+# ----------------------------
+# Derived data (the WhatsApp number index, ...) registers watch_items(entity,
+# fn) instead of hooking every call site: fn(key, changes) runs under the
+# bucket lock after each upsert_item / remove_item / put_bucket /
+# delete_bucket on that entity, with changes = [(old, new), ...] of frozen
+# items (old None for an insert, new None for a removal). save_entity bypasses
+# watchers; whoever owns the derived data rebuilds it after maintenance.
+_watchers: Dict[str, list] = {}
+
+def watch_items(entity: str, fn):
+    _watchers.setdefault(entity, []).append(fn)
+
+def _items_of(bucket: Any) -> Dict[str, Any]:
+    return ItemIndex.build(None, freeze(bucket) if isinstance(bucket, list) else ()).items
+
+def _diff_items(old: Dict[str, Any], new: Dict[str, Any]) -> list:
+    changes = [(o, new.get(i)) for i, o in old.items() if new.get(i) != o]
+    changes += [(None, n) for i, n in new.items() if i not in old]
+    return changes
+
+def _notify_watchers(entity: str, key: str, changes: list):
+    for fn in _watchers.get(entity, ()):
+        try:
+            fn(key, changes)
+        except Exception as e:  # derived data must never fail the write it follows
+            print(f"[STORAGE] {entity} watcher {getattr(fn, '__name__', fn)} failed: {e}", file=sys.stderr)
+
+# ----------------------------
+# Mutation records
+# ----------------------------
+# One record = one change to one bucket:
+#   {"op": "put",    "k": key, "v": bucket}
+#   {"op": "del",    "k": key}
+#   {"op": "upsert", "k": key, "v": item}            list bucket; replace by item["id"] or append
+#   {"op": "upsert_many", "k": key, "v": [item, ...]} the same for each item, in one pass over the bucket
+#   {"op": "remove", "k": key, "id": item_id}        list bucket by item["id"], dict bucket by key
+#   {"op": "append", "k": key, "sub": sub, "v": item} dict-of-lists bucket (chats: lead_id -> msgs)
+def apply_record(data: Dict[str, Any], rec: Dict[str, Any]):
+    op, k = rec.get("op"), rec.get("k")
+    if op == "put":
+        data[k] = rec.get("v")
+    elif op == "del":
+        data.pop(k, None)
+    elif op == "upsert":
+        arr = data.get(k)
+        if not isinstance(arr, list):
+            arr = data[k] = []
+        item = rec.get("v") or {}
+        iid = str(item.get("id"))
+        for i, x in enumerate(arr):
+            if str(x.get("id")) == iid:
+                arr[i] = item
+                break
+        else:
+            arr.append(item)
+    elif op == "upsert_many":
+        arr = data.get(k)
+        if not isinstance(arr, list):
+            arr = data[k] = []
+        pos: Dict[str, int] = {}
+        for i, x in enumerate(arr):
+            pos.setdefault(str(x.get("id")), i)
+        for item in rec.get("v") or ():
+            iid = str(item.get("id"))
+            i = pos.get(iid)
+            if i is not None:
+                arr[i] = item
+            else:
+                pos[iid] = len(arr)
+                arr.append(item)
+    elif op == "remove":
+        bucket = data.get(k)
+        if isinstance(bucket, dict):
+            bucket.pop(str(rec.get("id")), None)
+        elif isinstance(bucket, list):
+            data[k] = [x for x in bucket if str(x.get("id")) != str(rec.get("id"))]
+    elif op == "append":
+        bucket = data.get(k)
+        if not isinstance(bucket, dict):
+            bucket = data[k] = {}
+        arr = bucket.get(rec.get("sub"))
+        if not isinstance(arr, list):
+            arr = bucket[rec.get("sub")] = []
+        arr.append(rec.get("v"))
+
+# ----------------------------
+# Backends
+# ----------------------------
+class StorageBackend:
+    """Entity store. `load`/`save` move whole entities, `get`/`put`/`delete` single buckets."""
+    name = "base"
+
+    def load(self, entity: str) -> Dict[str, Any]:
+        raise NotImplementedError
+
+    def save(self, entity: str, data: Dict[str, Any]):
+        raise NotImplementedError
+
+    def get(self, entity: str, key: str, default: Any = None) -> Any:
+        return self.load(entity).get(key, default)
+
+    def put(self, entity: str, key: str, value: Any):
+        data = self.load(entity)
+        data[key] = value
+        self.save(entity, data)
+
+    def delete(self, entity: str, key: str):
+        data = self.load(entity)
+        if key in data:
+            data.pop(key)
+            self.save(entity, data)
+
+    def view(self, entity: str, key: str, default: Any = None) -> Any:
+        """Read-only bucket; file backends return the cached frozen object instead of a copy."""
+        return self.get(entity, key, default)
+
+    def apply(self, entity: str, rec: Dict[str, Any]):
+        """Apply one mutation record; the default is a read-modify-write of that bucket."""
+        key = rec["k"]
+        current = self.get(entity, key)
+        tmp = {} if current is None else {key: current}
+        apply_record(tmp, rec)
+        if key in tmp:
+            self.put(entity, key, tmp[key])
+        elif current is not None:
+            self.delete(entity, key)
+
+
+class JsonFileBackend(StorageBackend):
+    name = "json"
+
+    def __init__(self, base_dir: Optional[str] = None):
+        self.base_dir = base_dir or DATA_DIR
+
+    def load(self, entity):
+        data = load_json(entity_path(entity, self.base_dir), {})
+        return data if isinstance(data, dict) else {}
+
+    def save(self, entity, data):
+        save_json(entity_path(entity, self.base_dir), data)
+
+    def put(self, entity, key, value):
+        patch_json(entity_path(entity, self.base_dir), key, value)
+
+    def delete(self, entity, key):
+        patch_json(entity_path(entity, self.base_dir), key)
+
+    def get(self, entity, key, default=None):
+        return load_json_key(entity_path(entity, self.base_dir), key, default)
+
+    def view(self, entity, key, default=None):
+        return load_json_key_view(entity_path(entity, self.base_dir), key, default)
+
+
+class ShardedJsonBackend(JsonFileBackend):
+    """
+    Per-user entities live in DATA_DIR/<entity>/<sha1(key)>.json as
+    {"key": <bucket key>, "value": <bucket>}; everything else stays in the
+    monolithic files. A tenant's write re-serializes only its own shard.
+    """
+    name = "sharded"
+
+    def _dir(self, entity):
+        return os.path.join(self.base_dir, entity)
+
+    def _shard(self, entity, key):
+        return os.path.join(self._dir(entity), shard_name(key))
+
+    def load(self, entity):
+        if entity not in SHARDED_ENTITIES:
+            return super().load(entity)
+        out = {}
+        d = self._dir(entity)
+        if not os.path.isdir(d):
+            return out
+        for fname in sorted(os.listdir(d)):
+            if not fname.endswith(".json"):
+                continue
+            doc = load_json(os.path.join(d, fname), {})
+            if isinstance(doc, dict) and "key" in doc:
+                out[doc["key"]] = doc.get("value")
+        return out
+
+    def save(self, entity, data):
+        if entity not in SHARDED_ENTITIES:
+            return super().save(entity, data)
+        keep = set()
+        for key, value in (data or {}).items():
+            keep.add(shard_name(key))
+            path = self._shard(entity, key)
+            if load_json(path, {}) != {"key": key, "value": value}:
+                self.put(entity, key, value)
+        d = self._dir(entity)
+        if os.path.isdir(d):
+            for fname in os.listdir(d):
+                if fname.endswith(".json") and fname not in keep:
+                    remove_json(os.path.join(d, fname))
+
+    def get(self, entity, key, default=None):
+        if entity not in SHARDED_ENTITIES:
+            return super().get(entity, key, default)
+        doc = load_json(self._shard(entity, key), {})
+        return doc.get("value", default) if isinstance(doc, dict) and doc.get("key") == key else default
+
+    def view(self, entity, key, default=None):
+        if entity not in SHARDED_ENTITIES:
+            return super().view(entity, key, default)
+        doc = load_json_view(self._shard(entity, key), {})
+        return doc.get("value", default) if isinstance(doc, dict) and doc.get("key") == key else default
+
+    def put(self, entity, key, value):
+        if entity not in SHARDED_ENTITIES:
+            return super().put(entity, key, value)
+        os.makedirs(self._dir(entity), exist_ok=True)
+        save_json(self._shard(entity, key), {"key": key, "value": value})
+
+    def delete(self, entity, key):
+        if entity not in SHARDED_ENTITIES:
+            return super().delete(entity, key)
+        remove_json(self._shard(entity, key))
+
+
+_sqlite_backends: Dict[str, "SqliteBackend"] = {}  # db path -> backend, for flushing batched rows
+
+class SqliteBackend(StorageBackend):
+    """
+    One row per (entity, bucket). `save` compares content digests and only
+    upserts/deletes the buckets that actually changed, so writing one tenant's
+    leads no longer re-serializes every other tenant's. Inside a write batch
+    put/delete are held per thread (reads see them) and commit_write_batch
+    writes them in one transaction.
+    """
+    name = "sqlite"
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path or SQLITE_PATH
+        self._local = threading.local()
+        with self._conn() as c:
+            c.execute("""CREATE TABLE IF NOT EXISTS buckets (
+                            entity TEXT NOT NULL,
+                            key    TEXT NOT NULL,
+                            value  TEXT NOT NULL,
+                            digest TEXT NOT NULL,
+                            PRIMARY KEY (entity, key))""")
+        _sqlite_backends[self.path] = self
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=FULL")  # a committed (acknowledged) write survives power loss
+            self._local.conn = conn
+        return conn
+
+    def _pending(self, entity: str, key: str):
+        """(found, value) of a put/delete held in this thread's open batch; value is _DELETED for a delete."""
+        pending = getattr(_batch, "pending", None)
+        k = (self.path, entity, str(key))
+        if pending is not None and k in pending:
+            return True, pending[k]
+        return False, None
+
+    def load(self, entity):
+        rows = self._conn().execute("SELECT key, value FROM buckets WHERE entity=?", (entity,))
+        data = {k: json.loads(v) for k, v in rows}
+        for k, value in list((getattr(_batch, "pending", None) or {}).items()):
+            if isinstance(k, tuple) and k[0] == self.path and k[1] == entity:
+                if value is _DELETED:
+                    data.pop(k[2], None)
+                else:
+                    data[k[2]] = _copy(value)
+        return data
+
+    def save(self, entity, data):
+        pending = getattr(_batch, "pending", None)
+        if pending:  # a whole-entity save supersedes this batch's rows for the entity
+            for k in [k for k in pending if isinstance(k, tuple) and k[0] == self.path and k[1] == entity]:
+                del pending[k]
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            current = dict(conn.execute("SELECT key, digest FROM buckets WHERE entity=?", (entity,)))
+            for key, value in (data or {}).items():
+                raw = _dumps(value)
+                digest = hashlib.sha1(raw.encode("utf-8")).hexdigest()
+                if current.pop(str(key), None) != digest:
+                    self._upsert(conn, entity, str(key), raw, digest)
+            for gone in current:
+                conn.execute("DELETE FROM buckets WHERE entity=? AND key=?", (entity, gone))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def get(self, entity, key, default=None):
+        found, value = self._pending(entity, key)
+        if found:
+            return default if value is _DELETED else _copy(value)
+        row = self._conn().execute("SELECT value FROM buckets WHERE entity=? AND key=?", (entity, key)).fetchone()
+        return json.loads(row[0]) if row else default
+
+    def view(self, entity, key, default=None):
+        found, value = self._pending(entity, key)
+        if found:
+            return default if value is _DELETED else freeze(value)
+        return self.get(entity, key, default)
+
+    def put(self, entity, key, value):
+        self._write(entity, key, value)
+
+    def delete(self, entity, key):
+        self._write(entity, key, _DELETED)
+
+    def _write(self, entity, key, value):
+        pending = getattr(_batch, "pending", None)
+        if pending is not None:
+            pending[(self.path, entity, str(key))] = value
+            return
+        self.commit_rows([(entity, key, value)])
+
+    def commit_rows(self, changes: list):
+        """Write [(entity, key, value or _DELETED), ...] in one transaction."""
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for entity, key, value in changes:
+                if value is _DELETED:
+                    conn.execute("DELETE FROM buckets WHERE entity=? AND key=?", (entity, key))
+                else:
+                    raw = _dumps(value)
+                    self._upsert(conn, entity, key, raw, hashlib.sha1(raw.encode("utf-8")).hexdigest())
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    @staticmethod
+    def _upsert(conn, entity, key, raw, digest):
+        conn.execute(
+            "INSERT INTO buckets (entity, key, value, digest) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT(entity, key) DO UPDATE SET value=excluded.value, digest=excluded.digest",
+            (entity, key, raw, digest),
+        )
+
+
+class JournaledBackend(StorageBackend):
+    """
+    Write-ahead log in front of another backend for the entities in
+    STORAGE_WAL. The inner backend holds the last snapshot; mutations since
+    then live in DATA_DIR/wal/<entity>.log, one record per line, and in an
+    in-memory image. Every process tails the shared log before reading, and
+    compaction swaps in a fresh log file (new inode) which tells other
+    processes to reload the snapshot.
+    """
+    name = "wal"
+
+    def __init__(self, inner: StorageBackend, entities=WAL_ENTITIES, wal_dir: Optional[str] = None):
+        self.inner = inner
+        self.entities = set(entities)
+        self.wal_dir = wal_dir or WAL_DIR
+        self._mu = threading.RLock()
+        self._images: Dict[str, Dict[str, Any]] = {}
+        self._pos: Dict[str, tuple] = {}       # entity -> (log inode, bytes applied)
+        self._ids: Dict[tuple, Dict[str, int]] = {}  # (entity, key) -> item id -> position in the image's list
+        self._first_write: Dict[str, float] = {}
+        self._compactor: Optional[threading.Thread] = None
+        os.makedirs(self.wal_dir, exist_ok=True)
+
+    def _log(self, entity):
+        return os.path.join(self.wal_dir, f"{entity}.log")
+
+    def _lock(self, entity, shared=False):
+        return file_lock(self._log(entity) + ".lock", shared=shared)
+
+    def _sync(self, entity):
+        """Bring the image up to date with the snapshot + log tail. Caller holds the entity lock."""
+        path = self._log(entity)
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            with open(path, "a", encoding="utf-8"):
+                pass
+            st = os.stat(path)
+        ino, pos = self._pos.get(entity, (None, 0))
+        if entity not in self._images or ino != st.st_ino or st.st_size < pos:
+            self._images[entity] = self.inner.load(entity)
+            self._forget_ids(entity)
+            ino, pos = st.st_ino, 0
+        if st.st_size > pos:
+            with open(path, "rb") as f:
+                f.seek(pos)
+                for line in f:
+                    if not line.endswith(b"\n"):
+                        break  # torn tail from a crash mid-append; ignore
+                    pos += len(line)
+                    try:
+                        self._apply_image(entity, json.loads(line))
+                    except Exception:
+                        continue
+            if pos and entity not in self._first_write:
+                self._first_write[entity] = time.time()
+        self._pos[entity] = (ino, pos)
+
+    def load(self, entity):
+        if entity not in self.entities:
+            return self.inner.load(entity)
+        with self._mu, self._lock(entity, shared=True):
+            self._sync(entity)
+            return copy.deepcopy(self._images[entity])
+
+    def get(self, entity, key, default=None):
+        if entity not in self.entities:
+            return self.inner.get(entity, key, default)
+        with self._mu, self._lock(entity, shared=True):
+            self._sync(entity)
+            return copy.deepcopy(self._images[entity].get(key, default))
+
+    def view(self, entity, key, default=None):
+        if entity not in self.entities:
+            return self.inner.view(entity, key, default)
+        with self._mu, self._lock(entity, shared=True):
+            self._sync(entity)
+            return freeze(self._images[entity].get(key, default))
+
+    def save(self, entity, data):
+        if entity not in self.entities:
+            return self.inner.save(entity, data)
+        with self._mu, self._lock(entity), write_through():
+            self.inner.save(entity, data)
+            self._reset_log(entity)
+            self._images[entity] = copy.deepcopy(data)
+            self._forget_ids(entity)
+
+    def _forget_ids(self, entity):
+        for k in [k for k in self._ids if k[0] == entity]:
+            del self._ids[k]
+
+    def _apply_image(self, entity, rec):
+        """apply_record on the image; upserts into list buckets find their slot via an id -> position map."""
+        data, key = self._images[entity], rec.get("k")
+        arr = data.get(key)
+        if rec.get("op") in ("upsert", "upsert_many") and isinstance(arr, list):
+            ids = self._ids.get((entity, key))
+            if ids is None:
+                ids = self._ids[(entity, key)] = {}
+                for i, x in enumerate(arr):
+                    ids.setdefault(str(x.get("id")) if isinstance(x, dict) else None, i)
+            for item in (rec.get("v") or ()) if rec["op"] == "upsert_many" else [rec.get("v") or {}]:
+                iid = str(item.get("id"))
+                i = ids.get(iid)
+                if i is not None:
+                    arr[i] = item
+                else:
+                    ids[iid] = len(arr)
+                    arr.append(item)
+            return
+        self._ids.pop((entity, key), None)  # removals shift positions; rebuilt on the next upsert
+        apply_record(data, rec)
+
+    def put(self, entity, key, value):
+        self.apply(entity, {"op": "put", "k": key, "v": value})
+
+    def delete(self, entity, key):
+        self.apply(entity, {"op": "del", "k": key})
+
+    def apply(self, entity, rec):
+        if entity not in self.entities:
+            return self.inner.apply(entity, rec)
+        line = (_dumps(rec) + "\n").encode("utf-8")
+        with self._mu, self._lock(entity):
+            self._sync(entity)
+            with open(self._log(entity), "r+b") as f:
+                f.seek(self._pos[entity][1])
+                f.truncate()  # drop a torn tail left by a crash so this record starts on its own line
+                f.write(line)
+                f.flush()
+                if WAL_FSYNC:
+                    os.fsync(f.fileno())
+                end = f.tell()
+            self._apply_image(entity, copy.deepcopy(rec))
+            self._pos[entity] = (self._pos[entity][0], end)
+            self._first_write.setdefault(entity, time.time())
+        self._ensure_compactor()
+
+    # ---- compaction ----
+    def _reset_log(self, entity):
+        path = self._log(entity)
+        tmp = path + ".tmp"
+        with open(tmp, "wb"):
+            pass
+        os.replace(tmp, path)
+        st = os.stat(path)
+        self._pos[entity] = (st.st_ino, 0)
+        self._first_write.pop(entity, None)
+
+    def compact(self, entity: str, force: bool = False) -> bool:
+        """Fold the log into the inner backend if it is over the size/age threshold (or `force`)."""
+        with self._mu, self._lock(entity):
+            self._sync(entity)
+            size = self._pos[entity][1]
+            if not size:
+                return False
+            age = time.time() - self._first_write.get(entity, time.time())
+            if not (force or size >= WAL_MAX_BYTES or age >= WAL_MAX_AGE):
+                return False
+            with write_through():
+                self.inner.save(entity, self._images[entity])
+            self._reset_log(entity)
+            return True
+
+    def _ensure_compactor(self):
+        if self._compactor is not None and self._compactor.is_alive():
+            return
+        def loop():
+            while True:
+                time.sleep(WAL_COMPACT_EVERY)
+                for entity in list(self.entities):
+                    try:
+                        self.compact(entity)
+                    except Exception as e:
+                        print(f"[STORAGE WAL] compaction of {entity} failed: {e}", file=sys.stderr)
+        self._compactor = threading.Thread(target=loop, name="storage-wal-compactor", daemon=True)
+        self._compactor.start()
+
+
+BACKENDS = {"json": JsonFileBackend, "sharded": ShardedJsonBackend, "sqlite": SqliteBackend}
+
+_backend: Optional[StorageBackend] = None
+_backend_lock = threading.Lock()
+
+def get_backend() -> StorageBackend:
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                cls = BACKENDS.get(STORAGE_BACKEND)
+                if cls is None:
+                    raise RuntimeError(f"Unknown STORAGE_BACKEND={STORAGE_BACKEND!r} (expected one of {sorted(BACKENDS)})")
+                backend = cls()
+                if WAL_ENTITIES:
+                    backend = JournaledBackend(backend, WAL_ENTITIES)
+                _backend = backend
+    return _backend
+
+def load_entity(entity: str) -> Dict[str, Any]:
+    return get_backend().load(entity)
+
+def save_entity(entity: str, data: Dict[str, Any]):
+    """Whole-entity replace, outside the bucket locks — migrations and maintenance only."""
+    get_backend().save(entity, data)
+
+def get_bucket(entity: str, key: str, default: Any = None) -> Any:
+    return get_backend().get(entity, key, default)
+
+def view_bucket(entity: str, key: str, default: Any = None) -> Any:
+    """Read-only bucket for handlers that only serialize it (do not mutate the result)."""
+    return get_backend().view(entity, key, default)
+
+def put_bucket(entity: str, key: str, value: Any, expect_version: Optional[int] = None):
+    """Replace a bucket. With `expect_version`, raise VersionConflict unless it is still current."""
+    with _changing(entity, key, expect_version) as lk:
+        old = view_bucket(entity, key) if entity in _watchers else None
+        get_backend().put(entity, key, value)
+        if entity in _watchers:
+            _notify_watchers(entity, key, _diff_items(_items_of(old), _items_of(value)))
+        if isinstance(value, list):
+            _index_update(lk, entity, key, lambda items: _set_items(items, value))
+        else:
+            _index_drop(entity, key)
+
+def delete_bucket(entity: str, key: str, expect_version: Optional[int] = None):
+    with _changing(entity, key, expect_version) as lk:
+        old = view_bucket(entity, key) if entity in _watchers else None
+        get_backend().delete(entity, key)
+        if old:
+            _notify_watchers(entity, key, _diff_items(_items_of(old), {}))
+        _index_update(lk, entity, key, lambda items: _set_items(items, []))
+
+# in-place ItemIndex edits; each returns the [(old, new), ...] it made
+def _set_items(items: Dict[str, Any], bucket: list) -> list:
+    new = _items_of(bucket)
+    changes = _diff_items(items, new)
+    items.clear()
+    items.update(new)
+    return changes
+
+def _put_item(items: Dict[str, Any], item_id: str, item: Any) -> list:
+    old = items.get(item_id)
+    items[item_id] = item
+    return [(old, item)]
+
+def _pop_item(items: Dict[str, Any], item_id: str) -> list:
+    old = items.pop(item_id, None)
+    return [] if old is None else [(old, None)]
+
+def update_bucket(entity: str, key: str, fn, default: Any = None, retries: int = 8) -> Any:
+    """
+    Optimistic read-modify-write: `fn` gets a mutable copy of the bucket (or
+    of `default`) and returns the new value, or None after editing in place.
+    The write only lands if the bucket's version is unchanged; otherwise it
+    re-reads and retries. Returns the value written.
+    """
+    for attempt in range(max(1, retries)):
+        version = bucket_version(entity, key)
+        value = get_bucket(entity, key)
+        if value is None:
+            value = copy.deepcopy(default)
+        out = fn(value)
+        value = value if out is None else out
+        try:
+            put_bucket(entity, key, value, expect_version=version)
+            return value
+        except VersionConflict:
+            time.sleep(random.uniform(0, 0.002 * (attempt + 1)))
+    raise VersionConflict(f"{entity}/{key}: still conflicting after {retries} attempts")
+
+def upsert_item(entity: str, key: str, item: Dict[str, Any]):
+    """Replace the item with the same id in a list bucket, or append it."""
+    with _changing(entity, key) as lk:
+        old = item_index(entity, key).get(item.get("id")) if entity in _watchers else None
+        get_backend().apply(entity, {"op": "upsert", "k": key, "v": item})
+        frozen = freeze(item)
+        _index_update(lk, entity, key, lambda items: _put_item(items, str(item.get("id")), frozen))
+        if entity in _watchers and old != frozen:
+            _notify_watchers(entity, key, [(old, frozen)])
+
+def upsert_items(entity: str, key: str, items: List[Dict[str, Any]]):
+    """upsert_item for many items of one bucket: one mutation record (one bucket write, one WAL line)."""
+    if not items:
+        return
+    with _changing(entity, key) as lk:
+        index = item_index(entity, key) if entity in _watchers else None
+        olds = [index.get(item.get("id")) for item in items] if index is not None else None
+        get_backend().apply(entity, {"op": "upsert_many", "k": key, "v": items})
+        frozen = [freeze(item) for item in items]
+        _index_update(lk, entity, key,
+                      lambda m: [c for f in frozen for c in _put_item(m, str(f.get("id")), f)])
+        if olds is not None:
+            changes = [(old, f) for old, f in zip(olds, frozen) if old != f]
+            if changes:
+                _notify_watchers(entity, key, changes)
+
+def remove_item(entity: str, key: str, item_id: Any):
+    with _changing(entity, key) as lk:
+        old = item_index(entity, key).get(item_id) if entity in _watchers else None
+        get_backend().apply(entity, {"op": "remove", "k": key, "id": str(item_id)})
+        _index_update(lk, entity, key, lambda items: _pop_item(items, str(item_id)))
+        if old is not None:
+            _notify_watchers(entity, key, [(old, None)])
+
+def append_item(entity: str, key: str, sub: str, item: Any):
+    """Append to bucket[sub] in a dict-of-lists bucket (e.g. a chat thread)."""
+    with _changing(entity, key):
+        _index_drop(entity, key)
+        get_backend().apply(entity, {"op": "append", "k": key, "sub": sub, "v": item})
+
+def compact_wal(force: bool = True) -> Dict[str, bool]:
+    backend = get_backend()
+    if not isinstance(backend, JournaledBackend):
+        return {}
+    return {entity: backend.compact(entity, force=force) for entity in sorted(backend.entities)}
+
+# ----------------------------
+# Migration: JSON files -> SQLite
+# ----------------------------
+def migrate_json_to_sqlite(src_dir: Optional[str] = None, db_path: Optional[str] = None) -> Dict[str, int]:
+    src = JsonFileBackend(src_dir)
+    dst = SqliteBackend(db_path)
+    counts = {}
+    for entity in ENTITY_FILES:
+        if not os.path.exists(entity_path(entity, src.base_dir)):
+            continue
+        data = src.load(entity)
+        dst.save(entity, {str(k): v for k, v in data.items()})
+        counts[entity] = len(data)
+    return counts
+
+# ----------------------------
+# Split: monolithic JSON files -> per-user shards
+# ----------------------------
+def split_json_to_shards(src_dir: Optional[str] = None, dst_dir: Optional[str] = None) -> Dict[str, int]:
+    """
+    One-shot conversion for STORAGE_BACKEND=sharded. Each monolithic file is
+    renamed to <file>.pre-shard once its shards are written.
+    """
+    src = JsonFileBackend(src_dir)
+    dst = ShardedJsonBackend(dst_dir or src.base_dir)
+    counts = {}
+    for entity in SHARDED_ENTITIES:
+        path = entity_path(entity, src.base_dir)
+        if not os.path.exists(path):
+            continue
+        data = src.load(entity)
+        for key, value in data.items():
+            dst.put(entity, str(key), value)
+        os.replace(path, path + ".pre-shard")
+        counts[entity] = len(data)
+    return counts
+
+# ----------------------------
+# Adopt legacy blueprint files (pre-DATA_DIR layout)
+# ----------------------------
+# Before app_storage, the blueprints kept their own copies next to the code
+# (or in the CWD), some wrapped in an envelope: {"appointments": {...}}.
+LEGACY_FILES = (
+    ("leads.json",                "leads",                None),
+    ("users.json",                "users",                None),
+    ("invites.json",              "invites",              None),
+    ("google_tokens.json",        "google_tokens",        None),
+    ("google_sync.json",          "google_sync",          None),
+    ("appointments.json",         "appointments",         "appointments"),
+    ("appointments_pending.json", "appointments_pending", "pending"),
+    ("notifications.json",        "notifications",        "notifications"),
+)
+
+def _merge_bucket(current: Any, legacy: Any) -> Any:
+    if current is None:
+        return legacy
+    if isinstance(current, list) and isinstance(legacy, list):
+        seen = {str(x.get("id")) for x in current if isinstance(x, dict) and x.get("id") is not None}
+        out = list(current)
+        for x in legacy:
+            xid = x.get("id") if isinstance(x, dict) else None
+            if (xid is not None and str(xid) in seen) or (xid is None and x in current):
+                continue
+            out.append(x)
+        return out
+    if isinstance(current, dict) and isinstance(legacy, dict):
+        return {**legacy, **current}  # DATA_DIR wins, legacy fills gaps
+    return current
+
+def adopt_legacy_files(src_dir: Optional[str] = None) -> Dict[str, int]:
+    """
+    Merge the blueprints' legacy files from `src_dir` (default: BASE_DIR) into
+    the configured backend, unwrapping envelopes, then rename each to
+    <file>.adopted so nothing reads from two places again.
+    """
+    src_dir = os.path.abspath(src_dir or BASE_DIR)
+    counts = {}
+    for fname, entity, envelope in LEGACY_FILES:
+        path = os.path.join(src_dir, fname)
+        if not os.path.exists(path) or os.path.abspath(path) == os.path.abspath(entity_path(entity)):
+            continue
+        raw = load_json(path, {})
+        if not isinstance(raw, dict):
+            continue
+        buckets = {k: v for k, v in raw.items() if k != envelope}
+        if envelope and isinstance(raw.get(envelope), dict):
+            for k, v in raw[envelope].items():
+                buckets[k] = _merge_bucket(buckets.get(k), v)
+        for key, value in buckets.items():
+            put_bucket(entity, str(key), _merge_bucket(get_bucket(entity, str(key)), value))
+        os.replace(path, path + ".adopted")
+        counts[fname] = len(buckets)
+    return counts
+
+# ----------------------------
+# Recode: rewrite data files in one codec
+# ----------------------------
+def recode_files(base_dir: Optional[str] = None, codec: Optional[str] = None) -> Dict[str, int]:
+    """Re-encode every entity file and shard under `base_dir`; returns {path: new size in bytes}."""
+    base = base_dir or DATA_DIR
+    paths = [entity_path(e, base) for e in ENTITY_FILES]
+    for entity in SHARDED_ENTITIES:
+        d = os.path.join(base, entity)
+        if os.path.isdir(d):
+            paths += [os.path.join(d, f) for f in sorted(os.listdir(d)) if f.endswith(".json")]
+    out = {}
+    for path in paths:
+        if not os.path.exists(path):
+            continue
+        with file_lock(_file_lock_path(path)):
+            data = _read_json_file(path)
+            raw = encode_doc(data, codec)
+            tmp = f"{path}.{os.getpid()}.recode.tmp"
+            with open(tmp, "wb") as f:
+                f.write(raw)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, path)
+        out[path] = len(raw)
+    return out
+
+def _main(argv):
+    import argparse
+    p = argparse.ArgumentParser(prog="app_storage.py", description="RetainAI storage maintenance")
+    sub = p.add_subparsers(dest="cmd", required=True)
+    m = sub.add_parser("migrate", help="import DATA_DIR JSON files into SQLite")
+    m.add_argument("--src", default=DATA_DIR, help="directory holding the JSON files (default: DATA_DIR)")
+    m.add_argument("--db", default=SQLITE_PATH, help="SQLite database path (default: SQLITE_PATH)")
+    sp = sub.add_parser("split", help="split monolithic per-user JSON files into DATA_DIR/<entity>/ shards")
+    sp.add_argument("--src", default=DATA_DIR, help="directory holding the JSON files (default: DATA_DIR)")
+    sub.add_parser("compact", help="fold the STORAGE_WAL logs into the backend now")
+    ad = sub.add_parser("adopt-legacy", help="merge the blueprints' old root-level JSON files into DATA_DIR")
+    ad.add_argument("--src", default=BASE_DIR, help="directory holding the legacy files (default: the app directory)")
+    rc = sub.add_parser("recode", help="rewrite DATA_DIR data files in one codec")
+    rc.add_argument("--codec", choices=CODECS, default=STORAGE_CODEC, help="target codec (default: STORAGE_CODEC)")
+    args = p.parse_args(argv)
+
+    if args.cmd == "migrate":
+        counts = migrate_json_to_sqlite(args.src, args.db)
+        for entity, n in counts.items():
+            print(f"[MIGRATE] {entity}: {n} bucket(s) -> {args.db}")
+        if not counts:
+            print(f"[MIGRATE] no JSON files found in {args.src}")
+    elif args.cmd == "split":
+        counts = split_json_to_shards(args.src)
+        for entity, n in counts.items():
+            print(f"[SPLIT] {entity}: {n} shard(s) -> {os.path.join(args.src, entity)}")
+        if not counts:
+            print(f"[SPLIT] no monolithic per-user files found in {args.src}")
+    elif args.cmd == "compact":
+        done = compact_wal()
+        if not done:
+            print("[COMPACT] STORAGE_WAL is not enabled")
+        for entity, folded in done.items():
+            print(f"[COMPACT] {entity}: {'folded' if folded else 'log empty'}")
+    elif args.cmd == "adopt-legacy":
+        counts = adopt_legacy_files(args.src)
+        for fname, n in counts.items():
+            print(f"[ADOPT] {fname}: {n} bucket(s) merged into {STORAGE_BACKEND} store")
+        if not counts:
+            print(f"[ADOPT] no legacy files found in {args.src}")
+    elif args.cmd == "recode":
+        sizes = recode_files(codec=args.codec)
+        for path, n in sizes.items():
+            print(f"[RECODE] {os.path.relpath(path, DATA_DIR)}: {n} bytes ({args.codec})")
+        if not sizes:
+            print(f"[RECODE] no data files found in {DATA_DIR}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(_main(sys.argv[1:]))
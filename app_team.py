@@ -1,27 +1,18 @@
 # backend/app_team.py
-import os, json, time, secrets
+import os, time, secrets
 from flask import Blueprint, request, jsonify
 from urllib.parse import urljoin
 
+from app_storage import load_entity, get_bucket, put_bucket
+
 team_bp = Blueprint("team_bp", __name__)
 
-USERS_FILE    = "users.json"
-INVITES_FILE  = "invites.json"
 FRONTEND_BASE = os.getenv("FRONTEND_BASE", "http://localhost:3000")
 
-# ─────────────── helpers ───────────────
-def _load_json(path, default):
-    try:
-        with open(path, "r", encoding="utf-8") as f:
-            return json.load(f)
-    except Exception:
-        return default
-
-def _save_json(path, data):
-    # write whole file, preserving anything we don't touch
-    with open(path, "w", encoding="utf-8") as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
+# Team records share app.py's "users" entity (legacy '<email>' keys plus
+# 'user::<email>' team keys); invites are the "invites" entity keyed by token.
 
+# ─────────────── helpers ───────────────
 def _norm(email: str) -> str:
     return (email or "").strip().lower()
 
@@ -32,16 +23,16 @@ def _current_user_email() -> str:
     return _norm(request.headers.get("X-User-Email", ""))
 
 def _users():
-    return _load_json(USERS_FILE, {})
+    return load_entity("users")
 
-def _save_users(data):
-    _save_json(USERS_FILE, data)
+def _save_user(key: str, rec: dict):
+    put_bucket("users", key, rec)
 
 def _invites():
-    return _load_json(INVITES_FILE, {})
+    return load_entity("invites")
 
-def _save_invites(data):
-    _save_json(INVITES_FILE, data)
+def _save_invite(token: str, inv: dict):
+    put_bucket("invites", token, inv)
 
 def _get_any_user_view(users_dict: dict, email: str):
     """
@@ -69,7 +60,7 @@ def _bootstrap_owner_if_missing(users_dict: dict, email: str) -> dict:
         "org_id": legacy.get("org_id") or email,  # single-tenant org by default
         "last_login": legacy.get("last_login"),
     }
-    _save_users(users_dict)
+    _save_user(key, users_dict[key])
     return users_dict
 
 def _iter_team_members(users_dict: dict, org_id: str):
@@ -159,15 +150,14 @@ def invite_member():
 
     # create new invite
     token = secrets.token_urlsafe(24)
-    invites[token] = {
+    _save_invite(token, {
         "email": email,
         "role": role,
         "org_id": org_id,
         "created_at": now,
         "expires_at": now + 7*24*3600,
         "accepted_at": None
-    }
-    _save_invites(invites)
+    })
 
     accept_url = urljoin(FRONTEND_BASE, f"/accept-invite?token={token}")
     # (Optionally send email/SMS here)
@@ -175,8 +165,7 @@ def invite_member():
 
 @team_bp.route("/api/team/invite/<token>", methods=["GET"])
 def read_invite(token):
-    invs = _invites()
-    inv = invs.get(token)
+    inv = get_bucket("invites", token)
     if not inv:
         return jsonify({"error":"not_found"}), 404
     if inv["expires_at"] < int(time.time()):
@@ -193,8 +182,7 @@ def accept_invite():
     if not token or not email_input:
         return jsonify({"error":"bad_request"}), 400
 
-    invites = _invites()
-    inv = invites.get(token)
+    inv = get_bucket("invites", token)
     if not inv:
         return jsonify({"error":"not_found"}), 404
     if inv["expires_at"] < int(time.time()):
@@ -212,18 +200,15 @@ def accept_invite():
     users = _bootstrap_owner_if_missing(users, inv.get("org_id"))
 
     # add/overwrite the member in team namespace only
-    key = _user_key(email_input)
-    users[key] = {
+    _save_user(_user_key(email_input), {
         "email": email_input,
         "name": name,
         "role": inv["role"],
         "org_id": inv["org_id"],
         "last_login": None
-    }
-    _save_users(users)
+    })
 
     inv["accepted_at"] = int(time.time())
-    invites[token] = inv
-    _save_invites(invites)
+    _save_invite(token, inv)
 
     return jsonify({"ok": True})
@@ -1,17 +1,20 @@
 # backend/app_wa_auto_appointments.py
 from flask import Blueprint, request, jsonify
-import os, re, json, uuid, datetime
+import os, re, uuid, datetime
 from typing import Any, Dict, List, Optional
 
+from app_storage import get_bucket, view_bucket, put_bucket, bucket_lock, bucket_etag, conditional_response
+from app_notifications import notify
+
 # =========================================================
 # Blueprint
 # =========================================================
 WA_AUTO_BP = Blueprint("wa_auto_bp", __name__)
 
-BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-FILE_APPTS   = os.path.join(BASE_DIR, "appointments.json")          # { "appointments": { "<user_email>": [ ... ] } }
-FILE_PENDING = os.path.join(BASE_DIR, "appointments_pending.json")  # { "pending":      { "<user_email>": [ ... ] } }
-FILE_NOTIFS  = os.path.join(BASE_DIR, "notifications.json")         # { "notifications":{ "<user_email>": [ ... ] } }
+# Storage: app_storage entities shared with app.py (no envelopes)
+#   appointments          { "<user_email>": [ ... ] }  — same list app.py's /api/appointments serves
+#   appointments_pending  { "<user_email>": [ ... ] }
+#   notifications         { "<user_email>": [ ... ] }  — same hot list app.py's /api/notifications serves (app_notifications)
 
 WHATSAPP_TOKEN       = os.getenv("WHATSAPP_TOKEN", "")
 WHATSAPP_PHONE_ID    = os.getenv("WHATSAPP_PHONE_ID", "")
@@ -23,29 +26,6 @@ WHATSAPP_API_VERSION = os.getenv("WHATSAPP_API_VERSION", "v20.0")
 def _now_iso() -> str:
     return datetime.datetime.utcnow().replace(microsecond=0).isoformat() + "Z"
 
-def _read_json(path: str, default: Any):
-    try:
-        with open(path, "r", encoding="utf-8") as f:
-            return json.load(f)
-    except Exception:
-        return default
-
-def _write_json(path: str, data: Any):
-    tmp = path + ".tmp"
-    with open(tmp, "w", encoding="utf-8") as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
-    os.replace(tmp, path)
-
-def _ensure_files():
-    if not os.path.exists(FILE_APPTS):
-        _write_json(FILE_APPTS, {"appointments": {}})
-    if not os.path.exists(FILE_PENDING):
-        _write_json(FILE_PENDING, {"pending": {}})
-    if not os.path.exists(FILE_NOTIFS):
-        _write_json(FILE_NOTIFS, {"notifications": {}})
-
-_ensure_files()
-
 def _digits(s: str) -> str:
     return re.sub(r"\D", "", s or "")
 
@@ -53,17 +33,7 @@ def _digits(s: str) -> str:
 # Notifications (stored for UI)
 # =========================================================
 def _notify(user_email: str, title: str, body: str):
-    user_email = (user_email or "").lower()
-    db = _read_json(FILE_NOTIFS, {"notifications": {}})
-    arr = db.setdefault("notifications", {}).setdefault(user_email, [])
-    arr.insert(0, {
-        "id": "note_" + str(uuid.uuid4())[:8],
-        "title": title,
-        "body": body,
-        "created_at": _now_iso(),
-        "read": False
-    })
-    _write_json(FILE_NOTIFS, db)
+    notify(user_email, title, body, kind="appointment")
 
 # =========================================================
 # (Optional) WhatsApp sender (no-op in dev without creds)
@@ -185,55 +155,50 @@ def detect_intent(text: str) -> Dict[str, Any]:
 # Storage helpers
 # =========================================================
 def _get_appointments(user_email: str) -> List[Dict[str, Any]]:
-    db = _read_json(FILE_APPTS, {"appointments": {}})
-    return db.get("appointments", {}).get(user_email.lower(), [])
+    return get_bucket("appointments", user_email.lower(), []) or []
 
 def _save_appointments(user_email: str, arr: List[Dict[str, Any]]):
-    user_email = (user_email or "").lower()
-    db = _read_json(FILE_APPTS, {"appointments": {}})
-    db.setdefault("appointments", {})[user_email] = arr
-    _write_json(FILE_APPTS, db)
+    put_bucket("appointments", (user_email or "").lower(), arr)
 
 def _add_appointment(user_email: str, appt: Dict[str, Any]) -> Dict[str, Any]:
-    arr = _get_appointments(user_email)
-    arr.append(appt)
-    arr.sort(key=lambda a: a.get("appointment_time", ""))
-    _save_appointments(user_email, arr)
+    with bucket_lock("appointments", (user_email or "").lower()):
+        arr = _get_appointments(user_email)
+        arr.append(appt)
+        arr.sort(key=lambda a: a.get("appointment_time", ""))
+        _save_appointments(user_email, arr)
     return appt
 
 def _get_pending(user_email: str) -> List[Dict[str, Any]]:
-    db = _read_json(FILE_PENDING, {"pending": {}})
-    return db.get("pending", {}).get(user_email.lower(), [])
+    return get_bucket("appointments_pending", user_email.lower(), []) or []
 
 def _save_pending(user_email: str, arr: List[Dict[str, Any]]):
-    user_email = (user_email or "").lower()
-    db = _read_json(FILE_PENDING, {"pending": {}})
-    db.setdefault("pending", {})[user_email] = arr
-    _write_json(FILE_PENDING, db)
+    put_bucket("appointments_pending", (user_email or "").lower(), arr)
 
 def _add_pending(user_email: str, s: Dict[str, Any]) -> Dict[str, Any]:
-    arr = _get_pending(user_email)
-    # de-dupe by (lead_id + suggested_time + note)
-    for x in arr:
-        if (
-            x.get("lead_id") == s.get("lead_id") and
-            (x.get("suggested_time") or "") == (s.get("suggested_time") or "") and
-            (x.get("note") or "") == (s.get("note") or "")
-        ):
-            return x
-    arr.insert(0, s)
-    _save_pending(user_email, arr)
+    with bucket_lock("appointments_pending", (user_email or "").lower()):
+        arr = _get_pending(user_email)
+        # de-dupe by (lead_id + suggested_time + note)
+        for x in arr:
+            if (
+                x.get("lead_id") == s.get("lead_id") and
+                (x.get("suggested_time") or "") == (s.get("suggested_time") or "") and
+                (x.get("note") or "") == (s.get("note") or "")
+            ):
+                return x
+        arr.insert(0, s)
+        _save_pending(user_email, arr)
     return s
 
 def _remove_pending(user_email: str, sid: str) -> Optional[Dict[str, Any]]:
-    arr = _get_pending(user_email)
-    keep, removed = [], None
-    for x in arr:
-        if x.get("id") == sid:
-            removed = x
-        else:
-            keep.append(x)
-    _save_pending(user_email, keep)
+    with bucket_lock("appointments_pending", (user_email or "").lower()):
+        arr = _get_pending(user_email)
+        keep, removed = [], None
+        for x in arr:
+            if x.get("id") == sid:
+                removed = x
+            else:
+                keep.append(x)
+        _save_pending(user_email, keep)
     return removed
 
 # =========================================================
@@ -349,7 +314,9 @@ def wa_auto_inbound():
 # ----- Pending suggestions -----
 @WA_AUTO_BP.route("/api/wa-auto/pending/<path:user_email>", methods=["GET"])
 def wa_auto_list_pending(user_email):
-    return jsonify({"pending": _get_pending((user_email or "").lower())})
+    key = (user_email or "").lower()
+    tag = bucket_etag("appointments_pending", key)  # before the read (see bucket_etag)
+    return conditional_response(tag, lambda: {"pending": view_bucket("appointments_pending", key, []) or []})
 
 @WA_AUTO_BP.route("/api/wa-auto/pending/<path:user_email>/<pending_id>/dismiss", methods=["POST"])
 def wa_auto_dismiss_pending(user_email, pending_id):
@@ -473,19 +440,21 @@ def add_wa_auto_appointment(user_email):
 @WA_AUTO_BP.route("/api/wa-auto/appointments/<path:user_email>/<appt_id>/done", methods=["POST"])
 def mark_wa_auto_appointment_done(user_email, appt_id):
     user_email = (user_email or "").lower()
-    arr = _get_appointments(user_email)
-    for a in arr:
-        if a.get("id") == appt_id:
-            a["done"] = True
-    _save_appointments(user_email, arr)
+    with bucket_lock("appointments", user_email):
+        arr = _get_appointments(user_email)
+        for a in arr:
+            if a.get("id") == appt_id:
+                a["done"] = True
+        _save_appointments(user_email, arr)
     return jsonify({"ok": True})
 
 @WA_AUTO_BP.route("/api/wa-auto/appointments/<path:user_email>/<appt_id>", methods=["DELETE"])
 def delete_wa_auto_appointment(user_email, appt_id):
     user_email = (user_email or "").lower()
-    arr = _get_appointments(user_email)
-    arr = [a for a in arr if a.get("id") != appt_id]
-    _save_appointments(user_email, arr)
+    with bucket_lock("appointments", user_email):
+        arr = _get_appointments(user_email)
+        arr = [a for a in arr if a.get("id") != appt_id]
+        _save_appointments(user_email, arr)
     return jsonify({"ok": True})
 
 # =========================================================
@@ -0,0 +1,153 @@
+# backend/app_wa_numbers.py
+# ======================================
+# WhatsApp number -> lead reverse index, for routing inbound messages and
+# STOP/START without scanning every tenant's leads:
+#
+#   wa_numbers entity   { "<bucket>": {"<normalized number>": [[user_email, lead_id], ...]},
+#                         "_built": {"at": ..., "numbers": ..., "buckets": WA_INDEX_BUCKETS} }
+#
+# Numbers hash into WA_INDEX_BUCKETS buckets ("000".."255") rather than one
+# bucket each, so a bulk lead write (a Google import, a CSV commit) locks and
+# rewrites at most that many buckets instead of one per number.
+#
+# Kept in step with the "leads" entity by an app_storage item watcher, so lead
+# CRUD, opt-out updates and Google imports (put_bucket) all maintain it under
+# the leads bucket lock. Each lead is indexed under the normalized form of its
+# "whatsapp" and "phone" fields. Lookups re-check every hit against the lead
+# itself (O(1) via item_index), so an entry left stale by a crash or a
+# maintenance write is skipped rather than misrouted.
+#
+# The index is built on first lookup if missing; after bulk maintenance
+# (save_entity, migrate/split/adopt-legacy) run `python app_wa_numbers.py rebuild`.
+import os, re, sys, zlib, datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from app_storage import (load_entity, save_entity, get_bucket, view_bucket, put_bucket, delete_bucket,
+                         bucket_lock, bucket_version, item_index, watch_items, thaw)
+
+DEFAULT_COUNTRY_CODE = (os.getenv("DEFAULT_COUNTRY_CODE") or "1").strip()
+WA_INDEX_BUCKETS     = int(os.getenv("WA_INDEX_BUCKETS", "256"))
+WA_FIELDS            = ("whatsapp", "phone")
+_BUILT               = "_built"  # marker bucket; never a bucket number
+
+# ----------------------------
+# Normalization
+# ----------------------------
+def norm_wa(num: Any) -> str:
+    d = re.sub(r"\D", "", str(num or ""))
+    if len(d) == 10 and DEFAULT_COUNTRY_CODE.isdigit():
+        d = DEFAULT_COUNTRY_CODE + d
+    return d
+
+def lead_numbers(lead: Optional[Dict[str, Any]]) -> set:
+    if not isinstance(lead, dict):
+        return set()
+    return {n for n in (norm_wa(lead.get(f)) for f in WA_FIELDS) if n}
+
+def _bucket(number: str) -> str:
+    return f"{zlib.crc32(number.encode()) % WA_INDEX_BUCKETS:03d}"
+
+# ----------------------------
+# Maintenance (item watcher on "leads")
+# ----------------------------
+def _apply(bucket: str, delta: Dict[str, Tuple[set, set]]):
+    """Apply {number: (add, drop)} to one bucket of the index (copied only if it changes)."""
+    with bucket_lock("wa_numbers", bucket):
+        current = view_bucket("wa_numbers", bucket, {}) or {}
+        updates: Dict[str, list] = {}
+        for number, (add, drop) in delta.items():
+            before = current.get(number) or []
+            pairs = [list(p) for p in before if tuple(p) not in drop]
+            pairs += [list(p) for p in sorted(add - {tuple(p) for p in pairs})]
+            if pairs != before:
+                updates[number] = pairs
+        if not updates:
+            return
+        current = thaw(current)
+        for number, pairs in updates.items():
+            if pairs:
+                current[number] = pairs
+            else:
+                current.pop(number, None)
+        if current:
+            put_bucket("wa_numbers", bucket, current)
+        else:
+            delete_bucket("wa_numbers", bucket)
+
+def _apply_all(delta: Dict[str, Tuple[set, set]]):
+    by_bucket: Dict[str, Dict[str, Tuple[set, set]]] = {}
+    for number, change in delta.items():
+        by_bucket.setdefault(_bucket(number), {})[number] = change
+    for bucket in sorted(by_bucket):  # fixed order keeps concurrent writers from deadlocking
+        _apply(bucket, by_bucket[bucket])
+
+def _on_leads_changed(user: str, changes: list):
+    delta: Dict[str, Tuple[set, set]] = {}
+    for old, new in changes:
+        lead_id = str((new if new is not None else old).get("id"))
+        before, after = lead_numbers(old), lead_numbers(new)
+        for n in before - after:
+            delta.setdefault(n, (set(), set()))[1].add((user, lead_id))
+        for n in after - before:
+            delta.setdefault(n, (set(), set()))[0].add((user, lead_id))
+    _apply_all(delta)
+
+watch_items("leads", _on_leads_changed)
+
+def _index_user(user: str, leads: Any, numbers: Dict[str, list]):
+    for ld in leads if isinstance(leads, list) else ():
+        for n in lead_numbers(ld):
+            numbers.setdefault(n, []).append([user, str(ld.get("id"))])
+
+def rebuild() -> int:
+    """Rebuild the whole index from the leads entity; returns how many numbers it holds."""
+    with bucket_lock("wa_numbers", _BUILT):
+        leads = load_entity("leads")
+        seen = {user: bucket_version("leads", user) for user in leads}
+        numbers: Dict[str, list] = {}
+        for user, arr in leads.items():
+            _index_user(user, arr, numbers)
+        buckets: Dict[str, Any] = {}
+        for number, pairs in numbers.items():
+            buckets.setdefault(_bucket(number), {})[number] = pairs
+        buckets[_BUILT] = {"at": datetime.datetime.utcnow().isoformat(), "numbers": len(numbers),
+                           "buckets": WA_INDEX_BUCKETS}
+        save_entity("wa_numbers", buckets)
+        # tenants written while we scanned: their watcher updates went to the index we just replaced
+        for user, version in seen.items():
+            if bucket_version("leads", user) != version:
+                redo: Dict[str, list] = {}
+                _index_user(user, get_bucket("leads", user, []), redo)
+                _apply_all({n: ({tuple(p) for p in pairs}, set()) for n, pairs in redo.items()})
+        return len(numbers)
+
+def _ensure_built():
+    built = view_bucket("wa_numbers", _BUILT)
+    if built is None or built.get("buckets") != WA_INDEX_BUCKETS:
+        rebuild()
+
+# ----------------------------
+# Lookups
+# ----------------------------
+def lookup(wa_id: Any) -> List[Tuple[str, str]]:
+    """(user_email, lead_id) of every lead whose whatsapp/phone normalizes to wa_id, in index order."""
+    wa = norm_wa(wa_id)
+    if not wa:
+        return []
+    _ensure_built()
+    hits = []
+    for user, lead_id in (view_bucket("wa_numbers", _bucket(wa), {}) or {}).get(wa, ()):
+        if wa in lead_numbers(item_index("leads", user).get(lead_id)):
+            hits.append((user, lead_id))
+    return hits
+
+def route(wa_id: Any) -> Tuple[Optional[str], Optional[str]]:
+    """Owner and lead id for an inbound sender (first match), or (None, None)."""
+    hits = lookup(wa_id)
+    return hits[0] if hits else (None, None)
+
+if __name__ == "__main__":
+    if sys.argv[1:] != ["rebuild"]:
+        print("usage: python app_wa_numbers.py rebuild")
+        sys.exit(2)
+    print(f"[WA NUMBERS] indexed {rebuild()} number(s)")
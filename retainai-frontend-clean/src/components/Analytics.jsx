@@ -1,5 +1,5 @@
 // src/components/Analytics.jsx
-import React, { useMemo } from "react";
+import React, { useEffect, useMemo, useState } from "react";
 import {
   FunnelChart, Funnel, LabelList,
   PieChart, Pie, Cell,
@@ -7,6 +7,7 @@ import {
   AreaChart, Area
 } from "recharts";
 import { FaStar, FaFire, FaLightbulb, FaCheckCircle, FaBell, FaCalendarAlt } from "react-icons/fa";
+import { API_BASE } from "../config";
 
 /* ===== THEME (RetainAI: black / white / gold) ===== */
 const BG      = "#181a1b";
@@ -21,162 +22,57 @@ const N1 = "#cfd5db"; // light
 const N2 = "#8b949e"; // mid
 const N3 = "#495056"; // dark
 
-/* ===== UTILITIES ===== */
-const MS_DAY = 86400000;
-const toDate = (v) => {
-  if (!v) return null;
-  const d = new Date(v);
-  return Number.isFinite(d.getTime()) ? d : null;
+/* ===== DATA =====
+ * Every figure comes from GET /api/analytics/<user>, whose aggregates the
+ * backend keeps up to date on lead / appointment / chat writes — the page no
+ * longer walks the lead list in the browser.
+ */
+const SOURCE_PALETTE = [GOLD, N1, N2, N3, "#343a40", "#5a626a"];
+const EMPTY = {
+  funnel: [
+    { stage: "Total Leads", value: 0 },
+    { stage: "Contacted", value: 0 },
+    { stage: "Appointment Set", value: 0 },
+    { stage: "Closed", value: 0 }
+  ],
+  funnel_rates: [0, 0, 0],
+  sentiment_by_month: [],
+  sources: [],
+  leads_by_month: [],
+  top_tags: [],
+  vips: { count: 0, names: [] },
+  cold: { count: 0, names: [] },
+  tip: "",
+  next_action: "",
+  reminders_due: 0,
+  avg_days_since_contact: 0,
+  appointments_this_month: 0,
+  leaderboard: [],
+  heatmap: Array.from({ length: 7 }, () => Array(24).fill(0))
 };
-const monthStr = (v) => (toDate(v) || new Date()).toISOString().slice(0, 7);
-const safeLastContact = (l) =>
-  toDate(l?.last_contacted) || toDate(l?.lastContacted) || toDate(l?.createdAt) || new Date();
 
-/* ===== DATA HELPERS ===== */
-function getConversionStats(leads = []) {
-  const total = leads.length;
-  const contacted = leads.filter(l => !!(l.last_contacted || l.lastContacted)).length;
-  const appointment = leads.filter(l => Array.isArray(l.appointments) && l.appointments.length > 0).length;
-  const closed = leads.filter(l => (l.tags || []).some(t => ["Closed", "Won", "Completed"].includes(t))).length;
-  return [
-    { stage: "Total Leads", value: total },
-    { stage: "Contacted", value: contacted },
-    { stage: "Appointment Set", value: appointment },
-    { stage: "Closed", value: closed }
-  ];
-}
-function getFunnelRates(stats) {
-  const out = [];
-  for (let i = 1; i < stats.length; i++) {
-    const prev = stats[i - 1].value || 0;
-    const curr = stats[i].value || 0;
-    out.push(prev === 0 ? 0 : Math.round((curr / prev) * 100));
-  }
-  return out;
-}
-function getSentimentByMonth(leads = []) {
-  const map = {};
-  leads.forEach(l => {
-    const m = monthStr(l?.last_contacted || l?.lastContacted || l?.createdAt);
-    const tag = (l.tags || []).find(t => ["Happy", "Upset", "Neutral"].includes(t)) || "Neutral";
-    if (!map[m]) map[m] = { month: m, Happy: 0, Upset: 0, Neutral: 0 };
-    map[m][tag]++;
-  });
-  return Object.values(map).sort((a, b) => a.month.localeCompare(b.month));
-}
-function getSourceBreakdown(leads = []) {
-  const counts = {};
-  const PALETTE = [GOLD, N1, N2, N3, "#343a40", "#5a626a"];
-  leads.forEach(l => {
-    const src = l?.source || "Other";
-    counts[src] = (counts[src] || 0) + 1;
-  });
-  return Object.entries(counts).map(([name, value], i) => ({
-    name, value, color: PALETTE[i % PALETTE.length]
-  }));
-}
-function getVipLeads(leads = []) {
-  return leads.filter(l => (l.tags || []).includes("VIP"));
-}
-function daysBetween(a, b) {
-  const ms = Math.max(0, (a.getTime() - b.getTime()));
-  return Math.floor(ms / MS_DAY);
-}
-function getColdLeads(leads = [], days = 14) {
-  const now = new Date();
-  return leads.filter(l => daysBetween(now, safeLastContact(l)) > days);
-}
-function getAITip(leads = []) {
-  const coldVIPs = leads.filter(l =>
-    (l.tags || []).includes("VIP") &&
-    daysBetween(new Date(), toDate(l?.last_contacted) || new Date(0)) > 10
-  );
-  if (coldVIPs.length)
-    return `You have ${coldVIPs.length} VIP${coldVIPs.length > 1 ? "s" : ""} who need follow-up this week!`;
-  return "All VIPs are up-to-date. Keep it up!";
-}
-function getNextAction(leads = []) {
-  const cold = getColdLeads(leads);
-  if (cold.length) return `Reach out to ${cold[0].name || cold[0].email} – it's been a while!`;
-  return "No leads are at risk. Well managed!";
-}
-function getRemindersDue(leads = [], days = 7) {
-  const now = new Date();
-  const inDays = new Date(now.getTime() + days * MS_DAY);
-  let count = 0;
-  leads.forEach(lead => {
-    (lead.reminders || []).forEach(r => {
-      const d = toDate(r?.date);
-      if (d && d >= now && d <= inDays) count++;
-    });
-  });
-  return count;
-}
-function getAppointmentsThisMonth(leads = []) {
-  const now = new Date();
-  const y = now.getFullYear(), m = now.getMonth();
-  let count = 0;
-  leads.forEach(lead => {
-    (lead.appointments || []).forEach(a => {
-      const d = toDate(a?.date);
-      if (d && d.getFullYear() === y && d.getMonth() === m) count++;
-    });
-  });
-  return count;
-}
-function getLeaderboard(leads = []) {
-  const arr = leads.map(l => ({
-    name: l?.name || l?.email || "Unknown",
-    count: (l.appointments || []).length
-  }));
-  arr.sort((a, b) => b.count - a.count);
-  return arr.slice(0, 5);
-}
-
-/* Extra insights (bottom) */
-function getLeadsByMonth(leads = []) {
-  const map = {};
-  leads.forEach(l => {
-    const m = monthStr(l?.createdAt);
-    map[m] = (map[m] || 0) + 1;
-  });
-  return Object.keys(map).sort().map(month => ({ month, count: map[month] }));
-}
-function getAvgDaysSinceContact(leads = []) {
-  const now = new Date();
-  const diffs = leads
-    .map(l => daysBetween(now, safeLastContact(l)))
-    .filter(n => Number.isFinite(n));
-  if (!diffs.length) return 0;
-  return Math.round(diffs.reduce((a, b) => a + b, 0) / diffs.length);
-}
-/* NEW: Top tags (fills left-bottom gap) */
-function getTopTags(leads = [], limit = 8) {
-  const counts = {};
-  leads.forEach(l => (l.tags || []).forEach(t => { counts[t] = (counts[t] || 0) + 1; }));
-  const arr = Object.entries(counts).map(([tag, value]) => ({ tag, value }));
-  arr.sort((a, b) => b.value - a.value);
-  return arr.slice(0, limit);
+function useAnalytics(email, refreshKey) {
+  const [data, setData] = useState(EMPTY);
+  useEffect(() => {
+    if (!API_BASE || !email) return;
+    let cancelled = false;
+    fetch(`${API_BASE}/api/analytics/${encodeURIComponent(email)}`, {
+      credentials: "include",
+      mode: "cors",
+      headers: { Accept: "application/json" }
+    })
+      .then(r => (r.ok ? r.json() : null))
+      .then(j => { if (!cancelled && j) setData({ ...EMPTY, ...j }); })
+      .catch(() => { /* keep the last figures */ });
+    return () => { cancelled = true; };
+  }, [email, refreshKey]);
+  return data;
 }
 
 /* ===== HEATMAP ===== */
 const DAYS = ["Sun", "Mon", "Tue", "Wed", "Thu", "Fri", "Sat"];
 const HOURS = Array.from({ length: 24 }, (_, i) => `${String(i).padStart(2, "0")}:00`);
-function getHeatmapMatrix(leads = []) {
-  const matrix = Array.from({ length: 7 }, () => Array(24).fill(0));
-  leads.forEach(lead => {
-    (lead.appointments || []).forEach(app => {
-      const d = (app?.date && app?.time) ? toDate(`${app.date}T${app.time}`) : null;
-      if (!d) return;
-      const day = d.getDay();
-      const hour = d.getHours();
-      if (day >= 0 && day <= 6 && hour >= 0 && hour < 24) matrix[day][hour]++;
-    });
-  });
-  return matrix;
-}
-function AppointmentsHeatmap({ leads }) {
-  const matrix = getHeatmapMatrix(leads);
+function AppointmentsHeatmap({ matrix }) {
   return (
     <div style={{ ...card, alignSelf: "start" }}>
       <div style={cardTitle}>
@@ -261,19 +157,24 @@ const renderPieLabel = ({ cx, cy, midAngle, outerRadius, percent, name }) => {
   );
 };
 
-export default function Analytics({ leads = [] }) {
-  const funnelStats           = useMemo(() => getConversionStats(leads), [leads]);
-  const funnelRates           = getFunnelRates(funnelStats);
-  const sentimentData         = useMemo(() => getSentimentByMonth(leads), [leads]);
-  const sourceData            = useMemo(() => getSourceBreakdown(leads), [leads]);
-  const vipLeads              = useMemo(() => getVipLeads(leads), [leads]);
-  const coldLeads             = useMemo(() => getColdLeads(leads), [leads]);
-  const remindersDue          = useMemo(() => getRemindersDue(leads, 7), [leads]);
-  const apptsThisMonth        = useMemo(() => getAppointmentsThisMonth(leads), [leads]);
-  const leadsByMonth          = useMemo(() => getLeadsByMonth(leads), [leads]);
-  const avgDaysSinceContact   = useMemo(() => getAvgDaysSinceContact(leads), [leads]);
-  const leaderboard           = useMemo(() => getLeaderboard(leads), [leads]);
-  const topTags               = useMemo(() => getTopTags(leads), [leads]);
+export default function Analytics({ leads = [], user }) {
+  // refetch when the lead list the dashboard holds changes (add / edit / import)
+  const data = useAnalytics(user?.email, leads);
+  const funnelStats         = data.funnel;
+  const funnelRates         = data.funnel_rates;
+  const sentimentData       = data.sentiment_by_month;
+  const sourceData          = useMemo(
+    () => data.sources.map((s, i) => ({ ...s, color: SOURCE_PALETTE[i % SOURCE_PALETTE.length] })),
+    [data.sources]
+  );
+  const vipNames            = data.vips.names;
+  const coldLeads           = data.cold;
+  const remindersDue        = data.reminders_due;
+  const apptsThisMonth      = data.appointments_this_month;
+  const leadsByMonth        = data.leads_by_month;
+  const avgDaysSinceContact = data.avg_days_since_contact;
+  const leaderboard         = data.leaderboard;
+  const topTags             = data.top_tags;
 
   return (
     <div style={{ padding: 28, background: BG, minHeight: "100vh", boxSizing: "border-box" }}>
@@ -356,7 +257,7 @@ export default function Analytics({ leads = [] }) {
       <div style={{ display: "grid", gridTemplateColumns: "2fr 1fr", gap: 18, marginTop: 18, alignItems: "start" }}>
         {/* LEFT column: Heatmap + New Leads + Top Tags */}
         <div style={{ display: "grid", gap: 18, alignItems: "start" }}>
-          <AppointmentsHeatmap leads={leads} />
+          <AppointmentsHeatmap matrix={data.heatmap} />
 
           <div style={card}>
             <div style={cardTitle}>New Leads by Month</div>
@@ -411,7 +312,7 @@ export default function Analytics({ leads = [] }) {
             <FaLightbulb style={{ color: GOLD }} />
             <div>
               <div style={{ fontWeight: 800, color: TEXT, fontSize: 15 }}>Tip of the Week</div>
-              <div style={{ color: GOLD, fontWeight: 700, fontSize: 14 }}>{getAITip(leads)}</div>
+              <div style={{ color: GOLD, fontWeight: 700, fontSize: 14 }}>{data.tip}</div>
             </div>
           </div>
 
@@ -420,7 +321,7 @@ export default function Analytics({ leads = [] }) {
             <div>
               <div style={{ fontWeight: 800, color: TEXT, fontSize: 15 }}>Top VIPs</div>
               <div style={{ color: GOLD, fontWeight: 700, fontSize: 14 }}>
-                {vipLeads.length ? vipLeads.map(l => l.name).join(", ") : "No VIPs yet."}
+                {vipNames.length ? vipNames.join(", ") : "No VIPs yet."}
               </div>
             </div>
           </div>
@@ -430,7 +331,7 @@ export default function Analytics({ leads = [] }) {
             <div>
               <div style={{ fontWeight: 800, color: TEXT, fontSize: 15 }}>Leads Going Cold</div>
               <div style={{ color: GOLD, fontWeight: 700, fontSize: 14 }}>
-                {coldLeads.length ? coldLeads.map(l => l.name).join(", ") : "All leads active"}
+                {coldLeads.count ? coldLeads.names.join(", ") + (coldLeads.count > coldLeads.names.length ? ` +${coldLeads.count - coldLeads.names.length} more` : "") : "All leads active"}
               </div>
             </div>
           </div>
@@ -439,7 +340,7 @@ export default function Analytics({ leads = [] }) {
             <FaCheckCircle style={{ color: GOLD }} />
             <div>
               <div style={{ fontWeight: 800, color: TEXT, fontSize: 15 }}>Next Best Action</div>
-              <div style={{ color: GOLD, fontWeight: 700, fontSize: 14 }}>{getNextAction(leads)}</div>
+              <div style={{ color: GOLD, fontWeight: 700, fontSize: 14 }}>{data.next_action}</div>
             </div>
           </div>
 
@@ -471,7 +372,7 @@ export default function Analytics({ leads = [] }) {
               <Metric label="Appt Set" value={funnelStats[2].value} />
               <Metric label="Closed" value={funnelStats[3].value} />
               <Metric label="Avg days since contact" value={avgDaysSinceContact} small />
-              <Metric label="Cold (>14d)" value={coldLeads.length} small />
+              <Metric label="Cold (>14d)" value={coldLeads.count} small />
             </div>
           </div>
         </div>
@@ -100,9 +100,14 @@ export default function ImportContacts({ user }) {
     setError("");
 
     try {
-      const payload = {
-        rows: preview.rows.map((r) => ({ ...r, selected: r.selected !== false })),
-      };
+      // A staged upload is committed server-side from the file (every row, not
+      // just the previewed ones); unticked preview rows are sent as skip_rows.
+      const payload = preview.import_id
+        ? {
+            import_id: preview.import_id,
+            skip_rows: preview.rows.filter((r) => r.selected === false).map((r) => r.row),
+          }
+        : { rows: preview.rows.map((r) => ({ ...r, selected: r.selected !== false })) };
 
       const res = await fetch(`${API_BASE}/api/import/csv/commit`, {
         method: "POST",
@@ -13,6 +13,7 @@ import { QRCodeSVG } from "qrcode.react";
  */
 
 const TABS = ["Details", "Notes", "Reminders"];
+const NOTES_PAGE = 20; // newest notes fetched on open; older ones page in on demand
 
 // Prefer explicit env var; otherwise same-origin backend
 const API_BASE =
@@ -81,6 +82,49 @@ export default function LeadDrawer({
     return lead?.owner || "";
   }, [lead?.owner]);
 
+  // ---------- server notes (/api/notes, paged newest first) ----------
+  const [serverNotes, setServerNotes] = useState([]);
+  const [notesCursor, setNotesCursor] = useState(null);
+
+  const fetchNotes = useCallback(
+    async (cursor) => {
+      if (!userEmail || lead?.id == null) return null;
+      const qs = new URLSearchParams({ user_email: userEmail, order: "-createdAt", limit: String(NOTES_PAGE) });
+      if (cursor) qs.set("cursor", cursor);
+      const res = await fetch(`${API_BASE}/api/notes/${encodeURIComponent(lead.id)}?${qs}`);
+      if (!res.ok) return null;
+      return res.json();
+    },
+    [lead?.id, userEmail]
+  );
+
+  useEffect(() => {
+    let cancelled = false;
+    setServerNotes([]);
+    setNotesCursor(null);
+    fetchNotes(null)
+      .then((j) => {
+        if (cancelled || !j) return;
+        setServerNotes(Array.isArray(j.notes) ? j.notes : []);
+        setNotesCursor(j.next_cursor || null);
+      })
+      .catch(() => {});
+    return () => {
+      cancelled = true;
+    };
+  }, [fetchNotes]);
+
+  const loadOlderNotes = async () => {
+    try {
+      const j = await fetchNotes(notesCursor);
+      if (!j) return;
+      setServerNotes((prev) => [...prev, ...(Array.isArray(j.notes) ? j.notes : [])]);
+      setNotesCursor(j.next_cursor || null);
+    } catch {
+      /* keep what we have */
+    }
+  };
+
   // ---------- persistence helpers ----------
   const persistLeadsArray = useCallback(
     async (mutateFn) => {
@@ -179,9 +223,25 @@ export default function LeadDrawer({
   };
 
   // ---------- actions: notes ----------
-  const addNote = () => {
+  const addNote = async () => {
     const t = (newNote || "").trim();
     if (!t) return;
+    if (userEmail && lead?.id != null) {
+      setErr("");
+      try {
+        const res = await fetch(
+          `${API_BASE}/api/notes/${encodeURIComponent(lead.id)}?user_email=${encodeURIComponent(userEmail)}`,
+          { method: "POST", headers: { "Content-Type": "application/json" }, body: JSON.stringify({ text: t }) }
+        );
+        if (!res.ok) throw new Error("Failed to save note");
+        const { note } = await res.json();
+        setNewNote("");
+        setServerNotes((prev) => [note, ...prev]);
+      } catch (e) {
+        setErr(e.message || "Failed to save note");
+      }
+      return;
+    }
     const entry = {
       type: "note",
       text: t,
@@ -197,6 +257,22 @@ export default function LeadDrawer({
     persistUpdates(next);
   };
 
+  const removeServerNote = async (note) => {
+    const prev = serverNotes;
+    setServerNotes(prev.filter((n) => n.id !== note.id));
+    setErr("");
+    try {
+      const res = await fetch(
+        `${API_BASE}/api/notes/${encodeURIComponent(lead.id)}/${encodeURIComponent(note.id)}?user_email=${encodeURIComponent(userEmail)}`,
+        { method: "DELETE" }
+      );
+      if (!res.ok) throw new Error("Failed to delete note");
+    } catch (e) {
+      setErr(e.message || "Failed to delete note");
+      setServerNotes(prev); // rollback
+    }
+  };
+
   // ---------- quick actions ----------
   const copyToClipboard = async (text, label = "Copied") => {
     try {
@@ -498,8 +574,43 @@ export default function LeadDrawer({
               </div>
             </div>
 
-            {/* List */}
-            {updates.length === 0 ? (
+            {/* Server notes, newest first */}
+            {serverNotes.map((n) => (
+              <div key={n.id} style={{ marginBottom: 10, paddingBottom: 7, borderBottom: "1px solid #232323" }}>
+                <div style={{ fontSize: 13, color: "#999", fontWeight: 700 }}>
+                  Note
+                  <span style={{ color: "#aaa", fontWeight: 400, marginLeft: 6 }}>
+                    {n.createdAt ? new Date(n.createdAt).toLocaleString() : ""}
+                  </span>
+                  <button
+                    onClick={() => removeServerNote(n)}
+                    title="Delete note"
+                    style={{
+                      marginLeft: "auto",
+                      background: "transparent",
+                      border: "none",
+                      color: "#e66565",
+                      fontWeight: 800,
+                      cursor: "pointer",
+                      float: "right",
+                    }}
+                  >
+                    ×
+                  </button>
+                </div>
+                <div style={{ color: "#eee", whiteSpace: "pre-wrap" }}>{n.text}</div>
+              </div>
+            ))}
+            {notesCursor && (
+              <div style={{ display: "flex", justifyContent: "center", marginBottom: 12 }}>
+                <button onClick={loadOlderNotes} style={primarySm}>
+                  Load older notes
+                </button>
+              </div>
+            )}
+
+            {/* Legacy notes kept on the lead */}
+            {updates.length === 0 && serverNotes.length === 0 ? (
               <div style={{ color: "#888", fontStyle: "italic" }}>No notes yet.</div>
             ) : (
               updates.map((u, i) => (
@@ -78,6 +78,9 @@ function NotificationCard({ notif, onMarkRead, onOpenLead }) {
       <div style={{ flex: 1, minWidth: 0 }}>
         <div style={{ color: UI.GOLD, fontWeight: 700, marginBottom: 3, wordBreak: "break-word" }}>
           {notif.title || "Notification"}
+          {notif.count > 1 && (
+            <span style={{ color: UI.SUB, fontWeight: 400, marginLeft: 8 }}>×{notif.count}</span>
+          )}
         </div>
         {notif.message && (
           <div style={{ color: UI.TEXT, fontSize: 14, marginTop: 2, whiteSpace: "pre-wrap" }}>
@@ -160,10 +163,11 @@ export default function Notifications({ user, leads = [], setSection, afterSend
       rows.push({
         id: n.id || key,
         type: (n.type || "info").toLowerCase(),
-        title: n.title || "Notification",
-        message: n.message || "",
+        title: n.subject || n.title || "Notification",
+        message: n.message || n.body || "",
         timestamp: n.timestamp || n.createdAt || new Date().toISOString(),
         read: !!n.read,
+        count: n.count || 1,
         leadId: n.leadId || n.lead_id || null,
         leadName: n.leadName || n.lead_name || null,
       });
@@ -188,7 +192,7 @@ export default function Notifications({ user, leads = [], setSection, afterSend
     }
   }, [userEmail, sortAndDedup]);
 
-  // SSE (best-effort) -> fallback to polling
+  // SSE (resumable) -> fallback to polling
   useEffect(() => {
     if (!userEmail) return;
 
@@ -207,19 +211,21 @@ export default function Notifications({ user, leads = [], setSection, afterSend
           const payload = JSON.parse(ev.data);
           if (!payload) return;
           setNotifs((prev) => {
-            const merged = sortAndDedup([...(prev || []), ...(payload.notifications || [payload])]);
+            // incoming first: a repeat the server folded replaces the row it updated
+            const merged = sortAndDedup([...(payload.notifications || [payload]), ...(prev || [])]);
             return merged;
           });
         } catch {}
       };
+      // the server replays what we missed from Last-Event-ID; "reset" means it can't
+      es.addEventListener("reset", () => load());
+      es.onopen = () => stopPolling();
       es.onerror = () => {
-        // close and fall back to polling
-        try { es.close(); } catch {}
+        // the browser retries on its own (resuming from Last-Event-ID); poll only once it gives up
+        if (es.readyState !== EventSource.CLOSED) return;
         sseRef.current = null;
         startPolling();
       };
-      // also start a slow safety poll in case SSE stalls silently
-      startPolling(60_000);
     } else {
       startPolling();
     }
@@ -264,15 +270,11 @@ export default function Notifications({ user, leads = [], setSection, afterSend
 
   const markAllRead = useCallback(async () => {
     if (!userEmail) return;
-    const unreadIds = notifs.filter((n) => !n.read).map((n) => n.id);
-    if (!unreadIds.length) return;
+    if (!notifs.some((n) => !n.read)) return;
     setNotifs((prev) => prev.map((n) => ({ ...n, read: true })));
     try {
-      await fetch(`${API_BASE}/api/notifications/${encodeURIComponent(userEmail)}/read`, {
-        method: "POST",
-        headers: { "Content-Type": "application/json" },
-        body: JSON.stringify({ ids: unreadIds }),
-      });
+      // one watermark bump server-side, however many are unread
+      await fetch(`${API_BASE}/api/notifications/${encodeURIComponent(userEmail)}/readall`, { method: "POST" });
     } catch {
       // soft failure; next refresh will correct
     }
@@ -20,6 +20,8 @@ const API_BASE =
     ? "http://localhost:5000"
     : "https://retainai-app.onrender.com");
 
+const PAGE_SIZE = 50;
+
 function safeDate(v) {
   const t = Date.parse(v);
   return Number.isFinite(t) ? new Date(t) : new Date(0);
@@ -31,6 +33,9 @@ export default function NotificationsCenter({ user }) {
   const [loading, setLoading] = useState(true);
   const [filter, setFilter] = useState("all"); // all | unread | read
   const [error, setError] = useState("");
+  const [nextCursor, setNextCursor] = useState(null);
+  const [unreadCount, setUnreadCount] = useState(0); // server-side counter; the list may be partial
+  const [loadingOlder, setLoadingOlder] = useState(false);
 
   const pollRef = useRef(null);
   const sseRef = useRef(null);
@@ -70,7 +75,7 @@ export default function NotificationsCenter({ user }) {
       setError("");
       try {
         const res = await fetch(
-          `${API_BASE}/api/notifications/${encodeURIComponent(userEmail)}`,
+          `${API_BASE}/api/notifications/${encodeURIComponent(userEmail)}?limit=${PAGE_SIZE}`,
           { signal }
         );
         const data = await res.json().catch(() => ({}));
@@ -80,6 +85,10 @@ export default function NotificationsCenter({ user }) {
           ? data
           : [];
         setNotifications(normalize(rows));
+        setNextCursor(data?.next_cursor || null);
+        setUnreadCount(
+          Number.isFinite(data?.unread) ? data.unread : rows.filter((n) => !n.read).length
+        );
       } catch (e) {
         if (e.name !== "AbortError") {
           setNotifications([]);
@@ -92,6 +101,39 @@ export default function NotificationsCenter({ user }) {
     [userEmail, normalize]
   );
 
+  const refreshUnread = useCallback(async () => {
+    if (!userEmail) return;
+    try {
+      const res = await fetch(
+        `${API_BASE}/api/notifications/${encodeURIComponent(userEmail)}/unread`
+      );
+      const data = await res.json().catch(() => ({}));
+      if (Number.isFinite(data?.unread)) setUnreadCount(data.unread);
+    } catch {
+      // badge catches up on the next load
+    }
+  }, [userEmail]);
+
+  const loadOlder = useCallback(async () => {
+    if (!userEmail || !nextCursor) return;
+    setLoadingOlder(true);
+    try {
+      const res = await fetch(
+        `${API_BASE}/api/notifications/${encodeURIComponent(
+          userEmail
+        )}?limit=${PAGE_SIZE}&cursor=${encodeURIComponent(nextCursor)}`
+      );
+      const data = await res.json().catch(() => ({}));
+      if (!res.ok) throw new Error(data?.error || "Failed to load notifications.");
+      setNotifications((prev) => normalize([...(prev || []), ...(data.notifications || [])]));
+      setNextCursor(data.next_cursor || null);
+    } catch (e) {
+      setError(e.message || "Failed to load notifications.");
+    } finally {
+      setLoadingOlder(false);
+    }
+  }, [userEmail, nextCursor, normalize]);
+
   // initial load + listen to external refresh pings
   useEffect(() => {
     if (!userEmail) return;
@@ -106,7 +148,7 @@ export default function NotificationsCenter({ user }) {
     };
   }, [load, userEmail]);
 
-  // Live updates: SSE (best-effort) -> polling fallback
+  // Live updates: SSE (resumable) -> polling fallback
   useEffect(() => {
     if (!userEmail) return;
 
@@ -135,21 +177,22 @@ export default function NotificationsCenter({ user }) {
           const rows = Array.isArray(payload?.notifications)
             ? payload.notifications
             : [payload];
-          setNotifications((prev) => normalize([...(prev || []), ...rows]));
+          // incoming first: a repeat the server folded replaces the row it updated
+          setNotifications((prev) => normalize([...rows, ...(prev || [])]));
+          refreshUnread();
         } catch {
-          // ignore malformed packet; polling will keep us consistent
+          // ignore malformed packet
         }
       };
+      // the server replays what we missed from Last-Event-ID; "reset" means it can't
+      es.addEventListener("reset", () => load());
+      es.onopen = () => stopPolling();
       es.onerror = () => {
-        try {
-          es.close();
-        } catch {}
+        // the browser retries on its own (resuming from Last-Event-ID); poll only once it gives up
+        if (es.readyState !== EventSource.CLOSED) return;
         sseRef.current = null;
         startPolling(); // fallback
       };
-
-      // safety slow poll in case the SSE stalls silently
-      startPolling(60_000);
     } else {
       startPolling();
     }
@@ -163,7 +206,7 @@ export default function NotificationsCenter({ user }) {
       }
       stopPolling();
     };
-  }, [userEmail, load, normalize]);
+  }, [userEmail, load, normalize, refreshUnread]);
 
   const markAsRead = useCallback(
     async (notif) => {
@@ -172,30 +215,20 @@ export default function NotificationsCenter({ user }) {
       setNotifications((ns) =>
         ns.map((n) => (n._id === notif._id ? { ...n, read: true } : n))
       );
-      const idParam = notif.id ?? notif._id ?? notif.uuid ?? notif._idx ?? notif._id;
+      setUnreadCount((c) => Math.max(0, c - 1));
       try {
-        // primary endpoint
         const res = await fetch(
-          `${API_BASE}/api/notifications/${encodeURIComponent(
-            userEmail
-          )}/${encodeURIComponent(idParam)}/mark_read`,
-          { method: "POST" }
+          `${API_BASE}/api/notifications/${encodeURIComponent(userEmail)}/read`,
+          {
+            method: "POST",
+            headers: { "Content-Type": "application/json" },
+            body: JSON.stringify({ ids: [notif.id ?? notif._id] }),
+          }
         );
-        if (!res.ok) throw new Error();
+        const data = await res.json().catch(() => ({}));
+        if (Number.isFinite(data?.unread)) setUnreadCount(data.unread);
       } catch {
-        try {
-          // fallback bulk endpoint with single id
-          await fetch(
-            `${API_BASE}/api/notifications/${encodeURIComponent(userEmail)}/read`,
-            {
-              method: "POST",
-              headers: { "Content-Type": "application/json" },
-              body: JSON.stringify({ ids: [idParam] }),
-            }
-          );
-        } catch {
-          // leave optimistic state; next refresh will reconcile
-        }
+        // leave optimistic state; next refresh will reconcile
       }
       ping("notifications:changed");
     },
@@ -203,24 +236,20 @@ export default function NotificationsCenter({ user }) {
   );
 
   const markAllRead = useCallback(async () => {
-    if (!userEmail) return;
-    const ids = notifications.filter((n) => !n.read).map((n) => n.id ?? n._id);
-    if (!ids.length) return;
+    if (!userEmail || !unreadCount) return;
     setNotifications((prev) => prev.map((n) => ({ ...n, read: true })));
+    setUnreadCount(0);
     try {
+      // one watermark bump server-side, however many are unread
       await fetch(
-        `${API_BASE}/api/notifications/${encodeURIComponent(userEmail)}/read`,
-        {
-          method: "POST",
-          headers: { "Content-Type": "application/json" },
-          body: JSON.stringify({ ids }),
-        }
+        `${API_BASE}/api/notifications/${encodeURIComponent(userEmail)}/readall`,
+        { method: "POST" }
       );
     } catch {
       // soft-fail; UI stays optimistic
     }
     ping("notifications:changed");
-  }, [notifications, userEmail]);
+  }, [unreadCount, userEmail]);
 
   const visible = useMemo(() => {
     const list =
@@ -242,8 +271,6 @@ export default function NotificationsCenter({ user }) {
     );
   }
 
-  const unreadCount = notifications.filter((n) => !n.read).length;
-
   return (
     <div className="notif-root">
       <div className="notif-header">
@@ -315,7 +342,10 @@ export default function NotificationsCenter({ user }) {
                 </div>
 
                 <div className="notif-body">
-                  <div className="notif-subject">{notif.subject || "—"}</div>
+                  <div className="notif-subject">
+                    {notif.subject || "—"}
+                    {notif.count > 1 && <span className="notif-count"> ×{notif.count}</span>}
+                  </div>
                   {notif.message && (
                     <div className="notif-message">{notif.message}</div>
                   )}
@@ -346,6 +376,14 @@ export default function NotificationsCenter({ user }) {
           })}
         </ul>
       )}
+
+      {!loading && nextCursor && (
+        <div className="notif-empty">
+          <button className="notif-filter-btn" onClick={loadOlder} disabled={loadingOlder}>
+            {loadingOlder ? "Loading…" : "Load older"}
+          </button>
+        </div>
+      )}
     </div>
   );
 }
@@ -0,0 +1,763 @@
+#!/usr/bin/env python3
+# storage_bench.py — storage benchmarks (dev only; never imported by the app)
+#
+#   python storage_bench.py webhook [--payloads 200] [--statuses 20] [--messages 5] [--threads 8]
+#   python storage_bench.py stress  [--procs 4] [--tenants 8] [--ops 300]
+#   python storage_bench.py codec   [--messages 100000]
+#   python storage_bench.py leads   [--sizes 1000 10000 50000] [--ops 200]
+#   python storage_bench.py search  [--leads 100000] [--notes 20000]
+#   python storage_bench.py pages   [--leads 100000] [--limit 50]
+#   python storage_bench.py csvimport [--rows 200000] [--existing 20000] [--backends json sqlite]
+#   python storage_bench.py export  [--leads 100000] [--messages 200000]
+#   python storage_bench.py analytics [--sizes 1000 10000 100000]
+#   python storage_bench.py events  [--streams 200] [--users 50] [--events 2000]
+#   python storage_bench.py notify  [--hot 500] [--ops 500] [--backends json json+wal sharded sqlite]
+#
+# Every scenario runs in a fresh subprocess against a throwaway DATA_DIR so
+# the env-driven storage settings (STORAGE_BACKEND, JSON_COALESCE_MS, ...)
+# are read at import time exactly as in production.
+
+import os, sys, json, time, shutil, tempfile, subprocess, argparse
+from concurrent.futures import ThreadPoolExecutor
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def _run_child(scenario: str, env: dict, args: list) -> dict:
+    data_dir = tempfile.mkdtemp(prefix="retainai-bench-")
+    try:
+        full_env = dict(os.environ, DATA_DIR=data_dir, FLASK_ENV="production", **env)
+        out = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "_child", scenario, *args],
+            env=full_env, cwd=HERE, capture_output=True, text=True, check=True,
+        ).stdout
+        return json.loads(out.strip().splitlines()[-1])
+    finally:
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+
+def _count_file_writes():
+    import app_storage
+    counter = {"n": 0}
+    real = app_storage._write_json_file
+    def counted(path, data):
+        counter["n"] += 1
+        real(path, data)
+    app_storage._write_json_file = counted
+    return counter
+
+
+# ----------------------------
+# webhook: replay batched Meta webhook deliveries
+# ----------------------------
+def _webhook_payload(i: int, statuses: int, messages: int, phones: list) -> dict:
+    return {"entry": [{"changes": [{"value": {
+        "statuses": [{"id": f"wamid.{i}.{j}", "status": "delivered", "timestamp": str(1700000000 + j),
+                      "recipient_id": phones[j % len(phones)]} for j in range(statuses)],
+        "contacts": [{"wa_id": phones[i % len(phones)]}],
+        "messages": [{"type": "text", "text": {"body": f"msg {i}.{j}"}} for j in range(messages)],
+    }}]}]}
+
+
+def _child_webhook(opts):
+    counter = _count_file_writes()
+    import app
+    if opts.no_request_batch:
+        app.app.before_request_funcs[None].remove(app._open_write_batch)
+    client = app.app.test_client()
+    phones = []
+    for t in range(opts.tenants):
+        for k in range(opts.leads):
+            phone = f"1555{t:03d}{k:04d}"
+            phones.append(phone)
+            client.post(f"/api/leads/tenant{t}@example.com", json={"name": f"lead {k}", "phone": phone})
+    payloads = [_webhook_payload(i, opts.statuses, opts.messages, phones) for i in range(opts.payloads)]
+    counter["n"] = 0
+
+    def post(p):
+        return app.app.test_client().post("/api/whatsapp/webhook", json=p).status_code
+
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=opts.threads) as pool:
+        codes = list(pool.map(post, payloads))
+    elapsed = time.perf_counter() - t0
+    assert all(c == 200 for c in codes), codes
+    return {"payloads_per_s": round(opts.payloads / elapsed, 1), "elapsed_s": round(elapsed, 3),
+            "file_writes": counter["n"]}
+
+
+def bench_webhook(opts):
+    args = ["--payloads", str(opts.payloads), "--statuses", str(opts.statuses), "--messages", str(opts.messages),
+            "--threads", str(opts.threads), "--tenants", str(opts.tenants), "--leads", str(opts.leads)]
+    scenarios = [
+        ("per-item writes (no batching)", {"JSON_COALESCE_MS": "0"}, ["--no-request-batch"]),
+        ("request batch",                 {"JSON_COALESCE_MS": "0"}, []),
+        ("request batch + 2ms window",    {"JSON_COALESCE_MS": "2"}, []),
+        ("request batch + 5ms window",    {"JSON_COALESCE_MS": "5"}, []),
+    ]
+    print(f"webhook replay: {opts.payloads} deliveries x ({opts.statuses} statuses + {opts.messages} messages), "
+          f"{opts.threads} threads, STORAGE_BACKEND={os.getenv('STORAGE_BACKEND', 'json')}")
+    for label, env, extra in scenarios:
+        r = _run_child("webhook", env, args + extra)
+        print(f"  {label:32s} {r['payloads_per_s']:>9} deliveries/s  {r['file_writes']:>7} file writes")
+
+
+# ----------------------------
+# stress: concurrent read-modify-write from several worker processes
+# ----------------------------
+# Each worker appends --ops items to random tenants' lead buckets, one
+# request-sized write batch per op, like gunicorn workers serving
+# create_lead. Afterwards every item must be present exactly once.
+STRESS_MODES = {
+    "unsafe":     "get/put, no lock (the old load -> modify -> save)",
+    "locked":     "bucket_lock around the read-modify-write",
+    "optimistic": "update_bucket (version check + retry)",
+}
+
+
+def _child_stress_worker(opts):
+    import random
+    import app_storage as st
+    rng = random.Random(opts.worker)
+    while time.time() < opts.start_at:
+        time.sleep(0.001)
+    t0 = time.perf_counter()
+    for i in range(opts.ops):
+        tenant = f"tenant{rng.randrange(opts.tenants)}@example.com"
+        item = {"id": f"w{opts.worker}-{i}", "name": f"lead {i}"}
+        with st.write_batch():
+            if opts.mode == "unsafe":
+                arr = st.get_backend().get("leads", tenant) or []
+                arr.append(item)
+                st.get_backend().put("leads", tenant, arr)
+            elif opts.mode == "locked":
+                with st.bucket_lock("leads", tenant):
+                    arr = st.get_bucket("leads", tenant, []) or []
+                    arr.append(item)
+                    st.put_bucket("leads", tenant, arr)
+            else:
+                st.update_bucket("leads", tenant, lambda arr: arr.append(item), [])
+    return {"elapsed_s": time.perf_counter() - t0}
+
+
+def _child_stress_check(opts):
+    import app_storage as st
+    ids = [ld["id"] for arr in st.load_entity("leads").values() for ld in (arr or [])]
+    versions = sum(st.bucket_version("leads", f"tenant{t}@example.com") for t in range(opts.tenants))
+    return {"items": len(ids), "unique": len(set(ids)), "versions": versions}
+
+
+def _stress_round(opts, mode: str, tenants: int) -> dict:
+    data_dir = tempfile.mkdtemp(prefix="retainai-stress-")
+    env = dict(os.environ, DATA_DIR=data_dir, FLASK_ENV="production")
+    base = [sys.executable, os.path.abspath(__file__), "_child"]
+    common = ["--mode", mode, "--tenants", str(tenants), "--ops", str(opts.ops)]
+    try:
+        start_at = time.time() + 1.0  # let every worker finish importing first
+        procs = [subprocess.Popen(base + ["stress-worker", *common, "--worker", str(w), "--start-at", str(start_at)],
+                                  env=env, cwd=HERE, stdout=subprocess.PIPE, text=True)
+                 for w in range(opts.procs)]
+        outs = [json.loads(p.communicate()[0].strip().splitlines()[-1]) for p in procs]
+        assert all(p.returncode == 0 for p in procs)
+        check = json.loads(subprocess.run(base + ["stress-check", *common], env=env, cwd=HERE,
+                                          capture_output=True, text=True, check=True).stdout.strip().splitlines()[-1])
+        wall = max(o["elapsed_s"] for o in outs)
+        expected = opts.procs * opts.ops
+        return dict(check, expected=expected, lost=expected - check["unique"],
+                    ops_per_s=round(expected / wall, 1))
+    finally:
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+
+def bench_stress(opts):
+    backend = os.getenv("STORAGE_BACKEND", "json")
+    print(f"stress: {opts.procs} processes x {opts.ops} read-modify-writes, STORAGE_BACKEND={backend}")
+    failed = False
+    for tenants in (opts.tenants, 1):
+        print(f"  {tenants} tenant(s):")
+        for mode in (opts.modes or list(STRESS_MODES)):
+            r = _stress_round(opts, mode, tenants)
+            ok = r["lost"] == 0 and r["items"] == r["unique"]
+            if mode != "unsafe":
+                failed |= not ok or r["versions"] != r["expected"]
+            print(f"    {mode:10s} {r['ops_per_s']:>9} ops/s  {r['unique']:>6}/{r['expected']} items  "
+                  f"lost {r['lost']:>5}  versions {r['versions']:>6}  {'ok' if ok else 'LOST UPDATES'}")
+    return 1 if failed else 0
+
+
+# ----------------------------
+# codec: file size and parse time of a large chat store per STORAGE_CODEC
+# ----------------------------
+def _synthetic_chats(messages: int, users: int = 50, leads: int = 40) -> dict:
+    chats, n = {}, 0
+    per_thread = max(1, messages // (users * leads))
+    for u in range(users):
+        threads = chats[f"owner{u}@example.com"] = {}
+        for l in range(leads):
+            threads[f"lead{l:04d}"] = [
+                {"from": "lead" if (k % 3) else "user",
+                 "text": f"Hi! Just checking in about my appointment on the {k % 28 + 1}th — café at 10:30? ({k})",
+                 "time": f"2025-0{k % 9 + 1}-{k % 28 + 1:02d}T10:{k % 60:02d}:00Z"}
+                for k in range(per_thread)
+            ]
+            n += per_thread
+            if n >= messages:
+                return chats
+    return chats
+
+
+def _child_codec(opts):
+    import app_storage as st
+    data = _synthetic_chats(opts.messages)
+    path = os.path.join(os.environ["DATA_DIR"], "whatsapp_chats.json")
+    real_orjson = st.orjson
+    variants = [("json (stdlib, indent=2)", "json", None), ("json (orjson, indent=2)", "json", real_orjson),
+                ("compact (stdlib)", "compact", None), ("compact (orjson)", "compact", real_orjson),
+                ("msgpack", "msgpack", real_orjson)]
+    out = []
+    for label, codec, oj in variants:
+        if (oj is None and label.startswith(("json (orjson", "compact (orjson"))) or \
+           (codec == "msgpack" and st.msgpack is None):
+            continue
+        st.orjson = oj
+        t0 = time.perf_counter()
+        raw = st.encode_doc(data, codec)
+        enc = time.perf_counter() - t0
+        with open(path, "wb") as f:
+            f.write(raw)
+        best = float("inf")
+        for _ in range(opts.repeat):
+            t0 = time.perf_counter()
+            with open(path, "rb") as f:
+                back = st.decode_doc(f.read())
+            best = min(best, time.perf_counter() - t0)
+        assert back == data
+        out.append({"label": label, "bytes": len(raw), "encode_ms": round(enc * 1000, 1), "parse_ms": round(best * 1000, 1)})
+    st.orjson = real_orjson
+    return {"variants": out}
+
+
+def bench_codec(opts):
+    r = _run_child("codec", {}, ["--messages", str(opts.messages), "--repeat", str(opts.repeat)])
+    print(f"codec: synthetic chat store, {opts.messages} messages (best of {opts.repeat} parses)")
+    base = r["variants"][0]
+    for v in r["variants"]:
+        print(f"  {v['label']:26s} {v['bytes'] / 1e6:>7.2f} MB ({v['bytes'] / base['bytes']:>4.0%})  "
+              f"encode {v['encode_ms']:>7} ms  parse {v['parse_ms']:>7} ms ({base['parse_ms'] / v['parse_ms']:.1f}x)")
+
+
+# ----------------------------
+# leads: per-op latency of id-addressed lead operations as the bucket grows
+#
+# The id lookup is O(1) on every backend, but only json+wal persists a lead
+# edit in O(1) (one journal record). Plain json and sqlite still rewrite the
+# tenant's whole bucket per write, so their update/optout grow with it.
+# ----------------------------
+LEAD_OPS = ("update", "optout", "note", "exists", "scan")
+
+def _child_leads(opts):
+    import app, app_storage as st
+    client, user = app.app.test_client(), "owner@example.com"
+    st.put_bucket("leads", user, [{"id": f"ld{i:07d}", "name": f"Lead {i}", "email": f"lead{i}@example.com",
+                                   "whatsapp": f"+1555{i:07d}", "tags": ["new"], "createdAt": "2025-01-01T00:00:00Z"}
+                                  for i in range(opts.size)])
+    ids = [f"ld{(i * 7919) % opts.size:07d}" for i in range(opts.ops)]
+    ops = {
+        "update": lambda i: client.put(f"/api/leads/{user}/{i}", json={"name": "Renamed"}),
+        "optout": lambda i: client.post("/api/whatsapp/optout", json={"user_email": user, "lead_id": i, "opt_out": True}),
+        "note":   lambda i: client.post(f"/api/notes/{i}?user_email={user}", json={"text": "called back"}),
+        "exists": lambda i: i in app.lead_index(user),
+        # what the handlers did before the index: a full load + linear search
+        "scan":   lambda i: any(str(ld.get("id")) == i for ld in app.load_user_leads(user)),
+    }
+    out = {}
+    for name in LEAD_OPS:
+        ops[name](ids[0])  # warm the cache/index outside the timing
+        lat = []
+        for i in ids:
+            t0 = time.perf_counter()
+            r = ops[name](i)
+            lat.append(time.perf_counter() - t0)
+            assert r is True or getattr(r, "status_code", 200) < 300, (name, i)
+        lat.sort()
+        out[name] = {"p50_us": round(lat[len(lat) // 2] * 1e6), "p95_us": round(lat[int(len(lat) * .95)] * 1e6)}
+    out["index"] = st.index_stats()
+    return out
+
+
+def bench_leads(opts):
+    configs = [("json", {}), ("json+wal", {"STORAGE_WAL": "leads"}), ("sqlite", {"STORAGE_BACKEND": "sqlite"})]
+    print(f"leads: p50 / p95 per op (us), {opts.ops} ops each")
+    for label, env in configs:
+        if opts.backends and label not in opts.backends:
+            continue
+        print(f"  {label}")
+        for size in opts.sizes:
+            r = _run_child("leads", env, ["--size", str(size), "--ops", str(opts.ops)])
+            cols = "  ".join(f"{n} {r[n]['p50_us']:>7}/{r[n]['p95_us']:<7}" for n in LEAD_OPS)
+            print(f"    {size:>7} leads  {cols}  index builds {r['index']['builds']}")
+
+
+# ----------------------------
+# search: inverted-index lead search on one large tenant
+# ----------------------------
+_FIRST = ["james", "maria", "wei", "olga", "ahmed", "sofia", "liam", "yuki", "noah", "amara", "lucas", "ines",
+          "mateo", "chloe", "ravi", "emma", "omar", "zoe", "felix", "nadia"]
+_LAST = ["smith", "garcia", "chen", "ivanova", "hassan", "rossi", "murphy", "tanaka", "brown", "okafor",
+         "silva", "martin", "lopez", "dubois", "patel", "wilson", "khan", "novak", "becker", "haddad"]
+_CO = ["acme", "globex", "initech", "umbrella", "stark", "wayne", "hooli", "vandelay", "soylent", "tyrell"]
+
+SEARCH_QUERIES = [("exact name", "garcia"), ("two words", "maria chen"), ("prefix", "tana"),
+                  ("typo", "ivanvoa"), ("phone", "(555) 213-4213"), ("email", "lopez77@"),
+                  ("company + tag", "hooli vip"), ("note word", "pricing"), ("broad prefix", "m")]
+
+def _child_search(opts):
+    import app_storage as st, app_search
+    user = "owner@example.com"
+    leads = []
+    for i in range(opts.leads):
+        first, last = _FIRST[i % 20], _LAST[(i // 20) % 20]
+        leads.append({"id": f"ld{i:07d}", "name": f"{first.title()} {last.title()} {i}",
+                      "email": f"{last}{i}@{_CO[i % 10]}.com", "phone": f"+1 (555) {i % 1000:03d}-{i:04d}"[:20],
+                      "company": _CO[(i * 7) % 10].title(), "tags": ["vip"] if i % 13 == 0 else ["new"]})
+    st.put_bucket("leads", user, leads)
+    st.put_bucket("notes", user, [{"id": f"n{i}", "lead_id": f"ld{(i * 17) % opts.leads:07d}",
+                                   "text": "asked about pricing" if i % 50 == 0 else "left a voicemail"}
+                                  for i in range(opts.notes)])
+    t0 = time.perf_counter()
+    app_search.search(user, "warmup")
+    build = time.perf_counter() - t0
+    out = {"build_ms": round(build * 1000), "queries": []}
+    for label, q in SEARCH_QUERIES:
+        best, res = float("inf"), None
+        for _ in range(opts.repeat):
+            t0 = time.perf_counter()
+            res = app_search.search(user, q, limit=50)
+            best = min(best, time.perf_counter() - t0)
+        out["queries"].append({"label": label, "q": q, "ms": round(best * 1000, 2), "total": res["total"]})
+    lat = []
+    for i in range(200):
+        ld = dict(leads[(i * 7919) % opts.leads], name=f"Renamed Person {i}")
+        t0 = time.perf_counter()
+        st.upsert_item("leads", user, ld)
+        app_search.search(user, f"renamed {i}")
+        lat.append(time.perf_counter() - t0)
+    out["update_then_search_ms"] = round(sorted(lat)[100] * 1000, 2)
+    # a write from another worker: the index is rebuilt, the search views catch up on the diff
+    subprocess.run([sys.executable, "-c", "import app_storage as st; st.upsert_item('leads', %r, %r)"
+                    % (user, dict(leads[1], name="Written Elsewhere"))], cwd=HERE, check=True)
+    t0 = time.perf_counter()
+    assert app_search.search(user, "written elsewhere")["total"] == 1
+    out["foreign_write_search_ms"] = round((time.perf_counter() - t0) * 1000, 1)
+    out["index"] = st.index_stats()
+    return out
+
+
+def bench_search(opts):
+    env = {"STORAGE_WAL": "leads,notes"}
+    r = _run_child("search", env, ["--leads", str(opts.leads), "--notes", str(opts.notes), "--repeat", str(opts.repeat)])
+    print(f"search: one tenant, {opts.leads} leads + {opts.notes} notes (STORAGE_WAL=leads,notes), best of {opts.repeat}")
+    print(f"  index build (first query)       {r['build_ms']:>8} ms")
+    for q in r["queries"]:
+        print(f"  {q['label']:14s} {q['q']!r:18s} {q['ms']:>8} ms  {q['total']:>7} hits")
+    print(f"  upsert + search (p50)           {r['update_then_search_ms']:>8} ms")
+    print(f"  search after another worker's write {r['foreign_write_search_ms']:>6} ms  "
+          f"(index builds {r['index']['builds']}, refreshes {r['index']['refreshes']})")
+
+
+PAGE_QUERIES = [("first page", {}), ("newest first", {"sort": "-createdAt"}), ("by name", {"sort": "name"}),
+                ("tag filter", {"tag": "vip"}), ("source filter", {"source": "csv"}),
+                ("projection", {"fields": "name,email"})]
+
+def _child_pages(opts):
+    import app_storage as st, app_lead_list
+    user = "owner@example.com"
+    leads = [{"id": f"ld{i:07d}", "name": f"{_FIRST[i % 20].title()} {_LAST[(i // 20) % 20].title()}",
+              "email": f"lead{i}@{_CO[i % 10]}.com", "createdAt": f"2025-{i % 12 + 1:02d}-01T00:00:{i % 60:02d}Z",
+              "tags": ["vip"] if i % 13 == 0 else ["new"], "source": "csv" if i % 5 == 0 else "google"}
+             for i in range(opts.leads)]
+    st.put_bucket("leads", user, leads)
+    t0 = time.perf_counter()
+    full = json.dumps(st.view_bucket("leads", user))
+    out = {"full_ms": round((time.perf_counter() - t0) * 1000, 1), "full_bytes": len(full), "queries": []}
+    for label, q in PAGE_QUERIES:
+        t0 = time.perf_counter()
+        app_lead_list.page_leads(user, limit=opts.limit, **q)
+        first = time.perf_counter() - t0
+        best, cursor, pages = float("inf"), None, 0
+        while pages < opts.pages:  # walk forward with the cursor, timing each page incl. serialization
+            t0 = time.perf_counter()
+            res = app_lead_list.page_leads(user, limit=opts.limit, cursor=cursor, **q)
+            body = json.dumps(res)
+            best = min(best, time.perf_counter() - t0)
+            cursor, pages = res["next_cursor"], pages + 1
+            if not cursor:
+                break
+        out["queries"].append({"label": label, "first_ms": round(first * 1000, 1), "page_ms": round(best * 1000, 2),
+                               "bytes": len(body)})
+    lat = []
+    for i in range(200):
+        ld = dict(leads[(i * 7919) % opts.leads], name=f"Renamed {i}")
+        t0 = time.perf_counter()
+        st.upsert_item("leads", user, ld)
+        app_lead_list.page_leads(user, sort="name", limit=opts.limit)
+        lat.append(time.perf_counter() - t0)
+    out["update_then_page_ms"] = round(sorted(lat)[100] * 1000, 2)
+    return out
+
+
+def bench_pages(opts):
+    r = _run_child("pages", {"STORAGE_WAL": "leads"},
+                   ["--leads", str(opts.leads), "--limit", str(opts.limit), "--pages", str(opts.pages)])
+    print(f"pages: one tenant, {opts.leads} leads (STORAGE_WAL=leads), limit {opts.limit}")
+    print(f"  whole bucket (old response)  {r['full_ms']:>8} ms  {r['full_bytes']:>10} bytes")
+    for q in r["queries"]:
+        print(f"  {q['label']:14s} first {q['first_ms']:>8} ms   then {q['page_ms']:>6} ms/page  {q['bytes']:>8} bytes")
+    print(f"  upsert + page (p50)          {r['update_then_page_ms']:>8} ms")
+
+
+def _child_csvimport(opts):
+    import csv, resource, app_storage as st, app_csv_import as ci
+    user = "owner@example.com"
+    st.put_bucket("leads", user, [{"id": f"ld{i:07d}", "name": f"Existing {i}", "email": f"lead{i}@example.com"}
+                                  for i in range(opts.existing)])
+    path = os.path.join(os.environ["DATA_DIR"], "upload.csv")
+    with open(path, "w", newline="") as f:
+        w = csv.writer(f)
+        w.writerow(["First Name", "Last Name", "E-mail 1 - Value", "Phone 1 - Value", "Organization 1 - Name", "Notes"])
+        for i in range(opts.rows):  # every 10th row re-imports an existing lead, every 25th repeats an earlier row
+            n = i - 7 if i % 25 == 24 else i
+            email = f"lead{n}@example.com" if i % 10 == 0 else f"new{n}@example.org"
+            w.writerow([_FIRST[n % 20].title(), _LAST[(n // 20) % 20].title(), email, f"+1 (555) {n // 10000:03d}-{n % 10000:04d}",
+                        _CO[n % 10], "met at the expo" if n % 3 == 0 else ""])
+    out = {"bytes": os.path.getsize(path)}
+    t0 = time.perf_counter()
+    with open(path, "rb") as f:
+        prev = ci.preview(user, f, "upload.csv")
+    out["preview_ms"] = round((time.perf_counter() - t0) * 1000, 1)
+    writes, put = [0], ci.upsert_items
+    def counted(*a):
+        writes[0] += 1
+        put(*a)
+    ci.upsert_items = counted
+    t0 = time.perf_counter()
+    counts = ci.start_commit(user, prev["import_id"])
+    out["commit_ms"] = round((time.perf_counter() - t0) * 1000, 1)
+    out.update(counts, duplicates=prev["duplicate_rows"], bucket_writes=writes[0],
+               max_rss_mb=round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1))
+    return out
+
+
+def bench_csvimport(opts):
+    print(f"csvimport: {opts.rows} CSV rows into a tenant with {opts.existing} leads")
+    for backend in opts.backends or ["json", "sqlite"]:
+        r = _run_child("csvimport", {"STORAGE_BACKEND": backend},
+                       ["--rows", str(opts.rows), "--existing", str(opts.existing)])
+        print(f"  {backend:8s} preview {r['preview_ms']:>8} ms  commit {r['commit_ms']:>9} ms  "
+              f"({r['bucket_writes']} bucket writes)  imported {r['imported']}  merged {r['merged']}  "
+              f"skipped {r['skipped']}  -> {r['total_after']} leads  max RSS {r['max_rss_mb']} MB")
+
+
+def _child_export(opts):
+    import tracemalloc, app_storage as st, app_chats, app_export
+    user = "owner@example.com"
+    st.put_bucket("leads", user, [{"id": f"ld{i:07d}", "name": f"{_FIRST[i % 20].title()} {_LAST[(i // 20) % 20].title()}",
+                                   "email": f"lead{i}@{_CO[i % 10]}.com", "tags": ["new"], "createdAt": "2025-01-01T00:00:00Z"}
+                                  for i in range(opts.leads)])
+    for t in range(100):  # 100 threads, written in bulk the way app_chats.migrate does
+        lead, d = f"ld{t:07d}", app_chats._thread_dir(user, f"ld{t:07d}")
+        head = app_chats._empty_head(user, lead)
+        app_chats._write(d, head, [{"from": "lead" if i % 2 else "me", "text": f"message {i} about the booking",
+                                    "time": "2025-01-01T00:00:00Z"} for i in range(opts.messages // 100)])
+        st.save_json(app_chats._head_path(d), head)
+    st.view_bucket("leads", user)  # warm the cache, as a live worker would be
+    out = {}
+    t0 = time.perf_counter()
+    tracemalloc.start()
+    whole = len(json.dumps(st.view_bucket("leads", user)))
+    out["whole_peak_mb"] = round(tracemalloc.get_traced_memory()[1] / 1e6, 1)
+    tracemalloc.stop()
+    out["whole_ms"], out["whole_bytes"] = round((time.perf_counter() - t0) * 1000, 1), whole
+    for kind, fmt, gz in (("leads", "ndjson", False), ("leads", "csv", True), ("chats", "ndjson", False),
+                          ("chats", "csv", True)):
+        t0 = time.perf_counter()
+        tracemalloc.start()
+        size = sum(len(b) for b in app_export.export_stream(user, kind, fmt, gz))
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        out[f"{kind}.{fmt}{'.gz' if gz else ''}"] = {"ms": round((time.perf_counter() - t0) * 1000, 1),
+                                                     "bytes": size, "peak_mb": round(peak / 1e6, 2)}
+    return out
+
+
+def bench_export(opts):
+    r = _run_child("export", {}, ["--leads", str(opts.leads), "--messages", str(opts.messages)])
+    print(f"export: one tenant, {opts.leads} leads, {opts.messages} chat messages in 100 threads")
+    print(f"  json.dumps(leads) (whole)  {r.pop('whole_ms'):>8} ms  {r.pop('whole_bytes'):>10} bytes  "
+          f"peak {r.pop('whole_peak_mb')} MB")
+    for label, x in r.items():
+        print(f"  stream {label:19s} {x['ms']:>8} ms  {x['bytes']:>10} bytes  peak {x['peak_mb']} MB")
+
+
+def _child_analytics(opts):
+    import app_storage as st, app_analytics
+    user, size = "owner@example.com", opts.sizes[0]
+    st.put_bucket("leads", user, [{"id": f"ld{i:07d}", "name": f"Lead {i}", "email": f"lead{i}@example.com",
+                                   "createdAt": f"2025-{i % 12 + 1:02d}-01T00:00:00Z",
+                                   "last_contacted": f"2025-{i % 12 + 1:02d}-15T00:00:00Z" if i % 3 else None,
+                                   "tags": ["VIP"] if i % 50 == 0 else ["new"], "source": "csv" if i % 5 == 0 else "google"}
+                                  for i in range(size)])
+    st.put_bucket("appointments", user, [{"id": f"ap{i}", "lead_email": f"lead{i * 7 % size}@example.com",
+                                          "appointment_time": f"2025-{i % 12 + 1:02d}-10T{i % 24:02d}:00:00"}
+                                         for i in range(size // 10)])
+    t0 = time.perf_counter()
+    app_analytics.dashboard(user)
+    out = {"first_ms": round((time.perf_counter() - t0) * 1000, 1)}
+    lat = []
+    for i in range(100):
+        t0 = time.perf_counter()
+        app_analytics.dashboard(user)
+        lat.append(time.perf_counter() - t0)
+    out["warm_ms"] = round(sorted(lat)[len(lat) // 2] * 1000, 2)
+    lat = []
+    for i in range(100):
+        t0 = time.perf_counter()
+        st.upsert_item("leads", user, {"id": f"ld{i * 7919 % size:07d}", "name": f"Renamed {i}", "tags": ["Won"],
+                                       "last_contacted": "2026-01-01T00:00:00Z"})
+        app_analytics.dashboard(user)
+        lat.append(time.perf_counter() - t0)
+    out["upsert_then_ms"] = round(sorted(lat)[len(lat) // 2] * 1000, 2)
+    out["bytes"] = len(json.dumps(app_analytics.dashboard(user)))
+    return out
+
+
+def bench_analytics(opts):
+    print("analytics: dashboard aggregates per tenant size (p50 of 100)")
+    for size in opts.sizes:
+        r = _run_child("analytics", {}, ["--sizes", str(size)])
+        print(f"  {size:>7} leads  first {r['first_ms']:>8} ms  warm {r['warm_ms']:>6} ms  "
+              f"upsert + dashboard {r['upsert_then_ms']:>6} ms  {r['bytes']} bytes")
+
+
+def _child_events_publish(opts):
+    import app_events
+    for i in range(opts.events):
+        app_events.publish(f"user{i % opts.users}@example.com", "notification", {"i": i, "t": time.time()})
+        time.sleep(opts.interval_ms / 1000.0)
+    return {}
+
+
+def _child_events(opts):
+    """Streams in this process, publishes from another one: every delivery crosses workers through the log."""
+    import threading, app_events
+    subs = [app_events.subscribe(f"user{i % opts.users}@example.com") for i in range(opts.streams)]
+    per_user = [len(range(u, opts.events, opts.users)) for u in range(opts.users)]
+    lat, mu = [], threading.Lock()
+
+    def consume(k, sub):
+        mine = []
+        for _ in range(per_user[k % opts.users]):
+            _, _, data = sub.queue.get(timeout=30)
+            mine.append(time.time() - data["t"])
+        with mu:
+            lat.extend(mine)
+
+    threads = [threading.Thread(target=consume, args=(k, sub)) for k, sub in enumerate(subs)]
+    for t in threads:
+        t.start()
+    t0 = time.perf_counter()
+    subprocess.run([sys.executable, os.path.abspath(__file__), "_child", "events-publish", "--users", str(opts.users),
+                    "--events", str(opts.events), "--interval-ms", str(opts.interval_ms)], check=True,
+                   stdout=subprocess.DEVNULL)
+    for t in threads:
+        t.join()
+    lat.sort()
+    stats = app_events.bus_stats()
+    return {"deliveries": len(lat), "seconds": round(time.perf_counter() - t0, 2),
+            "p50_ms": round(lat[len(lat) // 2] * 1000, 1), "p99_ms": round(lat[int(len(lat) * 0.99)] * 1000, 1),
+            "ticks": stats["ticks"], "reads": stats["reads"]}
+
+
+def bench_events(opts):
+    r = _run_child("events", {}, ["--streams", str(opts.streams), "--users", str(opts.users),
+                                  "--events", str(opts.events), "--interval-ms", str(opts.interval_ms)])
+    secs = r["seconds"]
+    print(f"events: {opts.streams} SSE streams over {opts.users} users, {opts.events} notifications "
+          f"published from a second process over {secs}s")
+    print(f"  deliveries {r['deliveries']}  latency p50 {r['p50_ms']} ms  p99 {r['p99_ms']} ms  "
+          f"tailer passes {r['ticks']}  log reads {r['reads']}  API polls 0")
+    print(f"  (polling at 20s + 60s safety poll: ~{round(opts.streams * secs * (1 / 20 + 1 / 60))} "
+          f"GET /api/notifications over the same window)")
+
+
+def _child_notify(opts):
+    import app_storage as st, app_notifications as notif
+    user = "owner@example.com"
+    seed = [{"id": f"n{i:05d}", "timestamp": f"2026-01-01T00:{i // 60 % 60:02d}:{i % 60:02d}Z",
+             "subject": "Follow-up", "message": f"m{i}", "read": False} for i in range(opts.hot)]
+    out = {}
+    st.put_bucket("notifications", user, list(seed))
+    lat = []
+    for i in range(opts.ops):  # the old path: whole hot list read, appended to, written back
+        t0 = time.perf_counter()
+        with st.bucket_lock("notifications", user):
+            arr = st.get_bucket("notifications", user, []) or []
+            arr.append({"timestamp": "2026-02-01T00:00:00Z", "subject": "s", "message": str(i), "read": False})
+            st.put_bucket("notifications", user, arr[-opts.hot:])
+        lat.append(time.perf_counter() - t0)
+    out["list_rewrite_ms"] = round(sorted(lat)[len(lat) // 2] * 1000, 3)
+    st.put_bucket("notifications", user, list(seed))
+    notif.notify(user, "warm-up")  # one-time schema upgrade + counter
+    lat = []
+    for i in range(opts.ops):
+        t0 = time.perf_counter()
+        notif.notify(user, "Follow-up", str(i))
+        lat.append(time.perf_counter() - t0)
+    out["notify_ms"] = round(sorted(lat)[len(lat) // 2] * 1000, 3)
+    t0 = time.perf_counter()
+    notif.mark_all_read(user)
+    out["readall_ms"] = round((time.perf_counter() - t0) * 1000, 3)
+    return out
+
+
+def bench_notify(opts):
+    print(f"notify: append p50 with a {opts.hot}-entry hot list ({opts.ops} appends, outside a request batch)")
+    for backend in opts.backends or ["json", "json+wal", "sharded", "sqlite"]:
+        env = {"STORAGE_BACKEND": backend.split("+")[0]}
+        if backend.endswith("+wal"):
+            env["STORAGE_WAL"] = "notifications,notification_state"
+        r = _run_child("notify", env, ["--hot", str(opts.hot), "--ops", str(opts.ops)])
+        print(f"  {backend:9s} list rewrite {r['list_rewrite_ms']:>8} ms  notify() {r['notify_ms']:>8} ms  "
+              f"read-all {r['readall_ms']:>7} ms")
+
+
+def main(argv):
+    p = argparse.ArgumentParser(prog="storage_bench.py")
+    sub = p.add_subparsers(dest="cmd", required=True)
+
+    def webhook_args(sp):
+        sp.add_argument("--payloads", type=int, default=200)
+        sp.add_argument("--statuses", type=int, default=20)
+        sp.add_argument("--messages", type=int, default=5)
+        sp.add_argument("--threads", type=int, default=8)
+        sp.add_argument("--tenants", type=int, default=10)
+        sp.add_argument("--leads", type=int, default=50)
+        sp.add_argument("--no-request-batch", action="store_true")
+    webhook_args(sub.add_parser("webhook", help="replay batched WhatsApp webhook deliveries"))
+
+    st = sub.add_parser("stress", help="multi-process read-modify-write; fails if a locked mode loses updates")
+    st.add_argument("--procs", type=int, default=4)
+    st.add_argument("--tenants", type=int, default=8)
+    st.add_argument("--ops", type=int, default=300)
+    st.add_argument("--modes", nargs="*", choices=sorted(STRESS_MODES))
+
+    def codec_args(sp):
+        sp.add_argument("--messages", type=int, default=100000)
+        sp.add_argument("--repeat", type=int, default=3)
+    codec_args(sub.add_parser("codec", help="compare STORAGE_CODEC file size and parse time on a large chat store"))
+
+    ld = sub.add_parser("leads", help="per-op latency of lead update/opt-out/note as the bucket grows")
+    ld.add_argument("--sizes", type=int, nargs="*", default=[1000, 10000, 50000])
+    ld.add_argument("--ops", type=int, default=200)
+    ld.add_argument("--backends", nargs="*", choices=["json", "json+wal", "sqlite"])
+
+    def search_args(sp):
+        sp.add_argument("--leads", type=int, default=100000)
+        sp.add_argument("--notes", type=int, default=20000)
+        sp.add_argument("--repeat", type=int, default=5)
+    search_args(sub.add_parser("search", help="lead search latency on one large tenant"))
+
+    def pages_args(sp):
+        sp.add_argument("--leads", type=int, default=100000)
+        sp.add_argument("--limit", type=int, default=50)
+        sp.add_argument("--pages", type=int, default=20)
+    pages_args(sub.add_parser("pages", help="paged/sorted/filtered lead listing vs the whole-bucket response"))
+
+    def csvimport_args(sp):
+        sp.add_argument("--rows", type=int, default=200000)
+        sp.add_argument("--existing", type=int, default=20000)
+        sp.add_argument("--backends", nargs="*", choices=["json", "sharded", "sqlite"])
+    csvimport_args(sub.add_parser("csvimport", help="CSV preview + chunked commit of a large contact export"))
+
+    def export_args(sp):
+        sp.add_argument("--leads", type=int, default=100000)
+        sp.add_argument("--messages", type=int, default=200000)
+    export_args(sub.add_parser("export", help="streamed NDJSON/CSV export vs serializing the whole bucket"))
+
+    def analytics_args(sp):
+        sp.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    analytics_args(sub.add_parser("analytics", help="dashboard aggregates: first build, warm reads, after writes"))
+
+    def events_args(sp):
+        sp.add_argument("--streams", type=int, default=200)
+        sp.add_argument("--users", type=int, default=50)
+        sp.add_argument("--events", type=int, default=2000)
+        sp.add_argument("--interval-ms", type=float, default=2.0)
+    events_args(sub.add_parser("events", help="SSE fan-out latency across workers through the event log"))
+
+    def notify_args(sp):
+        sp.add_argument("--hot", type=int, default=500)
+        sp.add_argument("--ops", type=int, default=500)
+        sp.add_argument("--backends", nargs="*", choices=["json", "json+wal", "sharded", "sqlite"])
+    notify_args(sub.add_parser("notify", help="notification append / read-all cost against a full hot list"))
+
+    child = sub.add_parser("_child")
+    child_sub = child.add_subparsers(dest="scenario", required=True)
+    webhook_args(child_sub.add_parser("webhook"))
+    codec_args(child_sub.add_parser("codec"))
+    lc = child_sub.add_parser("leads")
+    lc.add_argument("--size", type=int)
+    lc.add_argument("--ops", type=int)
+    search_args(child_sub.add_parser("search"))
+    pages_args(child_sub.add_parser("pages"))
+    csvimport_args(child_sub.add_parser("csvimport"))
+    export_args(child_sub.add_parser("export"))
+    analytics_args(child_sub.add_parser("analytics"))
+    events_args(child_sub.add_parser("events"))
+    events_args(child_sub.add_parser("events-publish"))
+    notify_args(child_sub.add_parser("notify"))
+    for name in ("stress-worker", "stress-check"):
+        sc = child_sub.add_parser(name)
+        sc.add_argument("--mode", choices=sorted(STRESS_MODES))
+        sc.add_argument("--tenants", type=int)
+        sc.add_argument("--ops", type=int)
+        sc.add_argument("--worker", type=int, default=0)
+        sc.add_argument("--start-at", type=float, default=0)
+
+    opts = p.parse_args(argv)
+    if opts.cmd == "_child":
+        result = {"webhook": _child_webhook, "stress-worker": _child_stress_worker,
+                  "stress-check": _child_stress_check, "codec": _child_codec,
+                  "leads": _child_leads, "search": _child_search,
+                  "pages": _child_pages, "csvimport": _child_csvimport,
+                  "export": _child_export, "analytics": _child_analytics,
+                  "events": _child_events, "events-publish": _child_events_publish,
+                  "notify": _child_notify}[opts.scenario](opts)
+        print(json.dumps(result))
+    elif opts.cmd == "webhook":
+        bench_webhook(opts)
+    elif opts.cmd == "stress":
+        return bench_stress(opts)
+    elif opts.cmd == "codec":
+        bench_codec(opts)
+    elif opts.cmd == "leads":
+        bench_leads(opts)
+    elif opts.cmd == "search":
+        bench_search(opts)
+    elif opts.cmd == "pages":
+        bench_pages(opts)
+    elif opts.cmd == "csvimport":
+        bench_csvimport(opts)
+    elif opts.cmd == "export":
+        bench_export(opts)
+    elif opts.cmd == "analytics":
+        bench_analytics(opts)
+    elif opts.cmd == "events":
+        bench_events(opts)
+    elif opts.cmd == "notify":
+        bench_notify(opts)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,6 @@
+import os, sys, tempfile
+
+# the app modules live at the repo root, not in a package
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# app_storage reads DATA_DIR at import: keep in-process tests off the real data
+os.environ["DATA_DIR"] = tempfile.mkdtemp(prefix="retainai-test-")
@@ -0,0 +1,41 @@
+# Lead search over the per-user term index (app_search), in-process against
+# the throwaway DATA_DIR set up by conftest.
+import itertools
+
+import pytest
+
+import app_search
+from app_storage import put_bucket, upsert_item
+
+_users = itertools.count()
+
+
+@pytest.fixture
+def user():
+    u = f"search{next(_users)}@example.com"
+    put_bucket("leads", u, [
+        {"id": "a", "name": "Maria Garcia", "phone": "416-555-1234"},
+        {"id": "b", "name": "Wei Chen", "whatsapp": "+1 (647) 201-9988"},
+    ])
+    return u
+
+
+def _ids(user, q):
+    return [ld["id"] for ld in app_search.search(user, q, limit=None)["leads"]]
+
+
+@pytest.mark.parametrize("q", ["416", "1234", "555", "5551", "555-12", "(555) 12"])
+def test_phone_digits_match_anywhere(user, q):
+    assert _ids(user, q) == ["a"]
+
+
+def test_middle_digits_follow_writes(user):
+    upsert_item("leads", user, {"id": "b", "name": "Wei Chen", "whatsapp": "+1 (647) 555-9988"})
+    assert sorted(_ids(user, "555")) == ["a", "b"]
+    upsert_item("leads", user, {"id": "a", "name": "Maria Garcia", "phone": "416-200-1234"})
+    assert _ids(user, "555") == ["b"]
+
+
+def test_other_digits_do_not_match(user):
+    assert _ids(user, "999") == []
+    assert _ids(user, "garcia") == ["a"]
@@ -0,0 +1,23 @@
+# Multi-process read-modify-write against one DATA_DIR: every worker process
+# appends its own leads to random tenants' buckets at the same time, then a
+# fresh process counts what landed. The same rounds as
+# `python storage_bench.py stress`, run small enough for the test suite.
+import argparse
+
+import pytest
+
+import storage_bench
+from app_storage import fcntl
+
+pytestmark = pytest.mark.skipif(fcntl is None, reason="bucket locks need fcntl")
+
+PROCS, OPS = 4, 60
+
+
+@pytest.mark.parametrize("tenants", [1, 4])
+@pytest.mark.parametrize("mode", ["locked", "optimistic"])
+def test_no_lost_updates(mode, tenants):
+    r = storage_bench._stress_round(argparse.Namespace(procs=PROCS, ops=OPS), mode, tenants)
+    assert r["lost"] == 0, f"{r['lost']} of {r['expected']} updates lost"
+    assert r["items"] == r["unique"] == PROCS * OPS
+    assert r["versions"] == PROCS * OPS  # one version bump per committed write